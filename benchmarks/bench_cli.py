@@ -0,0 +1,41 @@
+# Compares starting a process per queried value with answering all
+# queries from one `python -m cool_config query` process.
+#
+# Usage: python -m benchmarks.bench_cli [num_queries]
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+from benchmarks.generator import generate_config
+
+def main():
+    num_queries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        generated = generate_config(root_dir, depth=4, fan_out=4)
+        lookups = generated['lookups']
+        paths = (lookups['absolute'] + lookups['refs'] + lookups['list_index']) * num_queries
+        paths = [path.lstrip('/') for path in paths[:num_queries]]
+        command = [sys.executable, '-m', 'cool_config', 'query', generated['path']]
+
+        # A process per value, extrapolated from a few
+        num_processes = 10
+        start = time.perf_counter()
+        for path in paths[:num_processes]:
+            subprocess.run(command, input=path + '\n', capture_output=True, text=True, check=True)
+        per_process = (time.perf_counter() - start) / num_processes
+        print(f'process per query {per_process * 1e3:8.1f} ms per query ({per_process * num_queries:6.1f} s for {num_queries})')
+
+        start = time.perf_counter()
+        result = subprocess.run(command, input='\n'.join(paths) + '\n', capture_output=True, text=True, check=True)
+        elapsed = time.perf_counter() - start
+        assert len(result.stdout.splitlines()) == num_queries
+        print(f'one process       {elapsed * 1e3:8.1f} ms for {num_queries} queries')
+    finally:
+        shutil.rmtree(root_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# Compares the memory of a config with large numeric lists stored as
+# python lists and as compact arrays, see set_compact_lists.
+#
+# Usage: python -m benchmarks.bench_compact [list_size]
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+import yaml
+
+from cool_config import CoolConfig, clear_cache, set_compact_lists, compact_info
+
+def write_config(root_dir, list_size):
+    config = {
+        'schedule': [i * 1e-4 for i in range(list_size)],
+        'class_weights': [1.0 + (i % 7) * 0.25 for i in range(list_size)],
+        'steps': list(range(0, list_size * 10, 10)),
+        'lookup': '<ref>steps[-1]',
+    }
+    path = os.path.join(root_dir, 'config.yaml')
+    with open(path, 'w') as f:
+        yaml.dump(config, f, Dumper=yaml.CDumper if yaml.__with_libyaml__ else yaml.Dumper)
+    return path
+
+def main():
+    list_size = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        path = write_config(root_dir, list_size)
+        for compact in [False, True]:
+            set_compact_lists(compact)
+            clear_cache()
+            tracemalloc.start()
+            config = CoolConfig.parse_config_from_path(path)
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            for i in range(0, list_size, 7):
+                config[f'schedule[{i}]']
+            lookup_time = time.perf_counter() - start
+
+            print(
+                f'{"array" if compact else "list":6s} {current / 1e6:8.1f} MB, '
+                f'{lookup_time / (list_size // 7) * 1e6:.2f} us per indexed lookup, '
+                f'lookup = {config["lookup"]}'
+            )
+        print(f'reported by compact_info: {compact_info()["bytes_saved"] / 1e6:.1f} MB saved')
+    finally:
+        set_compact_lists(False)
+        shutil.rmtree(root_dir)
+        clear_cache()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Compares reading values with __getitem__, from a frozen config and
+# from the namespace of CoolConfig.compile.
+#
+# Usage: python -m benchmarks.bench_compile [depth]
+import sys
+import shutil
+import timeit
+import tempfile
+
+from cool_config import CoolConfig, clear_cache
+from cool_config.namespace import get_attribute_name
+from benchmarks.generator import generate_config
+
+def get_attribute_getter(path):
+    # cfg.node_0.node_1.int_param for '/node_0/node_1/int_param'
+    names = []
+    for segment in path.strip('/').split('/'):
+        key, _, list_index = segment.partition('[')
+        names.append(get_attribute_name(key) + (f'[{list_index}' if list_index else ''))
+    return eval('lambda cfg: cfg.' + '.'.join(names))
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        generated = generate_config(root_dir, depth=depth, fan_out=4)
+        config = CoolConfig.parse_config_from_path(generated['path'])
+        frozen = config.freeze()
+
+        number = 100000
+        start = timeit.default_timer()
+        compiled = config.compile()
+        print(f'compile {(timeit.default_timer() - start) * 1e3:8.2f} ms')
+
+        lookups = generated['lookups']
+        deepest = max(lookups['absolute'], key=lambda path: path.count('/'))
+        for name, path in [('deep', deepest), ('ref', lookups['refs'][0]), ('list', lookups['list_index'][0])]:
+            getter = get_attribute_getter(path)
+            assert getter(compiled) == config[path]
+            results = [
+                ('getitem', timeit.timeit(lambda: config[path], number=number)),
+                ('frozen', timeit.timeit(lambda: frozen[path], number=number)),
+                ('compiled', timeit.timeit(lambda: getter(compiled), number=number)),
+            ]
+            print(f'{name:5} {path}')
+            for kind, elapsed in results:
+                print(f'  {kind:9} {elapsed / number * 1e9:8.1f} ns')
+    finally:
+        shutil.rmtree(root_dir)
+        clear_cache()
+
+if __name__ == '__main__':
+    main()
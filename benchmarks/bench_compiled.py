@@ -0,0 +1,47 @@
+# Compares loading a config from yaml with loading its compiled
+# cache in N fresh worker processes.
+#
+# Usage: python -m benchmarks.bench_compiled [num_processes] [depth]
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+from cool_config import CoolConfig
+from cool_config.compiled import compile_config
+from benchmarks.generator import generate_config
+
+def load(args):
+    path, compiled = args
+    start = time.perf_counter()
+    if compiled:
+        CoolConfig.parse_config_from_path(path, compiled_cache=True)
+    else:
+        CoolConfig.parse_config_from_path(path)
+    return time.perf_counter() - start
+
+def main():
+    num_processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        generated = generate_config(root_dir, depth=depth, fan_out=4, num_imports=64)
+        path = generated['path']
+        compile_config(path)
+
+        # Fresh processes, so the yaml cache of this process is not used
+        context = multiprocessing.get_context('spawn')
+        for name, compiled in [('yaml', False), ('compiled', True)]:
+            with context.Pool(num_processes) as pool:
+                timings = pool.map(load, [(path, compiled)] * num_processes)
+            print(
+                f'{name:8s} mean {sum(timings) / len(timings) * 1e3:8.1f} ms '
+                f'max {max(timings) * 1e3:8.1f} ms over {num_processes} processes'
+            )
+    finally:
+        shutil.rmtree(root_dir)
+
+if __name__ == '__main__':
+    main()
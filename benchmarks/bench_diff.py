@@ -0,0 +1,49 @@
+# Diffs two large configs that differ in a single parameter and compares
+# it with comparing their asdict() outputs.
+#
+# Usage: python -m benchmarks.bench_diff [depth]
+import sys
+import time
+import shutil
+import tempfile
+
+from cool_config import CoolConfig, clear_cache
+from benchmarks.generator import generate_config
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        generated = generate_config(root_dir, depth=depth, fan_out=4)
+        old = CoolConfig.parse_config_from_path(generated['path'])
+        new = CoolConfig.parse_config_from_path(generated['path'])
+        path = generated['lookups']['absolute'][-1]
+        new[path] = 'changed'
+
+        start = time.perf_counter()
+        equal = old.asdict() == new.asdict()
+        print(f'asdict         {(time.perf_counter() - start) * 1e3:8.2f} ms (equal: {equal})')
+
+        for name in ['diff (cold)', 'diff (cached)']:
+            start = time.perf_counter()
+            diff = old.diff(new)
+            print(f'{name:14} {(time.perf_counter() - start) * 1e3:8.2f} ms ({len(diff.changed)} changed)')
+
+        new[path] = 'changed again'
+        start = time.perf_counter()
+        old.diff(new)
+        print(f'diff (write)   {(time.perf_counter() - start) * 1e3:8.2f} ms')
+
+        base = old.freeze()
+        for name in ['variant (cold)', 'variant']:
+            variant = base.variant({path: name})
+            start = time.perf_counter()
+            base.diff(variant)
+            print(f'{name:14} {(time.perf_counter() - start) * 1e3:8.2f} ms')
+    finally:
+        shutil.rmtree(root_dir)
+        clear_cache()
+
+if __name__ == '__main__':
+    main()
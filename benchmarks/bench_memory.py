@@ -0,0 +1,63 @@
+# Measures the memory used by a parsed synthetic config with tracemalloc.
+#
+# Usage: python benchmarks/bench_memory.py [num_layers] [num_imports]
+import os
+import sys
+import shutil
+import tempfile
+import tracemalloc
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from cool_config import CoolConfig, clear_cache
+
+def write_config(root_dir, num_layers, num_imports):
+    with open(os.path.join(root_dir, 'block.yaml'), 'w') as f:
+        yaml.dump({
+            'activation': 'relu',
+            'norm': {'type': 'layer_norm', 'eps': 1e-5},
+            'schedule': list(range(32)),
+        }, f)
+
+    config = {
+        'layers': {
+            f'layer_{i}': {
+                'dim': 512,
+                'dropout': 0.1,
+                'attention': {'heads': 8, 'dim': '<ref>../../../dim'},
+                'ffn': {'dim': 2048, 'activation': 'gelu'},
+            } for i in range(num_layers)
+        },
+        'dim': 512,
+    }
+    for i in range(num_imports):
+        config[f'block_{i}'] = '<import>block.yaml'
+
+    path = os.path.join(root_dir, 'config.yaml')
+    with open(path, 'w') as f:
+        yaml.dump(config, f)
+    return path
+
+def main():
+    num_layers = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_imports = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        path = write_config(root_dir, num_layers, num_imports)
+        # Read the files once so the measurement only contains the CoolConfig tree
+        CoolConfig.parse_config_from_path(path)
+
+        tracemalloc.start()
+        config = CoolConfig.parse_config_from_path(path)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f'{num_layers} layers, {num_imports} imports')
+        print(f'current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB')
+    finally:
+        shutil.rmtree(root_dir)
+        clear_cache()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Reads a multi-document yaml file of experiment configs, compares
+# splitting the file and parsing every document with iterating, skipping
+# and filtering with CoolConfig.iter_configs_from_path.
+#
+# Usage: python -m benchmarks.bench_multidoc [num_documents]
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import tracemalloc
+import yaml
+
+from cool_config import CoolConfig, clear_cache
+from cool_config.config import YamlLoader
+
+def generate_document(rng, i):
+    return {
+        'name': f'experiment_{i}',
+        'model': {
+            'size': rng.choice(['small', 'base', 'large']),
+            'layers': [{'dim': rng.randint(64, 1024), 'dropout': rng.random()} for _ in range(24)],
+        },
+        'optim': {'lr': rng.random(), 'betas': [0.9, 0.999], 'lr_ref': '<ref>../optim/lr'},
+        'data': {f'param_{j}': rng.random() for j in range(50)},
+    }
+
+def measure(name, fn):
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    # Memory is measured in a second run, tracemalloc slows it down
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:16} {elapsed * 1e3:9.1f} ms, peak {peak / 1e6:7.2f} MB, {count} configs')
+
+def main():
+    num_documents = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        rng = random.Random(0)
+        path = os.path.join(root_dir, 'experiments.yaml')
+        with open(path, 'w') as f:
+            yaml.dump_all((generate_document(rng, i) for i in range(num_documents)), f)
+        print(f'{num_documents} documents, {os.path.getsize(path) / 1e6:.1f} MB')
+
+        def split_and_parse():
+            # Splitting first, like before iter_configs_from_path
+            with open(path) as f:
+                documents = f.read().split('\n---\n')
+            count = 0
+            for document in documents:
+                CoolConfig.parse_config_from_dict(yaml.load(document, Loader=YamlLoader), root_dir)
+                count += 1
+            return count
+
+        def iterate():
+            return sum(1 for _ in CoolConfig.iter_configs_from_path(path))
+
+        def last():
+            return sum(1 for _ in CoolConfig.iter_configs_from_path(path, start=num_documents - 1))
+
+        def where():
+            return sum(1 for _ in CoolConfig.iter_configs_from_path(path, where={'name': f'experiment_{num_documents // 2}'}))
+
+        measure('split and parse', split_and_parse)
+        measure('iterate', iterate)
+        measure('last document', last)
+        measure('where name', where)
+    finally:
+        shutil.rmtree(root_dir)
+        clear_cache()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# Compares sequential loading of a config with many imports with
+# loading it through a thread pool, on a simulated slow filesystem.
+#
+# Usage: python -m benchmarks.bench_parallel [num_imports] [delay_ms] [workers]
+import sys
+import time
+import shutil
+import tempfile
+
+from cool_config import CoolConfig, set_cache_enabled
+from cool_config import config as config_module
+from benchmarks.generator import generate_config
+
+def with_delay(read_yaml, delay):
+    def read_yaml_slow(path):
+        # Latency of opening a file on a network filesystem
+        time.sleep(delay)
+        return read_yaml(path)
+    return read_yaml_slow
+
+def main():
+    num_imports = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay = float(sys.argv[2]) / 1e3 if len(sys.argv) > 2 else 0.01
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    root_dir = tempfile.mkdtemp()
+    read_yaml = config_module.read_yaml
+    try:
+        generated = generate_config(root_dir, depth=2, fan_out=4, num_imports=num_imports)
+        set_cache_enabled(False)
+        config_module.read_yaml = with_delay(read_yaml, delay)
+
+        results = {}
+        for name, pool_size in [('sequential', None), (f'{workers} workers', workers)]:
+            start = time.perf_counter()
+            config = CoolConfig.parse_config_from_path(generated['path'], workers=pool_size)
+            elapsed = time.perf_counter() - start
+            results[name] = config.hash()
+            print(f'{name:12s} {elapsed * 1e3:8.1f} ms for {num_imports} imports with {delay * 1e3:.0f} ms latency')
+        assert len(set(results.values())) == 1, 'results differ'
+    finally:
+        config_module.read_yaml = read_yaml
+        set_cache_enabled(True)
+        shutil.rmtree(root_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Compares parsing a config again with reloading a single changed
+# import in place.
+#
+# Usage: python -m benchmarks.bench_reload [depth] [num_imports]
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from cool_config import CoolConfig
+from benchmarks.generator import generate_config
+
+def touch(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    num_imports = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        generated = generate_config(root_dir, depth=depth, fan_out=4, num_imports=num_imports)
+        config = CoolConfig.parse_config_from_path(generated['path'])
+        watcher = config.watch()
+
+        import_path = os.path.join(root_dir, 'import_0.yaml')
+        with open(import_path) as f:
+            content = f.read()
+
+        start = time.perf_counter()
+        CoolConfig.parse_config_from_path(generated['path'])
+        print(f'parse          {(time.perf_counter() - start) * 1e3:8.2f} ms')
+
+        start = time.perf_counter()
+        watcher.check()
+        print(f'check          {(time.perf_counter() - start) * 1e3:8.2f} ms (nothing changed)')
+
+        for i in range(3):
+            touch(import_path, content + f'\nreload_param: {i}\n')
+            start = time.perf_counter()
+            changed = watcher.check()
+            print(f'reload         {(time.perf_counter() - start) * 1e3:8.2f} ms ({len(changed)} changed paths)')
+    finally:
+        shutil.rmtree(root_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Creates a grid of config variants with copy-on-write sharing and
+# compares it with parsing a full config for every variant.
+#
+# Usage: python -m benchmarks.bench_sweep [num_values_per_path]
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+
+from cool_config import CoolConfig, clear_cache
+from benchmarks.generator import generate_config
+
+def main():
+    num_values = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        generated = generate_config(root_dir, depth=4, fan_out=4, ref_density=0.3)
+        base = CoolConfig.parse_config_from_path(generated['path']).freeze()
+        paths = generated['lookups']['absolute']
+        grid = {
+            paths[0].lstrip('/'): list(range(num_values)),
+            paths[-1].lstrip('/'): [i * 0.1 for i in range(num_values)],
+        }
+        num_variants = num_values ** 2
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        variants = list(base.sweep(grid))
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f'sweep   {num_variants} variants in {elapsed * 1e3:8.1f} ms, '
+            f'{current / num_variants / 1e3:6.2f} kB per variant'
+        )
+
+        start = time.perf_counter()
+        for variant in variants:
+            for path in generated['lookups']['refs'][:10]:
+                variant[path]
+        elapsed = time.perf_counter() - start
+        print(f'reading 10 refs of every variant in {elapsed * 1e3:8.1f} ms')
+
+        # A full tree per variant, like parse_config_from_args with overrides
+        num_full = min(100, num_variants)
+        args = [
+            {'config': generated['path'], **{path: values[i % num_values] for path, values in grid.items()}}
+            for i in range(num_full)
+        ]
+        tracemalloc.start()
+        start = time.perf_counter()
+        full = []
+        for variant_args in args:
+            config = CoolConfig.parse_config_from_path(generated['path'])
+            for path, value in variant_args.items():
+                if path != 'config':
+                    config[path] = value
+            full.append(config)
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f'full    {num_full} variants in {elapsed * 1e3:8.1f} ms '
+            f'({elapsed / num_full * num_variants:6.1f} s for {num_variants}), '
+            f'{current / num_full / 1e3:6.2f} kB per variant'
+        )
+    finally:
+        shutil.rmtree(root_dir)
+        clear_cache()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Reads a config concurrently from a thread pool and compares
+# the throughput of a frozen snapshot with the mutable config.
+#
+# Usage: python -m benchmarks.bench_threads [num_threads] [lookups_per_thread]
+import sys
+import time
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from cool_config import CoolConfig
+from benchmarks.generator import generate_config
+
+def read_all(config, paths, expected, num_lookups):
+    for i in range(num_lookups):
+        path = paths[i % len(paths)]
+        assert config[path] == expected[path], path
+
+def measure(config, paths, expected, num_threads, num_lookups):
+    with ThreadPoolExecutor(max_workers=num_threads) as pool:
+        start = time.perf_counter()
+        futures = [
+            pool.submit(read_all, config, paths, expected, num_lookups)
+            for _ in range(num_threads)
+        ]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+    return num_threads * num_lookups / elapsed
+
+def main():
+    num_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    num_lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        generated = generate_config(root_dir, depth=4, fan_out=4, ref_density=0.5)
+        config = CoolConfig.parse_config_from_path(generated['path'])
+        lookups = generated['lookups']
+        paths = lookups['absolute'] + lookups['list_index'] + lookups['refs'] + lookups['ref_chains']
+        expected = {path: config[path] for path in paths}
+
+        frozen = config.freeze()
+        for name, tree in [('mutable', config), ('frozen', frozen)]:
+            throughput = measure(tree, paths, expected, num_threads, num_lookups)
+            print(f'{name:8s} {throughput:12.0f} lookups/s with {num_threads} threads')
+    finally:
+        shutil.rmtree(root_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# Compares the pure python and the libyaml backend
+# for loading and dumping a multi-megabyte config.
+#
+# Usage: python benchmarks/bench_yaml_backend.py [num_blocks]
+import io
+import sys
+import time
+import yaml
+
+def generate_config(num_blocks):
+    config = {}
+    for i in range(num_blocks):
+        config[f'block_{i}'] = {
+            'name': f'block_{i}',
+            'dim': 256 + i,
+            'dropout': 0.1,
+            'use_bias': i % 2 == 0,
+            'schedule': list(range(20)),
+            'ref': f'<ref>../block_{max(i - 1, 0)}/dim',
+            'nested': {'a': i, 'b': [{'x': 1.5, 'y': 'text'}, {'x': 2.5, 'y': None}]},
+        }
+    return config
+
+def timed(fn):
+    start = time.perf_counter()
+    res = fn()
+    return res, time.perf_counter() - start
+
+def main():
+    num_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    config = generate_config(num_blocks)
+    text = yaml.dump(config, Dumper=yaml.Dumper)
+    print(f'Config size: {len(text) / 1e6:.1f} MB, libyaml available: {yaml.__with_libyaml__}')
+
+    backends = [('python', yaml.SafeLoader, yaml.Dumper)]
+    if yaml.__with_libyaml__:
+        backends.append(('libyaml', yaml.CSafeLoader, yaml.CDumper))
+
+    results = {}
+    for name, loader, dumper in backends:
+        loaded, load_time = timed(lambda: yaml.load(text, Loader=loader))
+        dumped, dump_time = timed(lambda: yaml.dump(loaded, io.StringIO(), Dumper=dumper))
+        results[name] = loaded
+        print(f'{name:8s} load {load_time:7.2f}s dump {dump_time:7.2f}s')
+
+    if len(results) == 2:
+        assert results['python'] == results['libyaml'], 'Backends produced different results!'
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import os
+import random
+import yaml
+
+def generate_config(
+    root_dir,
+    depth=3,
+    fan_out=4,
+    list_size=8,
+    ref_density=0.2,
+    ref_chain_length=3,
+    num_imports=4,
+    seed=0,
+):
+    # Writes a synthetic config to root_dir and returns a dict with the
+    # path of the root file and sample lookups for the benchmarks:
+    #   absolute:   absolute paths of plain params
+    #   relative:   (config path, path relative to it) pairs
+    #   parent:     (config path, path starting with '../') pairs
+    #   list_index: paths that end with a list index
+    #   refs:       paths of params that are references
+    #   ref_chains: paths of the last reference of every chain
+    rng = random.Random(seed)
+    lookups = {
+        'absolute': [],
+        'relative': [],
+        'parent': [],
+        'list_index': [],
+        'refs': [],
+        'ref_chains': [],
+    }
+
+    config = _generate_node(rng, '', depth, fan_out, list_size, lookups)
+    leaves = list(lookups['absolute'])
+
+    # References are added after the tree so that they can point anywhere
+    _add_refs(rng, config, '', ref_density, leaves, lookups)
+
+    chains = {}
+    for i in range(max(1, fan_out)):
+        target = rng.choice(leaves)
+        chains[f'chain_{i}_0'] = f'<ref>{target}'
+        for j in range(1, ref_chain_length):
+            chains[f'chain_{i}_{j}'] = f'<ref>chain_{i}_{j - 1}'
+        lookups['ref_chains'].append(f'/chains/chain_{i}_{max(ref_chain_length - 1, 0)}')
+    if ref_chain_length > 0:
+        config['chains'] = chains
+
+    imports = {}
+    for i in range(num_imports):
+        name = f'import_{i}.yaml'
+        imported = _generate_node(rng, f'/imports/import_{i}', 2, 2, list_size, None)
+        imported['param_from_parent'] = '<ref>../../node_0/int_param' if depth > 0 else '<ref>/int_param'
+        _write_yaml(os.path.join(root_dir, name), imported)
+        imports[f'import_{i}'] = f'<import>{name}'
+    if imports:
+        config['imports'] = imports
+
+    path = os.path.join(root_dir, 'config.yaml')
+    _write_yaml(path, config)
+    return {'path': path, 'lookups': lookups}
+
+def _generate_node(rng, path, depth, fan_out, list_size, lookups):
+    node = {
+        'int_param': rng.randint(0, 1000),
+        'float_param': rng.random(),
+        'str_param': f'value_{rng.randint(0, 1000)}',
+        'list_param': [rng.randint(0, 100) for _ in range(list_size)],
+    }
+    if lookups is not None:
+        lookups['absolute'].append(f'{path}/int_param')
+        lookups['absolute'].append(f'{path}/str_param')
+        if list_size > 0:
+            lookups['list_index'].append(f'{path}/list_param[{rng.randrange(list_size)}]')
+        if path:
+            lookups['relative'].append((path, 'float_param'))
+            lookups['parent'].append((path, '../int_param'))
+
+    if depth > 0:
+        for i in range(fan_out):
+            node[f'node_{i}'] = _generate_node(
+                rng, f'{path}/node_{i}', depth - 1, fan_out, list_size, lookups
+            )
+    return node
+
+def _add_refs(rng, node, path, ref_density, leaves, lookups):
+    for key, item in list(node.items()):
+        if isinstance(item, dict):
+            _add_refs(rng, item, f'{path}/{key}', ref_density, leaves, lookups)
+    if rng.random() < ref_density:
+        node['ref_param'] = f'<ref>{rng.choice(leaves)}'
+        lookups['refs'].append(f'{path}/ref_param')
+
+def _write_yaml(path, config):
+    with open(path, 'w') as f:
+        yaml.dump(config, f)
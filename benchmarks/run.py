@@ -0,0 +1,166 @@
+# Runs timed scenarios on a synthetic config and writes the
+# results as json, so they can be compared between releases.
+#
+# Usage: python -m benchmarks.run [--depth 4] [--output results.json]
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+import contextlib
+import yaml
+
+from cool_config import CoolConfig, clear_cache, get_yaml_backend
+from benchmarks.generator import generate_config
+
+def measure(fn, setup=None, repeat=5, number=1):
+    # Returns the seconds per call of fn. If given, setup is called
+    # before every repetition and its result is passed to fn.
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(arg)
+        timings.append((time.perf_counter() - start) / number)
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'repeat': repeat,
+        'number': number,
+    }
+
+def lookup_all(config, paths):
+    for path in paths:
+        config[path]
+
+def lookup_all_from(config, pairs):
+    for sub_config, path in pairs:
+        sub_config[path]
+
+def get_scenarios(generated, output_dir):
+    path = generated['path']
+    lookups = generated['lookups']
+
+    def fresh_config():
+        return CoolConfig.parse_config_from_path(path)
+
+    def parse(_):
+        return fresh_config()
+
+    def parse_cold(_):
+        clear_cache()
+        return CoolConfig.parse_config_from_path(path)
+
+    def parse_from_args(_):
+        return CoolConfig.parse_config_from_args({'config': path, 'cli_param': 1})
+
+    config = fresh_config()
+
+    def relative_pairs(pairs):
+        return [(config[base] if base != '/' else config, rel) for base, rel in pairs]
+
+    relative = relative_pairs(lookups['relative'])
+    parent = relative_pairs(lookups['parent'])
+
+    # Everything below the first node, read in one batch
+    batch = [p for p in lookups['absolute'] + lookups['refs'] if p.startswith('/node_0/')]
+
+    def print_config(c):
+        with contextlib.redirect_stdout(io.StringIO()):
+            c.print()
+
+    def set_all(c):
+        for i, p in enumerate(lookups['absolute']):
+            c[p.lstrip('/')] = i
+
+    return {
+        'parse_config_from_path': (parse, None, len(lookups['absolute'])),
+        'parse_config_from_path_cold': (parse_cold, None, len(lookups['absolute'])),
+        'parse_config_from_args': (parse_from_args, None, len(lookups['absolute'])),
+        'getitem_absolute': (lambda _: lookup_all(config, lookups['absolute']), None, len(lookups['absolute'])),
+        'getitem_relative': (lambda _: lookup_all_from(config, relative), None, len(relative)),
+        'getitem_parent': (lambda _: lookup_all_from(config, parent), None, len(parent)),
+        'getitem_list_index': (lambda _: lookup_all(config, lookups['list_index']), None, len(lookups['list_index'])),
+        'getitem_ref': (lambda _: lookup_all(config, lookups['refs']), None, len(lookups['refs'])),
+        'getitem_ref_chain': (lambda _: lookup_all(config, lookups['ref_chains']), None, len(lookups['ref_chains'])),
+        'getitem_batch': (lambda _: lookup_all(config, batch), None, len(batch)),
+        'get_many_batch': (lambda _: config.get_many(batch), None, len(batch)),
+        'setitem': (set_all, fresh_config, len(lookups['absolute'])),
+        'ref_graph': (lambda c: c.ref_graph(), fresh_config, len(lookups['refs']) + len(lookups['ref_chains'])),
+        'asdict': (lambda c: c.asdict(), fresh_config, 1),
+        'hash': (lambda c: c.hash(), fresh_config, 1),
+        'hash_cached': (lambda _: config.hash(), None, 1),
+        'dump_to_file': (lambda c: c.dump_to_file(os.path.join(output_dir, 'dump.yaml')), fresh_config, 1),
+        'print': (print_config, fresh_config, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--fan-out', type=int, default=4)
+    parser.add_argument('--list-size', type=int, default=16)
+    parser.add_argument('--ref-density', type=float, default=0.3)
+    parser.add_argument('--ref-chain-length', type=int, default=4)
+    parser.add_argument('--num-imports', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scenarios', nargs='*', default=None,
+                        help='Only run these scenarios')
+    parser.add_argument('--output', default=None,
+                        help='Write the results to this file instead of stdout')
+    args = parser.parse_args()
+
+    params = {
+        'depth': args.depth,
+        'fan_out': args.fan_out,
+        'list_size': args.list_size,
+        'ref_density': args.ref_density,
+        'ref_chain_length': args.ref_chain_length,
+        'num_imports': args.num_imports,
+        'seed': args.seed,
+    }
+
+    root_dir = tempfile.mkdtemp()
+    try:
+        generated = generate_config(root_dir, **params)
+        scenarios = get_scenarios(generated, root_dir)
+
+        results = {}
+        for name, (fn, setup, ops) in scenarios.items():
+            if args.scenarios and name not in args.scenarios:
+                continue
+            result = measure(fn, setup=setup, repeat=args.repeat)
+            result['ops'] = ops
+            results[name] = result
+            print(f'{name:30s} {result["median"] * 1e3:10.3f} ms', file=sys.stderr)
+    finally:
+        shutil.rmtree(root_dir)
+        clear_cache()
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'pyyaml': yaml.__version__,
+            'yaml_backend': get_yaml_backend(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'params': params,
+        'results': results,
+    }
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
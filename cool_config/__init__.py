@@ -1 +1,20 @@
-from cool_config.config import CoolConfig
\ No newline at end of file
+# The exports are imported on first access, so that `python -m cool_config`
+# and other users of submodules do not import config and yaml up front.
+__all__ = [
+    'CoolConfig',
+    'clear_cache',
+    'cache_info',
+    'set_cache_enabled',
+    'get_yaml_backend',
+    'set_compact_lists',
+    'compact_info',
+]
+
+def __getattr__(name):
+    if name in __all__:
+        from cool_config import config
+        return getattr(config, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,140 @@
+# Command line interface
+#
+#   python -m cool_config query config.yaml < paths
+#   python -m cool_config dump config.yaml [--format yaml|json] [--raw]
+#   python -m cool_config hash config.yaml [--exclude key ...]
+#   python -m cool_config print config.yaml [path ...] [--max-depth N]
+#   python -m cool_config diff old.yaml new.yaml [--json]
+#
+# query loads the config once and answers one path per line of stdin
+# with one json line on stdout, so scripts do not have to start a new
+# process for every value. A line is either a path like in __getitem__
+# or a json object {"path": ..., "default": ..., "from": ...}: default
+# is returned if the path does not exist and from is the path of the
+# config the lookup starts at, for paths starting with '../'.
+#
+# Modules are imported by the commands that need them, so that the
+# interpreter starts quickly.
+import sys
+import argparse
+
+def load(path, args):
+    from cool_config.config import CoolConfig
+    return CoolConfig.parse_config_from_path(
+        path, lazy=args.lazy, compiled_cache=True if args.compiled_cache else None
+    )
+
+def to_json_value(item):
+    from cool_config.config import CoolConfig, SEQUENCE_TYPES
+    if isinstance(item, CoolConfig):
+        return item.asdict()
+    if isinstance(item, SEQUENCE_TYPES):
+        return [to_json_value(item_item) for item_item in item]
+    return item
+
+def answer_query(config, line):
+    # Returns the json object answering one line of the query command
+    import json
+    if line.startswith('{'):
+        try:
+            query = json.loads(line)
+            path = query['path']
+        except (ValueError, KeyError, TypeError):
+            return {'query': line, 'error': 'Invalid query, expected {"path": ...}'}
+    else:
+        query = {'path': line}
+        path = line
+
+    try:
+        base = config
+        if query.get('from') not in (None, '', '/'):
+            base = config[query['from']]
+        if 'default' in query:
+            value = base[path, query['default']]
+        else:
+            value = base[path]
+        return {'path': path, 'value': to_json_value(value)}
+    except Exception as e:
+        return {'path': path, 'error': str(e)}
+
+def run_query(args):
+    import json
+    config = load(args.config, args)
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        sys.stdout.write(json.dumps(answer_query(config, line), default=str) + '\n')
+        # Answer every line right away, the caller may wait for it
+        sys.stdout.flush()
+    return 0
+
+def run_dump(args):
+    config = load(args.config, args)
+    config.dump_to_stream(
+        sys.stdout, exclude=args.exclude, resolve_refs=not args.raw, format=args.format
+    )
+    if args.format == 'json':
+        sys.stdout.write('\n')
+    return 0
+
+def run_hash(args):
+    sys.stdout.write(load(args.config, args).hash(exclude=args.exclude) + '\n')
+    return 0
+
+def run_print(args):
+    load(args.config, args).print(
+        max_depth=args.max_depth, paths=args.paths or None, resolve_refs=args.resolve_refs
+    )
+    return 0
+
+def run_diff(args):
+    diff = load(args.old, args).diff(load(args.new, args))
+    if args.json:
+        import json
+        json.dump(diff.asdict(), sys.stdout, indent=2, default=str)
+        sys.stdout.write('\n')
+    else:
+        for line in diff.iter_lines():
+            sys.stdout.write(line + '\n')
+    # Like diff, 1 if the configs differ
+    return 0 if diff.is_empty() else 1
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='python -m cool_config')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name, run, help, configs=('config',)):
+        command = commands.add_parser(name, help=help)
+        for config in configs:
+            command.add_argument(config)
+        command.add_argument('--lazy', action='store_true', help='only load imports that are accessed')
+        command.add_argument('--compiled-cache', action='store_true', help='use a compiled cache file next to the config')
+        command.set_defaults(run=run)
+        return command
+
+    add_command('query', run_query, 'answer path queries read from stdin with json lines')
+
+    dump_command = add_command('dump', run_dump, 'write the config as yaml or json')
+    dump_command.add_argument('--format', choices=['yaml', 'json'], default='yaml')
+    dump_command.add_argument('--raw', action='store_true', help='write references as they are written')
+    dump_command.add_argument('--exclude', nargs='*', default=[], help='keys that are left out')
+
+    hash_command = add_command('hash', run_hash, 'write the hash of the config')
+    hash_command.add_argument('--exclude', nargs='*', default=[], help='keys that are left out')
+
+    print_command = add_command('print', run_print, 'print the config')
+    print_command.add_argument('paths', nargs='*', help='only print these subtrees')
+    print_command.add_argument('--max-depth', type=int, default=None)
+    print_command.add_argument('--resolve-refs', action='store_true', help='show referenced values')
+
+    diff_command = add_command('diff', run_diff, 'show the parameters that differ between two configs', configs=('old', 'new'))
+    diff_command.add_argument('--json', action='store_true', help='write the diff as json')
+    return parser
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    return args.run(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
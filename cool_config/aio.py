@@ -0,0 +1,93 @@
+# asyncio loading
+#
+# Files are read and parsed in the default executor of the running loop,
+# so the event loop is never blocked by the filesystem. Imports are
+# fetched concurrently as soon as the file importing them has been
+# parsed, the tree is then built in the original order exactly like
+# CoolConfig.parse_config_from_path does. Cancelling a load cancels all
+# pending reads; reads that already started in a thread finish in the
+# background and only fill the yaml cache.
+import asyncio
+
+from cool_config.config import (
+    CoolConfig,
+    read_yaml,
+    read_yaml_cached,
+    find_imports,
+    get_import_path,
+    get_root_dir,
+    merge_args,
+    use_prefetched,
+)
+
+async def aread_yaml(path):
+    return await asyncio.to_thread(read_yaml, path)
+
+async def aprefetch_imports(config_dict, root_dir, limit=None):
+    # Async counterpart of cool_config.config.prefetch_imports.
+    # limit bounds the number of files that are read at the same time.
+    prefetched = {}
+    seen = set()
+    semaphore = asyncio.Semaphore(limit) if limit is not None else None
+
+    async def fetch(path):
+        try:
+            if semaphore is None:
+                config_dict = await asyncio.to_thread(read_yaml_cached, path)
+            else:
+                async with semaphore:
+                    config_dict = await asyncio.to_thread(read_yaml_cached, path)
+        except Exception:
+            # Building the config raises the error again
+            return
+        prefetched[path] = config_dict
+        if config_dict is not None:
+            submit(config_dict)
+
+    async with asyncio.TaskGroup() as group:
+        def submit(config_dict):
+            for import_path in find_imports(config_dict):
+                path = get_import_path(root_dir, import_path)
+                if path not in seen:
+                    seen.add(path)
+                    group.create_task(fetch(path))
+
+        submit(config_dict)
+    return prefetched
+
+def build_config(config_dict, root_dir, source_path, lazy, index, prefetched, source_args=None):
+    with use_prefetched(prefetched):
+        config = CoolConfig('/', config_dict, None, root_dir, lazy=lazy)
+    config.source_path = source_path
+    config.source_args = source_args
+    if index:
+        config.build_index()
+    return config
+
+async def aload_config(config_dict, path, lazy=False, index=False, limit=None, args=None):
+    root_dir = get_root_dir(path)
+    prefetched = {}
+    if not lazy:
+        prefetched = await aprefetch_imports(config_dict, root_dir, limit)
+    # Building a large tree takes a while, keep it off the loop as well
+    return await asyncio.to_thread(
+        build_config, config_dict, root_dir, path, lazy, index, prefetched, args
+    )
+
+async def aparse_config_from_path(path, lazy=False, index=False, limit=None):
+    config_dict = await asyncio.to_thread(read_yaml_cached, path)
+
+    assert config_dict is not None, 'Provided config seems to be empty'
+
+    return await aload_config(config_dict, path, lazy=lazy, index=index, limit=limit)
+
+async def aparse_config_from_args(args, path=None, lazy=False, index=False, limit=None):
+    if path is None:
+        path = args['config']
+
+    config_dict = await asyncio.to_thread(read_yaml_cached, path)
+
+    assert config_dict is not None, 'Provided config seems to be empty'
+
+    config_dict = merge_args(config_dict, args)
+    return await aload_config(config_dict, path, lazy=lazy, index=index, limit=limit, args=dict(args))
@@ -0,0 +1,206 @@
+# Compiled config cache
+#
+# A compiled cache file stores a fully parsed config tree (references
+# are kept as they are written) together with a manifest of all yaml
+# files it was parsed from. The tree is stored as json, so reading a
+# cache file can never run code, unlike a pickle. Values json has no
+# type for, like tuples, arrays, dates or dicts with keys that are not
+# strings, are written as {TAG: [type, ...]}. Imported configs are
+# tagged as well, to restore the file they were read from.
+#
+# Layout: MAGIC, 8 byte big endian manifest length, json manifest, json tree
+#
+# The cache is only an optimization: a cache file that can not be read,
+# was written by another format version or is out of date is parsed
+# again, and failing to write it (e.g. in a read only directory or for
+# values that can not be stored) only issues a warning.
+import os
+import json
+import array
+import base64
+import datetime
+import warnings
+import tempfile
+
+from cool_config.config import CoolConfig, SEQUENCE_TYPES
+
+MAGIC = b'COOLCFG\x02'
+# Stored in the manifest, increase it whenever the format of the tree
+# changes so that older cache files are compiled again
+CACHE_VERSION = 4
+CACHE_SUFFIX = '.ccache'
+TAG = '__cool_config__'
+
+class ImportedDict(dict):
+    # Content of an imported config while reading a cache file
+    __slots__ = ('source_path',)
+
+def get_cache_path(path):
+    return path + CACHE_SUFFIX
+
+def get_file_state(path):
+    stat = os.stat(path)
+    return [os.path.realpath(path), stat.st_mtime_ns, stat.st_size]
+
+def compile_config(path, cache_path=None):
+    # Parses the config at path and writes the compiled cache file
+    if cache_path is None:
+        cache_path = get_cache_path(path)
+    config = CoolConfig.parse_config_from_path(path)
+    write_compiled(config, cache_path)
+    return config
+
+def encode_item(item):
+    # Turns an item of a config into json values, raises a TypeError
+    # for values that can not be stored
+    if item is None or isinstance(item, (str, bool, int, float)):
+        return item
+    if isinstance(item, CoolConfig):
+        encoded = encode_dict(item.config)
+        if item.source_path is not None:
+            return {TAG: ['import', item.source_path, encoded]}
+        return encoded
+    if isinstance(item, array.array):
+        return {TAG: ['array', item.typecode, item.tolist()]}
+    if isinstance(item, list):
+        return [encode_item(item_item) for item_item in item]
+    if isinstance(item, dict):
+        # Raw dicts can be set by update
+        return encode_dict(item)
+    if isinstance(item, tuple):
+        return {TAG: ['tuple', [encode_item(item_item) for item_item in item]]}
+    if isinstance(item, (set, frozenset)):
+        return {TAG: ['set', [encode_item(item_item) for item_item in item]]}
+    if isinstance(item, datetime.datetime):
+        return {TAG: ['datetime', item.isoformat()]}
+    if isinstance(item, datetime.date):
+        return {TAG: ['date', item.isoformat()]}
+    if isinstance(item, bytes):
+        return {TAG: ['bytes', base64.b64encode(item).decode('ascii')]}
+    raise TypeError(f'Can not store values of type {type(item).__name__}!')
+
+def encode_dict(item):
+    if TAG not in item and all(type(key) is str for key in item):
+        return {key: encode_item(item_item) for key, item_item in item.items()}
+    return {TAG: ['dict', [[encode_item(key), encode_item(item_item)] for key, item_item in item.items()]]}
+
+def decode_object(item):
+    # object_hook of json.loads, objects are decoded inside out
+    if TAG not in item:
+        return item
+    kind, *values = item[TAG]
+    if kind == 'import':
+        decoded = ImportedDict(values[1])
+        decoded.source_path = values[0]
+        return decoded
+    if kind == 'dict':
+        return dict(values[0])
+    if kind == 'array':
+        return array.array(values[0], values[1])
+    if kind == 'tuple':
+        return tuple(values[0])
+    if kind == 'set':
+        return set(values[0])
+    if kind == 'datetime':
+        return datetime.datetime.fromisoformat(values[0])
+    if kind == 'date':
+        return datetime.date.fromisoformat(values[0])
+    if kind == 'bytes':
+        return base64.b64decode(values[0])
+    raise ValueError(f'Unknown tag "{kind}"!')
+
+def write_compiled(config, cache_path):
+    config = config.get_root_config()
+    # Lazy imports are loaded before writing
+    config.asdict(resolve_refs=False)
+
+    manifest = json.dumps({
+        'version': CACHE_VERSION,
+        'root': [config.source_path, config.root_dir],
+        'sources': [get_file_state(source) for source in config.source_files()],
+    }).encode('utf-8')
+    payload = json.dumps(encode_dict(config.config), separators=(',', ':')).encode('utf-8')
+
+    # Write atomically so concurrent readers never see partial files
+    cache_dir = os.path.dirname(os.path.abspath(cache_path))
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(manifest).to_bytes(8, 'big'))
+            f.write(manifest)
+            f.write(payload)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def load_compiled(cache_path):
+    # Returns the config stored in the cache file or None if the
+    # file does not exist, is invalid or any source file changed.
+    try:
+        return read_compiled(cache_path)
+    except Exception:
+        # Truncated or corrupt files, unreadable files, ...
+        return None
+
+def read_compiled(cache_path):
+    try:
+        with open(cache_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    if data[:len(MAGIC)] != MAGIC:
+        return None
+    offset = len(MAGIC)
+    manifest_length = int.from_bytes(data[offset:offset + 8], 'big')
+    offset += 8
+    manifest = json.loads(data[offset:offset + manifest_length])
+    offset += manifest_length
+    if manifest.get('version') != CACHE_VERSION:
+        return None
+
+    for source in manifest['sources']:
+        try:
+            if get_file_state(source[0]) != source:
+                return None
+        except FileNotFoundError:
+            return None
+
+    config_dict = json.loads(data[offset:], object_hook=decode_object)
+    source_path, root_dir = manifest['root']
+    config = CoolConfig('/', config_dict, None, root_dir)
+    config.source_path = source_path
+    restore_source_paths(config, config_dict)
+    return config
+
+def restore_source_paths(config, config_dict):
+    # Walks the config along the dicts it was built from
+    stack = [(config, config_dict)]
+    while stack:
+        item, value = stack.pop()
+        if isinstance(value, dict):
+            if isinstance(value, ImportedDict):
+                item.source_path = value.source_path
+            for key, value_item in value.items():
+                if isinstance(value_item, (dict, list)):
+                    stack.append((item.config[key], value_item))
+        elif isinstance(item, SEQUENCE_TYPES):
+            stack.extend(
+                (item_item, value_item)
+                for item_item, value_item in zip(item, value)
+                if isinstance(value_item, (dict, list))
+            )
+
+def load_or_compile(path, cache_path=None):
+    if cache_path is None:
+        cache_path = get_cache_path(path)
+    config = load_compiled(cache_path)
+    if config is None:
+        config = CoolConfig.parse_config_from_path(path)
+        try:
+            write_compiled(config, cache_path)
+        except Exception as e:
+            warnings.warn(f'Could not write the compiled cache "{cache_path}": {e}', RuntimeWarning)
+    return config
@@ -1,7 +1,67 @@
 
 import os
+import sys
+import json
+import array
+import hashlib
+import operator
+import functools
+import itertools
+import contextlib
+import contextvars
 import yaml
 
+# Use the libyaml bindings if PyYAML was built with them.
+# Both backends produce the same results.
+if yaml.__with_libyaml__:
+    YamlLoader = yaml.CSafeLoader
+    YamlDumper = yaml.CDumper
+    YAML_BACKEND = 'libyaml'
+else:
+    YamlLoader = yaml.SafeLoader
+    YamlDumper = yaml.Dumper
+    YAML_BACKEND = 'python'
+
+# Maximum number of compiled paths kept by compile_path
+PATH_CACHE_SIZE = 4096
+# Maximum number of path tries kept by compile_trie
+TRIE_CACHE_SIZE = 64
+# Number of lines CoolConfig.print writes at once
+PRINT_BUFFER_LINES = 1024
+
+# Token kinds produced by compile_path
+PARENT_TOKEN = 0
+ROOT_TOKEN = 1
+KEY_TOKEN = 2
+
+# Events produced by CoolConfig.iter_events
+MAPPING_START_EVENT = 0
+SEQUENCE_START_EVENT = 1
+END_EVENT = 2
+KEY_EVENT = 3
+VALUE_EVENT = 4
+
+# Process wide cache of parsed yaml files. Maps the realpath of a file to
+# a tuple of (mtime, size, parsed config). Set the environment variable
+# COOL_CONFIG_NO_CACHE or call set_cache_enabled(False) to opt out.
+_yaml_cache = {}
+_yaml_cache_stats = {'hits': 0, 'misses': 0}
+_yaml_cache_enabled = not os.environ.get('COOL_CONFIG_NO_CACHE')
+
+# Plain lists of only ints or only floats with at least min_size items
+# are stored as array.array if enabled, see set_compact_lists.
+COMPACT_LIST_MIN_SIZE = 1024
+_compact_lists = {'enabled': False, 'min_size': COMPACT_LIST_MIN_SIZE}
+_compact_stats = {'lists': 0, 'items': 0, 'bytes_saved': 0}
+COMPACT_TYPECODES = {int: 'q', float: 'd'}
+
+# Types that are stored as lists in a config
+SEQUENCE_TYPES = (list, array.array)
+
+# Imported yaml files that were read ahead of building a config,
+# see prefetched_imports. Maps import paths to parsed configs.
+_prefetched_yaml = contextvars.ContextVar('prefetched_yaml', default=None)
+
 def remove_from_start(to_remove, base):
     if base.startswith(to_remove):
         return base[len(to_remove):]
@@ -15,55 +75,643 @@ def remove_from_end(to_remove, base):
 def get_root_dir(path):
     return '/'.join(path.split('/')[:-1])
 
+@functools.lru_cache(maxsize=PATH_CACHE_SIZE)
+def compile_path(path):
+    # Turns a path like '../a/b[2]/c' into a tuple of
+    # (kind, key, list_index) tokens. Parent hops and root anchors
+    # are only recognized if they are not the last segment,
+    # the last segment is always a key lookup.
+    segments = path.split('/')
+    last = len(segments) - 1
+    tokens = []
+    for i, segment in enumerate(segments):
+        if i < last and segment == '..':
+            tokens.append((PARENT_TOKEN, None, None))
+        elif i < last and segment == '':
+            tokens.append((ROOT_TOKEN, None, None))
+        else:
+            list_index = None
+            if segment.endswith(']'):
+                list_index = int(segment.split('[')[-1].replace(']', ''))
+                segment = segment.split('[')[0]
+            tokens.append((KEY_TOKEN, segment, list_index))
+    return tuple(tokens)
+
+@functools.lru_cache(maxsize=TRIE_CACHE_SIZE)
+def compile_trie(paths):
+    # Groups compiled paths in a trie for CoolConfig.get_many.
+    # Nodes are tuples of (children, positions), children maps path
+    # tokens to nodes and positions lists the paths ending at the node.
+    trie = ({}, [])
+    for i, path in enumerate(paths):
+        node = trie
+        for token in compile_path(path):
+            node = node[0].setdefault(token, ({}, []))
+        node[1].append(i)
+    return trie
+
+@functools.lru_cache(maxsize=PATH_CACHE_SIZE)
+def normalize_path(base, path):
+    # Returns the absolute path that `path` points to when it is
+    # looked up from the config at `base`. Returns None if this
+    # is not possible without walking the config.
+    parts = [] if base == '/' else base[1:].split('/')
+    for kind, key, list_index in compile_path(path):
+        if kind == PARENT_TOKEN:
+            if not parts:
+                return None
+            parts.pop()
+        elif kind == ROOT_TOKEN:
+            parts = []
+        else:
+            if list_index is not None:
+                if list_index < 0:
+                    return None
+                key = f'{key}[{list_index}]'
+            parts.append(key)
+    return '/' + '/'.join(parts)
+
+def get_print_list(item):
+    return '[' + ','.join([get_print_list(i) if isinstance(i, SEQUENCE_TYPES) else str(i) for i in item]) + ']'
+
+def is_indexable_key(key):
+    # Keys that can not be expressed in a path are not indexed
+    return (
+        isinstance(key, str)
+        and key not in ('', '..')
+        and '/' not in key
+        and not key.endswith(']')
+    )
+
 def read_yaml(path):
     with open(path, 'r') as f:    
-        config = yaml.safe_load(f)
+        config = yaml.load(f, Loader=YamlLoader)
+    if _compact_lists['enabled'] and isinstance(config, dict):
+        compact_lists(config)
+    return config
+
+def iter_yaml_documents(path, start=0, stop=None, where=None):
+    # Yields (index, document) for the documents of a multi-document yaml
+    # file, one at a time while the file is read. Documents before start
+    # and documents that do not match where, a dict of paths to values,
+    # are only composed to yaml nodes and never constructed.
+    with open(path, 'r') as f:
+        loader = YamlLoader(f)
+        try:
+            index = 0
+            while (stop is None or index < stop) and loader.check_node():
+                node = loader.get_node()
+                if index >= start and is_matching_node(loader, node, where):
+                    document = loader.construct_document(node)
+                    if _compact_lists['enabled'] and isinstance(document, dict):
+                        compact_lists(document)
+                    yield index, document
+                index += 1
+        finally:
+            loader.dispose()
+
+def is_matching_node(loader, node, where):
+    # Only the values of the paths in where are constructed
+    if not where:
+        return True
+    for path, value in where.items():
+        item = find_yaml_node(node, path)
+        if item is None or loader.construct_document(item) != value:
+            return False
+    return True
+
+def find_yaml_node(node, path):
+    for key in path.strip('/').split('/'):
+        if not isinstance(node, yaml.MappingNode):
+            return None
+        for key_node, value_node in node.value:
+            if isinstance(key_node, yaml.ScalarNode) and key_node.value == key:
+                node = value_node
+                break
+        else:
+            return None
+    return node
+
+def read_import_yaml(path):
+    prefetched = _prefetched_yaml.get()
+    if prefetched is not None and path in prefetched:
+        return prefetched[path]
+    return read_yaml_cached(path)
+
+def get_import_path(root_dir, import_path):
+    path = remove_from_end('/', import_path)
+    if path.startswith('/'):
+        # Absolute path
+        return path
+    else:
+        # Relative Path
+        return os.path.join(root_dir, path)
+
+def find_imports(config_dict):
+    # Yields the import paths of all <import> items of a raw config
+    stack = [config_dict]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+        elif isinstance(item, str) and item.startswith('<import>'):
+            yield remove_from_start('<import>', item)
+
+def prefetch_imports(config_dict, root_dir, workers):
+    # Reads all files imported by config_dict, directly or through
+    # other imports, with a pool of threads. Every file is submitted as
+    # soon as the file importing it has been parsed. Files that can not
+    # be read are left out, building the config then raises the same
+    # error as without prefetching.
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    prefetched = {}
+    pending = {}
+    seen = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(config_dict):
+            for import_path in find_imports(config_dict):
+                path = get_import_path(root_dir, import_path)
+                if path not in seen:
+                    seen.add(path)
+                    pending[pool.submit(read_yaml_cached, path)] = path
+
+        submit(config_dict)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                if future.exception() is not None:
+                    continue
+                prefetched[path] = future.result()
+                if prefetched[path] is not None:
+                    submit(prefetched[path])
+    return prefetched
+
+@contextlib.contextmanager
+def use_prefetched(prefetched):
+    # Within the context, imports are read from the prefetched dict
+    # if possible, see read_import_yaml.
+    token = _prefetched_yaml.set(prefetched)
+    try:
+        yield
+    finally:
+        _prefetched_yaml.reset(token)
+
+def prefetched_imports(config_dict, root_dir, workers):
+    # The tree is still built in the original order within the context,
+    # so the result is identical to loading the imports one by one.
+    if workers is None:
+        return contextlib.nullcontext()
+    return use_prefetched(prefetch_imports(config_dict, root_dir, workers))
+
+def merge_args(config_dict, args):
+    # The cached config is shared, overwrite on a copy
+    config_dict = dict(config_dict)
+    for k, v in args.items():
+        if v is not None:
+            if k in config_dict.keys():
+                print(f'CLI config overwrite for "{k}"!')
+            config_dict[k] = v
+    return config_dict
+
+def compact_list(item):
+    # Returns the items of a plain list of only ints or only floats as
+    # an array.array, or the list itself if it can not be stored compactly.
+    if len(item) < _compact_lists['min_size']:
+        return item
+    item_type = type(item[0])
+    typecode = COMPACT_TYPECODES.get(item_type)
+    if typecode is None or set(map(type, item)) != {item_type}:
+        return item
+    try:
+        compact = array.array(typecode, item)
+    except OverflowError:
+        return item
+
+    # Small ints are shared by the interpreter and do not count
+    items_size = sum(
+        sys.getsizeof(item_item) for item_item in item
+        if item_type is not int or not -5 <= item_item <= 256
+    )
+    _compact_stats['lists'] += 1
+    _compact_stats['items'] += len(item)
+    _compact_stats['bytes_saved'] += sys.getsizeof(item) + items_size - sys.getsizeof(compact)
+    return compact
+
+def compact_lists(config_dict):
+    # Replaces all numeric lists of a raw config with arrays, in place
+    stack = [config_dict]
+    while stack:
+        item = stack.pop()
+        items = item.items() if isinstance(item, dict) else enumerate(item)
+        for key, item_item in items:
+            if isinstance(item_item, list):
+                compact = compact_list(item_item)
+                if compact is not item_item:
+                    item[key] = compact
+                else:
+                    stack.append(item_item)
+            elif isinstance(item_item, dict):
+                stack.append(item_item)
+
+def set_compact_lists(enabled, min_size=COMPACT_LIST_MIN_SIZE):
+    # Files in the yaml cache are read again with the new setting
+    _compact_lists['enabled'] = enabled
+    _compact_lists['min_size'] = min_size
+    _yaml_cache.clear()
+
+def compact_info():
+    return {
+        'enabled': _compact_lists['enabled'],
+        'min_size': _compact_lists['min_size'],
+        'lists': _compact_stats['lists'],
+        'items': _compact_stats['items'],
+        'bytes_saved': _compact_stats['bytes_saved'],
+    }
+
+def get_yaml_backend():
+    return YAML_BACKEND
+
+def write_yaml_events(events, stream):
+    # Writes the events of CoolConfig.iter_events as a yaml document.
+    # The output is the same as yaml.dump of the equivalent dict.
+    dumper = YamlDumper(stream, default_flow_style=False)
+    dumper.open()
+    dumper.emit(yaml.DocumentStartEvent(explicit=False))
+    for event in events:
+        kind = event[0]
+        if kind == MAPPING_START_EVENT:
+            dumper.emit(yaml.MappingStartEvent(None, 'tag:yaml.org,2002:map', True, flow_style=False))
+        elif kind == SEQUENCE_START_EVENT:
+            dumper.emit(yaml.SequenceStartEvent(None, 'tag:yaml.org,2002:seq', True, flow_style=False))
+        elif kind == END_EVENT:
+            if event[1] == MAPPING_START_EVENT:
+                dumper.emit(yaml.MappingEndEvent())
+            else:
+                dumper.emit(yaml.SequenceEndEvent())
+        else:
+            # Keys and values are represented one by one, so no
+            # represented objects have to be kept around
+            dumper.represented_objects = {}
+            dumper.object_keeper = []
+            write_yaml_node(dumper, dumper.represent_data(event[1]))
+    dumper.emit(yaml.DocumentEndEvent(explicit=False))
+    dumper.close()
+
+def write_yaml_node(dumper, node):
+    if isinstance(node, yaml.ScalarNode):
+        detected_tag = dumper.resolve(yaml.ScalarNode, node.value, (True, False))
+        default_tag = dumper.resolve(yaml.ScalarNode, node.value, (False, True))
+        implicit = (node.tag == detected_tag, node.tag == default_tag)
+        dumper.emit(yaml.ScalarEvent(None, node.tag, implicit, node.value, style=node.style))
+    elif isinstance(node, yaml.SequenceNode):
+        implicit = node.tag == dumper.resolve(yaml.SequenceNode, node.value, True)
+        dumper.emit(yaml.SequenceStartEvent(None, node.tag, implicit, flow_style=node.flow_style))
+        for item in node.value:
+            write_yaml_node(dumper, item)
+        dumper.emit(yaml.SequenceEndEvent())
+    else:
+        implicit = node.tag == dumper.resolve(yaml.MappingNode, node.value, True)
+        dumper.emit(yaml.MappingStartEvent(None, node.tag, implicit, flow_style=node.flow_style))
+        for key, item in node.value:
+            write_yaml_node(dumper, key)
+            write_yaml_node(dumper, item)
+        dumper.emit(yaml.MappingEndEvent())
+
+def write_json_events(events, stream, indent=2):
+    # Writes the events of CoolConfig.iter_events as json.
+    # The output is the same as json.dump of the equivalent dict.
+    depth = 0
+    # For every open mapping or sequence, whether it is still empty
+    is_empty = []
+    after_key = False
+    for event in events:
+        kind = event[0]
+        if kind == END_EVENT:
+            depth -= 1
+            if is_empty.pop():
+                stream.write('}' if event[1] == MAPPING_START_EVENT else ']')
+            else:
+                stream.write('\n' + ' ' * (indent * depth))
+                stream.write('}' if event[1] == MAPPING_START_EVENT else ']')
+            continue
+
+        if not after_key and is_empty:
+            stream.write('\n' if is_empty[-1] else ',\n')
+            stream.write(' ' * (indent * depth))
+            is_empty[-1] = False
+        after_key = False
+
+        if kind == MAPPING_START_EVENT:
+            stream.write('{')
+        elif kind == SEQUENCE_START_EVENT:
+            stream.write('[')
+        elif kind == KEY_EVENT:
+            stream.write(json.dumps(get_json_key(event[1])) + ': ')
+            after_key = True
+            continue
+        else:
+            value = json.dumps(event[1], indent=indent)
+            stream.write(value.replace('\n', '\n' + ' ' * (indent * depth)))
+            continue
+        depth += 1
+        is_empty.append(True)
+
+def get_json_key(key):
+    # Converts keys the same way as json.dump
+    if isinstance(key, str):
+        return key
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, float):
+        return float.__repr__(key)
+    if isinstance(key, int):
+        return int.__repr__(key)
+    raise TypeError(f'keys must be str, int, float, bool or None, not {type(key).__name__}')
+
+def read_yaml_cached(path):
+    # The returned config is shared between all readers
+    # and must not be modified.
+    if not _yaml_cache_enabled:
+        return read_yaml(path)
+
+    realpath = os.path.realpath(path)
+    stat = os.stat(realpath)
+    cached = _yaml_cache.get(realpath)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        _yaml_cache_stats['hits'] += 1
+        return cached[2]
+
+    _yaml_cache_stats['misses'] += 1
+    config = read_yaml(realpath)
+    _yaml_cache[realpath] = (stat.st_mtime_ns, stat.st_size, config)
     return config
 
+def clear_cache():
+    _yaml_cache.clear()
+    _yaml_cache_stats['hits'] = 0
+    _yaml_cache_stats['misses'] = 0
+
+def cache_info():
+    return {
+        'enabled': _yaml_cache_enabled,
+        'hits': _yaml_cache_stats['hits'],
+        'misses': _yaml_cache_stats['misses'],
+        'size': len(_yaml_cache),
+    }
+
+def set_cache_enabled(enabled):
+    global _yaml_cache_enabled
+    _yaml_cache_enabled = enabled
+    if not enabled:
+        _yaml_cache.clear()
+
+# Marks the end of an iterator in CoolConfig.iter_events
+_end_of_items = object()
+
+# Flags of digests of CoolConfig.hash. Digests with references are only
+# reused until the next write to the tree, uncached digests depend on
+# items that can change unnoticed, e.g. raw dicts.
+DIGEST_REFS = 1
+DIGEST_UNCACHED = 2
+
+def get_sequence_snapshot(sequence):
+    # See is_same_sequence
+    if isinstance(sequence, array.array):
+        return sequence.tobytes()
+    return tuple(sequence)
+
+def is_same_sequence(sequence, snapshot):
+    # Items of lists are compared by identity, so any assignment counts
+    # as a change, even of an equal value
+    if isinstance(sequence, array.array):
+        return sequence.tobytes() == snapshot
+    return len(sequence) == len(snapshot) and all(map(operator.is_, sequence, snapshot))
+
+class PathIndex:
+    # Flat index of a config, see CoolConfig.build_index.
+    # entries maps absolute paths to (config, key, list_index), the item
+    # itself is read from the config on every lookup, so that in place
+    # changes of lists are seen. paths maps every indexed config to its
+    # absolute path. hooked is set once a get item hook is registered in
+    # the tree, lookups then walk the config so that the hooks are called.
+    __slots__ = ('entries', 'paths', 'hooked')
+
+    def __init__(self):
+        self.entries = {}
+        self.paths = {}
+        self.hooked = False
+
+class LazyImport:
+    # Placeholder for an imported config that is only
+    # read once it is accessed for the first time.
+    __slots__ = ('import_path',)
+
+    def __init__(self, import_path):
+        self.import_path = import_path
+
+    def __repr__(self):
+        return f'LazyImport({self.import_path})'
+
+class SharedConfig(LazyImport):
+    # Placeholder in a variant for a config of the tree the variant was
+    # created from, see CoolConfig.variant. It is copied into the variant
+    # once it is accessed for the first time.
+    __slots__ = ('config',)
+
+    def __init__(self, config):
+        self.import_path = None
+        self.config = config
+
+    def __repr__(self):
+        return f'SharedConfig({self.config.path})'
+
 class CoolConfig:
+    __slots__ = (
+        'key',
+        'parent_config',
+        'root_dir',
+        'lazy',
+        'root_config',
+        'generation',
+        'ref_cache',
+        'get_item_hook_fn',
+        'path_index',
+        'digest_cache',
+        'instrumentation',
+        'source_path',
+        'source_args',
+        'import_paths',
+        'config',
+    )
 
     @staticmethod
-    def parse_config_from_args(args, path=None):
+    def parse_config_from_args(args, path=None, lazy=False, index=False, workers=None, validate=False):
         if path is None:
             path = args['config']
         
-        config_dict = read_yaml(path)
+        config_dict = read_yaml_cached(path)
         
         assert config_dict is not None, 'Provided config seems to be empty' 
 
-        for k, v in args.items():
-            if v is not None:
-                if k in config_dict.keys():
-                    print(f'CLI config overwrite for "{k}"!')
-                config_dict[k] = v
+        config_dict = merge_args(config_dict, args)
 
-        return CoolConfig('/', config_dict, None, get_root_dir(path))
+        root_dir = get_root_dir(path)
+        with prefetched_imports(config_dict, root_dir, None if lazy else workers):
+            config = CoolConfig('/', config_dict, None, root_dir, lazy=lazy)
+        config.source_path = path
+        config.source_args = dict(args)
+        if index:
+            config.build_index()
+        if validate:
+            config.validate_refs().prime_caches()
+        return config
 
     @staticmethod
-    def parse_config_from_path(path):
-        config = read_yaml(path)
+    def parse_config_from_path(path, lazy=False, index=False, compiled_cache=None, workers=None, validate=False):
+        # compiled_cache can be True or the path of a compiled cache file,
+        # see cool_config.compiled. Compiled configs are never lazy.
+        # If workers is set, imports are read ahead with a pool of that
+        # many threads. Lazy configs read their imports on access instead.
+        # If validate is set, all references are checked up front, see validate_refs.
+        if compiled_cache is not None and compiled_cache is not False:
+            from cool_config.compiled import load_or_compile
+            cache_path = None if compiled_cache is True else compiled_cache
+            config = load_or_compile(path, cache_path=cache_path)
+            if index:
+                config.build_index()
+            if validate:
+                config.validate_refs().prime_caches()
+            return config
+
+        config = read_yaml_cached(path)
         
         assert config is not None, 'Provided config seems to be empty' 
 
-        return CoolConfig('/', config, None, get_root_dir(path))
+        root_dir = get_root_dir(path)
+        with prefetched_imports(config, root_dir, None if lazy else workers):
+            config = CoolConfig('/', config, None, root_dir, lazy=lazy)
+        config.source_path = path
+        if index:
+            config.build_index()
+        if validate:
+            config.validate_refs().prime_caches()
+        return config
+
+    @staticmethod
+    def iter_configs_from_path(path, start=0, stop=None, where=None, lazy=False, index=False, workers=None, validate=False):
+        # Yields a config for every document of a multi-document yaml file,
+        # imports are relative to the file like in parse_config_from_path.
+        # Only one document is read at a time, documents with an index
+        # below start or not matching where, e.g. {'model/name': 'big'},
+        # are skipped without being built. Values in where are compared
+        # as they are written, references and imports are not followed.
+        # Empty documents are counted but not yielded.
+        root_dir = get_root_dir(path)
+        for i, config_dict in iter_yaml_documents(path, start=start, stop=stop, where=where):
+            if config_dict is None:
+                continue
+            if not isinstance(config_dict, dict):
+                raise ValueError(f'Document {i} of "{path}" is not a mapping!')
+            yield CoolConfig.parse_config_from_dict(
+                config_dict, root_dir, lazy=lazy, index=index, workers=workers, validate=validate
+            )
 
     @staticmethod
-    def parse_config_from_dict(raw_config, root_dir):
+    def parse_config_from_dict(raw_config, root_dir, lazy=False, index=False, workers=None, validate=False):
         assert raw_config is not None, 'Provided config seems to be empty' 
 
-        return CoolConfig('/', raw_config, None, root_dir)
+        with prefetched_imports(raw_config, root_dir, None if lazy else workers):
+            config = CoolConfig('/', raw_config, None, root_dir, lazy=lazy)
+        if index:
+            config.build_index()
+        if validate:
+            config.validate_refs().prime_caches()
+        return config
+
+    @staticmethod
+    async def aparse_config_from_path(path, lazy=False, index=False, limit=None):
+        # Loads the config without blocking the event loop, see cool_config.aio.
+        # limit bounds the number of imports that are read at the same time.
+        from cool_config.aio import aparse_config_from_path
+        return await aparse_config_from_path(path, lazy=lazy, index=index, limit=limit)
+
+    @staticmethod
+    async def aparse_config_from_args(args, path=None, lazy=False, index=False, limit=None):
+        from cool_config.aio import aparse_config_from_args
+        return await aparse_config_from_args(args, path=path, lazy=lazy, index=index, limit=limit)
 
-    def __init__(self, path, config_dict, parent_config, root_dir):
-        self.path = path
+    def __init__(self, path, config_dict, parent_config, root_dir, lazy=False):
+        # Only the last path segment is stored,
+        # the full path is built from the parents on demand.
+        if parent_config is None:
+            self.key = path
+        else:
+            self.key = sys.intern(path.split('/')[-1])
         self.parent_config = parent_config
         self.root_dir = root_dir
 
+        # If lazy, imports are only read once they are accessed
+        self.lazy = lazy
+
+        if parent_config is None:
+            self.root_config = self
+        else:
+            self.root_config = parent_config.root_config
+
+        # Every write to the tree increases the generation of the root.
+        # Resolved references are cached per node together with the
+        # generation they were resolved in. References whose path leads
+        # through a list are resolved every time, as lists can be changed
+        # in place without a write to the tree.
+        self.generation = 0
+        self.ref_cache = None
+
         self.get_item_hook_fn = None
 
+        # Optional flat index of the whole config, only set for the root.
+        # See build_index.
+        self.path_index = None
+
+        # Structural digests of this config, see hash
+        self.digest_cache = None
+
+        # Only set for the root, see enable_instrumentation
+        self.instrumentation = None
+
+        # The yaml file this config was read from, only set for the root and imports
+        self.source_path = None
+        # The args merged into the file by parse_config_from_args, only set for the root
+        self.source_args = None
+        # The files imported so far, only set for the root, see __parse_import
+        self.import_paths = None
+
+        if self.root_config.instrumentation is not None:
+            self.root_config.instrumentation.attach(self)
+
         # First, parse everything except the ref paths.
         # Parsing the ref paths then happens on the fly
         self.config = self.parse_except_ref(config_dict)
 
+    @property
+    def path(self):
+        keys = []
+        config = self
+        while config.parent_config is not None:
+            keys.append(config.key)
+            config = config.parent_config
+        if not keys:
+            return config.key
+        keys.reverse()
+        return os.path.join(config.key, *keys)
+
     # Initial Parsing
 
     def parse_except_ref(self, config_dict):
@@ -73,86 +721,184 @@ class CoolConfig:
         # Additionally, configs are imported.
         parsed = {}
         for key, item in config_dict.items():
+            if isinstance(key, str):
+                key = sys.intern(key)
             parsed[key] = self.__parse_non_ref_item(key, item)
         return parsed
 
-    def __parse_non_ref_item(self, key, item):
+    def __parse_non_ref_item(self, key, item, allow_lazy=True):
         parsed = item
         if isinstance(item, dict):
-            path = os.path.join(self.path, key)
-            parsed = CoolConfig(path, item, self, self.root_dir)
+            # Only the last path segment is used by __init__
+            parsed = type(self)(str(key), item, self, self.root_dir, lazy=self.lazy)
         elif isinstance(item, str):
             if item.startswith('<import>'):
-                parsed = self.__parse_import(key, item)
+                parsed = self.__parse_import(key, item, allow_lazy)
+        elif isinstance(item, array.array):
+            # Compact list of a cached raw config, see compact_lists
+            parsed = item[:]
         elif isinstance(item, list):
+            if all(self.__is_plain_item(item_item) for item_item in item):
+                # Raw configs are shared through the yaml cache, every
+                # config gets its own copy of their lists
+                if _compact_lists['enabled']:
+                    parsed = compact_list(item)
+                    if parsed is not item:
+                        return parsed
+                return list(item)
+            # Imports inside of lists are always loaded directly
             parsed = []
-            for item_item in item:
-                parsed.append(self.__parse_non_ref_item(key, item_item))
+            for i, item_item in enumerate(item):
+                parsed.append(self.__parse_non_ref_item(f'{key}[{i}]', item_item, allow_lazy=False))
         return parsed
+
+    def __is_plain_item(self, item):
+        if isinstance(item, str):
+            return not item.startswith('<import>')
+        return not isinstance(item, (dict, list))
     
-    def __parse_import(self, key, item):
+    def __parse_import(self, key, item, allow_lazy=True):
         item = remove_from_start('<import>', item)
-        path = self.__parse_import_path(item)
-        config_dict = read_yaml(path)
-        return CoolConfig(
-            os.path.join(self.path, key),
+        if allow_lazy and (self.lazy or self.__is_imported(item)):
+            # Files that were imported before are only built once they
+            # are accessed. Until then, all imports of a file share its
+            # raw config in the yaml cache.
+            return LazyImport(item)
+        return self.__load_import(key, item)
+
+    def __is_imported(self, import_path):
+        import_paths = self.root_config.import_paths
+        return import_paths is not None and self.__parse_import_path(import_path) in import_paths
+
+    def __load_import(self, key, import_path):
+        path = self.__parse_import_path(import_path)
+        root = self.root_config
+        if root.import_paths is None:
+            root.import_paths = set()
+        root.import_paths.add(path)
+        config_dict = read_import_yaml(path)
+        config = type(self)(
+            str(key),
             config_dict,
             self,
-            self.root_dir
+            self.root_dir,
+            lazy=self.lazy
         )
+        config.source_path = path
+        return config
 
-    def __parse_import_path(self, path):
-        path = remove_from_end('/', path)
-        if path.startswith('/'):
-            # Absolute path
-            return path
+    def __load_lazy_item(self, key, item):
+        if isinstance(item, SharedConfig):
+            item = self.__copy_config(key, item.config)
         else:
-            # Relative Path
-            return os.path.join(self.root_dir, path)
+            item = self.__load_import(key, item.import_path)
+        self.config[key] = item
+        index = self.root_config.path_index
+        if index is not None:
+            self.__index_item(index, os.path.join(self.path, key), key, item)
+        return item
+
+    def __parse_import_path(self, path):
+        return get_import_path(self.root_dir, path)
 
     # Main
 
-    def print(self):
-        lines = self.get_print_string(indent=0)
-        max_k = max([len(line[0]) for line in lines])
-        for line in lines:
-            if '[' in line[0] and ']' in line[0]:
-                print(line[0])
-            else: 
-                print(line[0].ljust(max_k, '-'), line[1])
-     
-    def get_print_string(self, indent=0):
-        key_prefix = ''.join(['-' for _ in range(indent)])
-        lines = []
-        for key, item in self.config.items():
-            key = f'{key_prefix}{key}'
-            cur_lines = self.__get_lines_for_item(key, item, indent)[0]
-            lines += cur_lines
-        return lines
-
-    def __get_lines_for_item(self, key, item, indent):
-        has_dict = False
-        lines = []
-        if isinstance(item, CoolConfig):
-            lines.append([key, ''])
-            lines += item.get_print_string(indent=indent+4)
-            has_dict = True
-        elif isinstance(item, list):
-            list_lines = []
-            for i, item_item in enumerate(item):
-                cur_list_lines, cur_has_dict = self.__get_lines_for_item(f'{key}[{i}]', item_item, indent)
-                list_lines += cur_list_lines
-                has_dict = has_dict or cur_has_dict
-            
-            if has_dict:
-                lines += list_lines
+    def print(self, stream=None, max_depth=None, paths=None, resolve_refs=False):
+        # Writes one line per item to stream (stdout by default), keys are
+        # padded with '-' to the longest key. The config is walked twice,
+        # once for the width and once for writing, so no lines are kept.
+        # max_depth limits the number of nested configs that are expanded,
+        # paths selects subtrees and resolve_refs shows referenced values.
+        if stream is None:
+            stream = sys.stdout
+        width = 0
+        for key, _ in self.__iter_print_lines(indent=0, max_depth=max_depth, paths=paths, resolve_refs=False, values=False):
+            if len(key) > width:
+                width = len(key)
+
+        buffer = []
+        for key, value in self.iter_print_lines(max_depth=max_depth, paths=paths, resolve_refs=resolve_refs):
+            if '[' in key and ']' in key:
+                buffer.append(key)
             else:
-                lines = [[key, '[' + ','.join([line[1] for line in list_lines]) + ']']]
+                buffer.append(f'{key.ljust(width, "-")} {value}')
+            if len(buffer) >= PRINT_BUFFER_LINES:
+                buffer.append('')
+                stream.write('\n'.join(buffer))
+                buffer.clear()
+        if buffer:
+            buffer.append('')
+            stream.write('\n'.join(buffer))
+
+    def get_print_string(self, indent=0):
+        return [[key, value] for key, value in self.iter_print_lines(indent=indent)]
+
+    def iter_print_lines(self, indent=0, max_depth=None, paths=None, resolve_refs=False):
+        # Yields the (key, value) lines of print, keys are prefixed with
+        # '-' for every level. Lists without configs are a single line,
+        # lists with configs get a line per item. Walks the config iteratively.
+        return self.__iter_print_lines(indent, max_depth, paths, resolve_refs, True)
+
+    def __iter_print_lines(self, indent, max_depth, paths, resolve_refs, values):
+        if paths is None:
+            entries = self.__iter_print_entries(indent, 0)
         else:
-            lines.append(
-                [key, str(item)]
-            )
-        return lines, has_dict
+            entries = ((path, self[path], indent, self, 0) for path in paths)
+        stack = [entries]
+        while stack:
+            entry = next(stack[-1], None)
+            if entry is None:
+                stack.pop()
+                continue
+
+            key, item, indent, location, depth = entry
+            if isinstance(item, CoolConfig):
+                if max_depth is not None and depth >= max_depth:
+                    yield key, '...'
+                    continue
+                yield key, ''
+                stack.append(item.__iter_print_entries(indent + 4, depth + 1))
+            elif isinstance(item, list) and CoolConfig.__contains_config(item):
+                stack.append(CoolConfig.__iter_print_list_entries(key, item, indent, location, depth))
+            elif values:
+                yield key, location.__get_print_value(item, resolve_refs)
+            else:
+                yield key, None
+
+    def __iter_print_entries(self, indent, depth):
+        key_prefix = '-' * indent
+        for key, item in self.config.items():
+            if isinstance(item, LazyImport):
+                item = self.__load_lazy_item(key, item)
+            yield f'{key_prefix}{key}', item, indent, self, depth
+
+    @staticmethod
+    def __iter_print_list_entries(key, item, indent, location, depth):
+        for i, item_item in enumerate(item):
+            yield f'{key}[{i}]', item_item, indent, location, depth
+
+    @staticmethod
+    def __contains_config(item):
+        stack = [item]
+        while stack:
+            for item_item in stack.pop():
+                if isinstance(item_item, CoolConfig):
+                    return True
+                if isinstance(item_item, list):
+                    stack.append(item_item)
+        return False
+
+    def __get_print_value(self, item, resolve_refs):
+        if resolve_refs:
+            if isinstance(item, SEQUENCE_TYPES):
+                return '[' + ','.join([self.__get_print_value(item_item, True) for item_item in item]) + ']'
+            if self.__is_reference(item):
+                resolved = self.__parse_reference_item(item)[0]
+                if not isinstance(resolved, CoolConfig):
+                    return self.__get_print_value(resolved, False)
+        elif isinstance(item, SEQUENCE_TYPES):
+            return get_print_list(item)
+        return str(item)
 
     def assert_has_key(self, key):
         if not self.has_key(key):
@@ -170,13 +916,22 @@ class CoolConfig:
 
     def __getitem__(self, key):
         with_default = False
+        default = None
         if isinstance(key, tuple):
             assert len(key) == 2
             default = key[1]
             key = key[0]
             with_default = True
         
-        res = self.__get_item_from_path(key)
+        res = None
+        root = self.root_config
+        if root.path_index is not None and not root.path_index.hooked and root.instrumentation is None:
+            res = self.__get_item_from_index(key)
+        if res is None:
+            res = self.__get_item_from_path(key)
+        return self.__finish_get_item(key, res, with_default, default)
+
+    def __finish_get_item(self, key, res, with_default, default):
         if res is None:
             if with_default:
                 item = default
@@ -189,7 +944,7 @@ class CoolConfig:
 
         if self.__is_reference(item):
             path = location.__prepare_ref_path(item)
-            res = location.__get_item_from_path(path)
+            res = location.__resolve_reference(item)
             if res is None:
                 raise RuntimeError(
                     f'Could not find ref path "{path}" from "{location.path}"! '
@@ -199,83 +954,221 @@ class CoolConfig:
         
         return item
 
+    def get_many(self, keys, as_dict=False):
+        # Looks up many keys at once, keys can be (key, default) tuples
+        # like in __getitem__. The paths are grouped in a trie, so that
+        # shared prefixes and references on them are only walked once.
+        # Returns a list in the order of keys or a dict by path.
+        keys = list(keys)
+        if self.root_config.path_index is not None:
+            # Every lookup is a single dict access anyway
+            values = [self[key] for key in keys]
+        else:
+            values = self.__get_many_from_paths(keys)
+        if as_dict:
+            return {
+                key[0] if isinstance(key, tuple) else key: value
+                for key, value in zip(keys, values)
+            }
+        return values
+
+    def __get_many_from_paths(self, keys):
+        lookups = []
+        for key in keys:
+            if isinstance(key, tuple):
+                assert len(key) == 2
+                lookups.append((key[0], True, key[1]))
+            else:
+                lookups.append((key, False, None))
+        trie = compile_trie(tuple(lookup[0] for lookup in lookups))
+
+        results = [None] * len(keys)
+        errors = {}
+        stack = [(self, trie)]
+        while stack:
+            config, node = stack.pop()
+            for (kind, key, list_index), child in node[0].items():
+                if kind == PARENT_TOKEN:
+                    if config.parent_config is None:
+                        CoolConfig.__fail_lookups(child, errors, RuntimeError('Error! There is no parent config.'))
+                    else:
+                        stack.append((config.parent_config, child))
+                    continue
+
+                if kind == ROOT_TOKEN:
+                    stack.append((config.get_root_config(), child))
+                    continue
+
+                # Missing items are left as None, like in __get_item_from_path
+                if not config.has_key(key):
+                    continue
+
+                try:
+                    item = config.__get_item(key)
+                    location = config
+                    if config.__is_reference(item):
+                        item, location = config.__parse_reference_item(item)
+                except Exception as e:
+                    CoolConfig.__fail_lookups(child, errors, e)
+                    continue
+
+                if list_index is not None:
+                    if not isinstance(item, SEQUENCE_TYPES) or len(item) <= list_index:
+                        continue
+                    item = item[list_index]
+
+                for i in child[1]:
+                    results[i] = (item, location)
+                if child[0] and isinstance(item, CoolConfig):
+                    stack.append((item, child))
+
+        # Errors are raised in the order of keys, like separate lookups would
+        values = []
+        for i, (key, with_default, default) in enumerate(lookups):
+            if i in errors:
+                raise errors[i]
+            values.append(self.__finish_get_item(key, results[i], with_default, default))
+        return values
+
+    @staticmethod
+    def __fail_lookups(node, errors, error):
+        # Marks all keys ending at or below node as failed
+        stack = [node]
+        while stack:
+            children, positions = stack.pop()
+            for i in positions:
+                errors[i] = error
+            stack.extend(children.values())
+
     def __setitem__(self, key, value):
-        if len(key.split('/')) == 1:
-            value = self.__parse_non_ref_item(key, value)
-            self.config[key] = value
-            return
+        self.root_config.generation += 1
 
-        # key is of the form: config1/config2/config3/param = value
-        path = '/'.join(key.split('/')[:-1]) # config1/config2/config3
-        containig_config = key.split('/')[-2] # config3
-        key = key.split('/')[-1] # param
+        containing_config = self
+        if len(key.split('/')) > 1:
+            # key is of the form: config1/config2/config3/param = value
+            path = '/'.join(key.split('/')[:-1]) # config1/config2/config3
+            key = key.split('/')[-1] # param
+
+            # This checks if config1/config2/config3 exists.
+            # The path to it can also lead through lists or references
+            # but this is handled by __get_item_from_path.
+            res = self.__get_item_from_path(path)
+            if res is None or not isinstance(res[0], CoolConfig):
+                raise RuntimeError(
+                    f'Could not set value {value} for {key}. '
+                    f'Did not find parent {path}.'
+                )
+            containing_config = res[0]
 
         # key can also be a list entry
-        # In general, the path to config1, config2, config3 can
-        # also lead through a list but this is handled by __get_item_from_path
         list_index = None
         if key.endswith(']'):
             list_index = key.split('[')[-1].replace(']', '')
             list_index = int(list_index)
             key = key.split('[')[0]
 
-        # This checks if config1/config2/config3 exists
-        # The location will be config1/config2 
-        res = self.__get_item_from_path(path)
-        if res is None:
-            raise RuntimeError(
-                f'Could not set value {value} for {key}. '
-                f'Did not find parent {path}.'
-            )
-    
-        location = res[1]
-        value = location.__parse_non_ref_item(key, value)
+        containing_config.__set_item(key, list_index, value)
 
-        if list_index is not None:
-            location[containig_config].config[key][list_index] = value
+    def __set_item(self, key, list_index, value):
+        self.__invalidate_digests()
+        if list_index is None:
+            old_value = self.config.get(key)
+            value = self.__parse_non_ref_item(key, value)
+            self.config[key] = value
         else:
-            location[containig_config].config[key] = value
+            # Lists of a variant are shared with the config it was created from
+            items = self.config[key]
+            if isinstance(items, array.array) and type(value) is type(items[0]):
+                items = array.array(items.typecode, items)
+            else:
+                items = list(items)
+            if list_index < 0:
+                list_index += len(items)
+            old_value = items[list_index]
+            value = self.__parse_non_ref_item(f'{key}[{list_index}]', value, allow_lazy=False)
+            items[list_index] = value
+            self.config[key] = items
 
-    def __get_item_from_path(self, path):
-        if path.startswith('../'):
-            path = remove_from_start('../', path)
-            if self.parent_config is None:
-                raise RuntimeError('Error! There is no parent config.')
+        index = self.root_config.path_index
+        if index is not None:
+            path = os.path.join(self.path, key)
+            if list_index is None:
+                self.__unindex_item(index, path, old_value)
+                self.__index_item(index, path, key, value)
             else:
-                return self.parent_config.__get_item_from_path(path)
+                item_path = f'{path}[{list_index}]'
+                self.__unindex_item(index, item_path, old_value, list_index)
+                self.__index_item(index, item_path, key, value, list_index)
 
-        if path.startswith('/'):
-            path = remove_from_start('/', path)
-            return self.get_root_config().__get_item_from_path(path)
+    def __get_item_from_path(self, path, through_lists=None):
+        # If given, through_lists is set to True if the path leads
+        # through a list, including the paths of references on the way
+        tokens = compile_path(path)
+        last = len(tokens) - 1
+        config = self
+        for i, (kind, key, list_index) in enumerate(tokens):
+            if kind == PARENT_TOKEN:
+                if config.parent_config is None:
+                    raise RuntimeError('Error! There is no parent config.')
+                config = config.parent_config
+                continue
 
-        cur_key = path.split('/')[0]
-        list_index = None
-        if cur_key.endswith(']'):
-            list_index = cur_key.split('[')[-1].replace(']', '')
-            list_index = int(list_index)
-            cur_key = cur_key.split('[')[0]
-        
-        if self.has_key(cur_key):
-            item = self.__get_item(cur_key)
-            location = self
+            if kind == ROOT_TOKEN:
+                config = config.get_root_config()
+                continue
 
-            if self.__is_reference(item):
-                item, location = self.__parse_reference_item(item)
+            if not config.has_key(key):
+                return None
+
+            item = config.__get_item(key)
+            location = config
+
+            if config.__is_reference(item):
+                item, location = config.__parse_reference_item(item, through_lists)
 
             if list_index is not None:
-                if not isinstance(item, list) or len(item) <= list_index:
+                if through_lists is not None:
+                    through_lists[0] = True
+                if not isinstance(item, SEQUENCE_TYPES) or len(item) <= list_index:
                     return None
                 item = item[list_index]
-                cur_key = f'{cur_key}[{list_index}]'
 
-            if len(path.split('/')) == 1: # We are done
+            if i == last: # We are done
                 return item, location
-            else:
-                if isinstance(item, CoolConfig):
-                    path = remove_from_start(f'{cur_key}/', path)
-                    return item.__get_item_from_path(path)
+
+            if not isinstance(item, CoolConfig):
+                return None
+            config = item
         return None
 
+    def __get_item_from_index(self, key):
+        index = self.root_config.path_index
+        base = index.paths.get(self)
+        if base is None:
+            # Not in the tree anymore, e.g. replaced by __setitem__
+            return None
+        path = normalize_path(base, key)
+        if path is None:
+            return None
+        entry = index.entries.get(path)
+        if entry is None:
+            return None
+
+        location, key, list_index = entry
+        if key not in location.config:
+            return None
+        item = location.config[key]
+        if isinstance(item, LazyImport):
+            return None
+        if list_index is not None:
+            # Lists can be changed in place, so the element is read every time
+            if not isinstance(item, SEQUENCE_TYPES) or len(item) <= list_index:
+                return None
+            item = item[list_index]
+        elif location.__is_reference(item):
+            item, location = location.__parse_reference_item(item)
+        return item, location
+
     def __prepare_ref_path(self, path):
         path = remove_from_start('<ref>', path)
         path = remove_from_end('/', path)
@@ -284,6 +1177,8 @@ class CoolConfig:
     def __get_item(self, key):
         self.assert_has_key(key)
         item = self.config[key]
+        if isinstance(item, LazyImport):
+            item = self.__load_lazy_item(key, item)
         if self.get_item_hook_fn is not None:
             self.get_item_hook_fn(key, item)
         return item
@@ -291,6 +1186,8 @@ class CoolConfig:
     def __get_item_with_default(self, key, default):
         if self.has_key(key):
             item = self.config[key]
+            if isinstance(item, LazyImport):
+                item = self.__load_lazy_item(key, item)
             if self.get_item_hook_fn is not None:
                 self.get_item_hook_fn(key, item)
             return item
@@ -300,12 +1197,33 @@ class CoolConfig:
     def __is_reference(self, item):
         return isinstance(item, str) and item.startswith('<ref>')
 
-    def __parse_reference_item(self, item):
-        return self.__parse_reference_item_from_location(item, self)
+    def __resolve_reference(self, item, through_lists=None):
+        generation = self.root_config.generation
+        if self.ref_cache is None:
+            self.ref_cache = {}
+        else:
+            cached = self.ref_cache.get(item)
+            if cached is not None and cached[0] == generation:
+                return cached[1]
+
+        lists = [False]
+        res = self.__get_item_from_path(self.__prepare_ref_path(item), lists)
+        if lists[0]:
+            if through_lists is not None:
+                through_lists[0] = True
+            # Lists of frozen configs can not change
+            if not isinstance(self.root_config, FrozenCoolConfig):
+                return res
+        if res is not None:
+            self.ref_cache[item] = (generation, res)
+        return res
 
-    def __parse_reference_item_from_location(self, item, location):
+    def __parse_reference_item(self, item, through_lists=None):
+        return self.__parse_reference_item_from_location(item, self, through_lists)
+
+    def __parse_reference_item_from_location(self, item, location, through_lists=None):
         path = location.__prepare_ref_path(item)
-        res = location.__get_item_from_path(path)
+        res = location.__resolve_reference(item, through_lists)
         if res is None:
             raise RuntimeError(
                 f'Could not find ref path "{path}" from "{location.path}"! '
@@ -315,25 +1233,173 @@ class CoolConfig:
 
     # Convenience Functions
 
-    def hash(self, exclude=[]):
-        import hashlib
-        from pprint import pformat
+    def hash(self, exclude=[], legacy=False, resolve_refs=True):
+        # The hash is computed over the structure of the config. References
+        # are hashed as they are written and together with their target,
+        # so the hash of a sub-config changes when a target outside of it
+        # changes. With resolve_refs=False, references are only hashed as
+        # they are written, like diff compares configs.
+        # Digests of sub-configs are cached. A cached digest is checked
+        # against the lists it was computed from, so lists changed in place
+        # are noticed, and digests with references are only reused until
+        # the next write to the tree.
+        # legacy=True computes the hash of versions <= 0.1.0 from the
+        # resolved asdict() which is much slower.
+        if legacy:
+            from pprint import pformat
+            return hashlib.md5(
+                pformat(self.asdict(exclude=exclude)).encode('utf-8')
+            ).hexdigest()
+        return self.__digest(frozenset(exclude), resolve_refs, set(), set())[0].hex()
+
+    def __digest(self, exclude, resolve_refs, walking, checked):
+        # Returns (digest, flags), see DIGEST_REFS. walking holds the
+        # configs on the stack, checked the (config, resolve_refs) whose
+        # cached digest is known to be current in this call.
+        if self in walking:
+            raise RuntimeError(f'Config "{self.path}" contains itself through a reference!')
+        generation = self.root_config.generation
+        if self.digest_cache is None:
+            self.digest_cache = {}
+        else:
+            cached = self.digest_cache.get((exclude, resolve_refs))
+            if cached is not None and self.__is_digest_current(cached, exclude, resolve_refs, walking, checked):
+                return cached[2], cached[0]
+
+        walking.add(self)
+        # What the digest depends on: (sequence, snapshot) and
+        # (config, resolve_refs, digest)
+        sequences = []
+        configs = []
+        digest = hashlib.md5(b'config')
+        flags = 0
+        for key in sorted(self.config.keys(), key=repr):
+            if key in exclude:
+                continue
+            item = self.config[key]
+            item_digest = None
+            if isinstance(item, SharedConfig):
+                # Untouched configs of a variant hash like the original,
+                # unless their references have to resolve in the variant
+                item_digest, item_flags = item.config.__digest(exclude, resolve_refs, walking, checked)
+                if resolve_refs and item_flags & DIGEST_REFS:
+                    item_digest = None
+                    item = self.__load_lazy_item(key, item)
+                else:
+                    configs.append((item.config, resolve_refs, item_digest))
+            elif isinstance(item, LazyImport):
+                item = self.__load_lazy_item(key, item)
+            if item_digest is None:
+                item_digest, item_flags = self.__item_digest(
+                    item, exclude, resolve_refs, walking, checked, sequences, configs
+                )
+            digest.update(repr(key).encode('utf-8'))
+            digest.update(item_digest)
+            if resolve_refs and self.__is_reference(item):
+                item_flags |= self.__reference_digest(
+                    item, digest, exclude, walking, checked, sequences, configs
+                )
+            flags |= item_flags
+        digest = digest.digest()
+
+        walking.discard(self)
+        if not flags & DIGEST_UNCACHED:
+            self.digest_cache[exclude, resolve_refs] = (flags, generation, digest, sequences, configs)
+            checked.add((self, resolve_refs))
+        return digest, flags
+
+    def __is_digest_current(self, cached, exclude, resolve_refs, walking, checked):
+        if (self, resolve_refs) in checked:
+            return True
+        flags, generation, _, sequences, configs = cached
+        if flags & DIGEST_REFS and generation != self.root_config.generation:
+            return False
+        for sequence, snapshot in sequences:
+            if not is_same_sequence(sequence, snapshot):
+                return False
+        walking.add(self)
+        for config, config_resolve_refs, digest in configs:
+            if config.__digest(exclude, config_resolve_refs, walking, checked)[0] != digest:
+                walking.discard(self)
+                return False
+        walking.discard(self)
+        checked.add((self, resolve_refs))
+        return True
+
+    def __reference_digest(self, item, digest, exclude, walking, checked, sequences, configs):
+        # Adds the digest of the target of a reference, returns its flags
+        through_lists = [False]
+        res = self.__resolve_reference(item, through_lists)
+        if res is None:
+            # Dangling, it may resolve after a later write
+            return DIGEST_REFS
+        target_digest, flags = res[1].__item_digest(
+            res[0], exclude, True, walking, checked, sequences, configs
+        )
+        digest.update(target_digest)
+        if through_lists[0]:
+            # The path leads through a list, which can be changed in place
+            flags |= DIGEST_UNCACHED
+        return flags | DIGEST_REFS
+
+    def __item_digest(self, item, exclude, resolve_refs, walking, checked, sequences, configs):
+        if isinstance(item, CoolConfig):
+            digest, flags = item.__digest(exclude, resolve_refs, walking, checked)
+            configs.append((item, resolve_refs, digest))
+            return digest, flags
+        if isinstance(item, SEQUENCE_TYPES):
+            if not isinstance(item, (FrozenList, FrozenArray)):
+                sequences.append((item, get_sequence_snapshot(item)))
+            digest = hashlib.md5(b'list')
+            flags = 0
+            for item_item in item:
+                item_digest, item_flags = self.__item_digest(
+                    item_item, exclude, resolve_refs, walking, checked, sequences, configs
+                )
+                digest.update(item_digest)
+                flags |= item_flags
+            return digest.digest(), flags
+        if isinstance(item, dict):
+            # Raw dicts can be set by update and changed in place
+            digest = hashlib.md5(b'dict')
+            for key in sorted(item.keys(), key=repr):
+                if key not in exclude:
+                    digest.update(repr(key).encode('utf-8'))
+                    digest.update(self.__item_digest(
+                        item[key], exclude, resolve_refs, walking, checked, sequences, configs
+                    )[0])
+            return digest.digest(), DIGEST_UNCACHED
         return hashlib.md5(
-            pformat(self.asdict(exclude=exclude)).encode('utf-8')
-        ).hexdigest()
+            f'{type(item).__name__}:{item!r}'.encode('utf-8')
+        ).digest(), 0
+
+    def __invalidate_digests(self):
+        config = self
+        while config is not None:
+            config.digest_cache = None
+            config = config.parent_config
 
-    def dump_to_file(self, filepath, exclude=[]):
+    def dump_to_file(self, filepath, exclude=[], resolve_refs=True, format='yaml'):
         with open(filepath, 'w') as outfile:
-            yaml.dump(self.asdict(exclude=exclude), outfile)
+            self.dump_to_stream(outfile, exclude=exclude, resolve_refs=resolve_refs, format=format)
+
+    def dump_to_stream(self, stream, exclude=[], resolve_refs=True, format='yaml'):
+        # Writes the config while walking it, without building
+        # an intermediate dict. If resolve_refs is False, references
+        # are written as '<ref>' strings.
+        events = self.iter_events(exclude=exclude, resolve_refs=resolve_refs, sort_keys=format == 'yaml')
+        if format == 'yaml':
+            write_yaml_events(events, stream)
+        elif format == 'json':
+            write_json_events(events, stream)
+        else:
+            raise ValueError(f'Unknown format "{format}"!')
 
     def get_root_config(self):
         return self.get_root_config_of(self)
 
     def get_root_config_of(self, config):
-        if config.path == '/':
-            return config
-        else:
-            return config.parent_config.get_root_config()
+        return config.root_config
 
     def cond_read(self, key, if_param=None, equals=None, default=None, expects_if_param=True):
         assert if_param is not None and equals is not None
@@ -348,37 +1414,515 @@ class CoolConfig:
         else:
             return default
 
+    # Index
+
+    def build_index(self):
+        # Builds a flat index that maps the absolute path of every
+        # item, including list elements, to the config containing it.
+        # Lookups then first probe the index and only walk the config
+        # if the path leads through a reference or is missing.
+        # The index is kept up to date by __setitem__ and update.
+        # Trees with get item hooks or instrumentation are always walked.
+        root = self.get_root_config()
+        index = PathIndex()
+        index.paths[root] = root.path
+        index.hooked = root.get_item_hook_fn is not None
+        for key, item in root.config.items():
+            if is_indexable_key(key):
+                root.__index_item(index, f'/{key}', key, item)
+        root.path_index = index
+        return index
+
+    def drop_index(self):
+        self.get_root_config().path_index = None
+
+    def __index_item(self, index, path, key, item, list_index=None):
+        stack = [(self, path, key, item, list_index)]
+        while stack:
+            location, path, key, item, list_index = stack.pop()
+            index.entries[path] = (location, key, list_index)
+            if isinstance(item, CoolConfig):
+                index.paths[item] = path
+                if item.get_item_hook_fn is not None:
+                    index.hooked = True
+                for item_key, item_item in item.config.items():
+                    if is_indexable_key(item_key):
+                        stack.append((item, f'{path}/{item_key}', item_key, item_item, None))
+            elif isinstance(item, list) and list_index is None:
+                for i, item_item in enumerate(item):
+                    stack.append((location, f'{path}[{i}]', key, item_item, i))
+
+    def __unindex_item(self, index, path, item, list_index=None):
+        stack = [(path, item, list_index)]
+        while stack:
+            path, item, list_index = stack.pop()
+            index.entries.pop(path, None)
+            if isinstance(item, CoolConfig):
+                index.paths.pop(item, None)
+                for key, item_item in item.config.items():
+                    stack.append((f'{path}/{key}', item_item, None))
+            elif isinstance(item, list) and list_index is None:
+                for i, item_item in enumerate(item):
+                    stack.append((f'{path}[{i}]', item_item, i))
+
     # Hooks
 
     def register_custom_get_item_hook(self, hook_fn):
-        self.get_item_hook_fn = hook_fn
+        if self.root_config.path_index is not None:
+            # Indexed lookups would skip the hooks
+            self.root_config.path_index.hooked = True
+        if self.root_config.instrumentation is not None:
+            # Keep recording accesses, see Instrumentation.attach
+            self.get_item_hook_fn.hook_fn = hook_fn
+        else:
+            self.get_item_hook_fn = hook_fn
+
+    def source_files(self):
+        # Returns the yaml files all loaded configs were read from
+        files = []
+        for config in self.iter_configs():
+            if config.source_path is not None and config.source_path not in files:
+                files.append(config.source_path)
+        return files
+
+    # Reloading
+
+    def reload_from_dict(self, config_dict):
+        # Changes this config in place to match config_dict, the new content
+        # of the file it was read from. Sub-configs and imports of the same
+        # files keep their identity, only changed items are parsed again.
+        # Returns the absolute paths of all added, changed and removed items.
+        # See cool_config.reload.
+        changed = []
+        stack = [(self, config_dict)]
+        while stack:
+            config, config_dict = stack.pop()
+            base = config.path
+            for key, item in config_dict.items():
+                if isinstance(key, str):
+                    key = sys.intern(key)
+                old_item = config.config.get(key, _end_of_items)
+                if config.__is_same_config(old_item, item):
+                    stack.append((old_item, item))
+                    continue
+                if config.__is_same_item(old_item, item):
+                    continue
+                if isinstance(item, list) and isinstance(old_item, list) and len(item) == len(old_item):
+                    # Lists of configs are reloaded item by item
+                    for i, (old_item_item, item_item) in enumerate(zip(old_item, item)):
+                        if config.__is_same_config(old_item_item, item_item):
+                            stack.append((old_item_item, item_item))
+                        elif not config.__is_same_item(old_item_item, item_item):
+                            config.__set_item(key, i, item_item)
+                            changed.append(os.path.join(base, f'{key}[{i}]'))
+                    continue
+                config.__set_item(key, None, item)
+                changed.append(os.path.join(base, str(key)))
+
+            for key in [key for key in config.config if key not in config_dict]:
+                config.__remove_item(key)
+                changed.append(os.path.join(base, str(key)))
+
+        if changed:
+            self.root_config.generation += 1
+        return changed
+
+    def watch(self, callback=None, interval=None):
+        # Returns a watcher that reloads changed source files in place,
+        # see cool_config.reload. If interval is given, files are polled
+        # in a background thread, otherwise call check() on the watcher.
+        from cool_config.reload import ConfigWatcher
+        watcher = ConfigWatcher(self)
+        if callback is not None:
+            watcher.add_callback(callback)
+        if interval is not None:
+            watcher.interval = interval
+            watcher.start()
+        return watcher
+
+    def __is_same_config(self, old_item, item):
+        # Configs that are not imports are reloaded in place
+        return isinstance(item, dict) and isinstance(old_item, CoolConfig) and old_item.source_path is None
+
+    def __is_same_item(self, old_item, item):
+        if isinstance(item, str) and item.startswith('<import>'):
+            import_path = remove_from_start('<import>', item)
+            if isinstance(old_item, LazyImport):
+                return old_item.import_path == import_path
+            return (
+                isinstance(old_item, CoolConfig)
+                and old_item.source_path == self.__parse_import_path(import_path)
+            )
+        if isinstance(old_item, (CoolConfig, LazyImport)) or type(old_item) is not type(item):
+            return False
+        if isinstance(item, list) and not all(self.__is_plain_item(item_item) for item_item in item):
+            return False
+        return old_item == item
+
+    def __remove_item(self, key):
+        self.__invalidate_digests()
+        old_value = self.config.pop(key)
+        index = self.root_config.path_index
+        if index is not None:
+            self.__unindex_item(index, os.path.join(self.path, key), old_value)
+
+    # Variants
+
+    def variant(self, overrides):
+        # Returns a copy of the whole config with overrides, a dict of
+        # paths to values, set like CLI args. Configs are shared with this
+        # config until they are accessed in the variant, so creating a
+        # variant only copies the configs on the paths to the overrides.
+        # References resolve against the variant. This config must not be
+        # changed while its variants are used, freeze it to be sure. Lists
+        # are shared as well, do not change lists read from a variant in place.
+        root = self.get_root_config()
+        variant = CoolConfig('/', {}, None, root.root_dir, lazy=root.lazy)
+        variant.source_path = root.source_path
+        variant.source_args = root.source_args
+        variant.config = variant.__share_items(root.config)
+        for path, value in overrides.items():
+            variant[path] = value
+        return variant
+
+    def sweep(self, overrides):
+        # Yields a variant for every combination of a grid of
+        # {path: [values]} or for every dict of a list of overrides
+        if isinstance(overrides, dict):
+            paths = list(overrides.keys())
+            overrides = (
+                dict(zip(paths, values))
+                for values in itertools.product(*overrides.values())
+            )
+        for variant_overrides in overrides:
+            yield self.variant(variant_overrides)
+
+    def __copy_config(self, key, config):
+        # Only the last path segment is used by __init__
+        copy = type(self)(str(key), {}, self, self.root_dir, lazy=config.lazy)
+        copy.source_path = config.source_path
+        copy.config = copy.__share_items(config.config)
+        return copy
+
+    def __share_items(self, config_dict):
+        return {
+            key: self.__share_item(key, item) if isinstance(item, (CoolConfig, list)) else item
+            for key, item in config_dict.items()
+        }
+
+    def __share_item(self, key, item):
+        if isinstance(item, CoolConfig):
+            return SharedConfig(item)
+        if isinstance(item, list) and CoolConfig.__contains_config(item):
+            # Lists can not hold placeholders, configs in lists are copied directly
+            return [
+                self.__copy_config(f'{key}[{i}]', item_item)
+                if isinstance(item_item, CoolConfig)
+                else self.__share_item(f'{key}[{i}]', item_item)
+                for i, item_item in enumerate(item)
+            ]
+        return item
+
+    # Pickling
+    # Caches, the index, hooks and instrumentation are not pickled
+
+    def __getstate__(self):
+        return {
+            'key': self.key,
+            'parent_config': self.parent_config,
+            'root_dir': self.root_dir,
+            'lazy': self.lazy,
+            'root_config': self.root_config,
+            'digest_cache': self.digest_cache,
+            'source_path': self.source_path,
+            'source_args': self.source_args,
+            'config': self.config,
+        }
+
+    def __setstate__(self, state):
+        # Attributes added later may be missing in older pickles
+        self.source_path = None
+        self.source_args = None
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.generation = 0
+        self.ref_cache = None
+        self.get_item_hook_fn = None
+        self.path_index = None
+        self.instrumentation = None
+        self.import_paths = None
+
+    # Snapshots
+
+    def freeze(self, index=True):
+        # Returns an immutable snapshot of the whole config, at the same
+        # path as this config. All imports are loaded and all references
+        # are resolved up front, so the snapshot can be read from many
+        # threads without locking. As the snapshot never changes,
+        # it gets a flat index (see build_index) by default.
+        # Its lists are read-only as well, see FrozenList.
+        root = self.get_root_config()
+        frozen = FrozenCoolConfig('/', root.asdict(resolve_refs=False), None, root.root_dir)
+        for config in frozen.iter_configs():
+            for key, item in config.config.items():
+                if isinstance(item, SEQUENCE_TYPES):
+                    config.config[key] = freeze_sequence(item)
+        # Resolving in dependency order keeps reference chains from recursing
+        frozen.ref_graph().prime_caches()
+        for config in frozen.iter_configs():
+            config.__resolve_all_references()
+        if index:
+            CoolConfig.build_index(frozen)
+        if self is root:
+            return frozen
+        return frozen[self.path]
+
+    def __resolve_all_references(self):
+        for item in self.config.values():
+            if isinstance(item, list):
+                refs = [item_item for item_item in item if self.__is_reference(item_item)]
+            elif self.__is_reference(item):
+                refs = [item]
+            else:
+                continue
+            for ref in refs:
+                try:
+                    self.__resolve_reference(ref)
+                except (RuntimeError, ValueError, IndexError, RecursionError):
+                    # Broken references raise once they are read
+                    pass
+
+    def compile(self):
+        # Returns a read-only namespace of this config with all references
+        # resolved, for attribute access in hot loops: cfg.model.encoder.dim.
+        # Later writes to the config are not reflected. See cool_config.namespace
+        # for how keys are mapped to attribute names.
+        from cool_config.namespace import compile_config
+        return compile_config(self)
+
+    # References
+
+    def ref_graph(self):
+        # Dependency graph of all references of the whole config,
+        # lazy imports are loaded. See cool_config.refs.
+        from cool_config.refs import RefGraph
+        return RefGraph(self)
+
+    def validate_refs(self):
+        # Raises a RuntimeError listing all dangling references and
+        # reference cycles at once. Returns the reference graph otherwise.
+        graph = self.ref_graph()
+        if not graph.is_valid():
+            raise RuntimeError(f'Invalid references!\n{graph.get_error_message()}')
+        return graph
+
+    # Diff
+
+    def diff(self, other):
+        # Added, removed and changed paths from this config to other.
+        # Identical sub-configs are skipped by their digests. See cool_config.diff.
+        from cool_config.diff import ConfigDiff
+        return ConfigDiff(self, other)
+
+    # Instrumentation
+
+    def enable_instrumentation(self):
+        # Records access counts, lookup times and reference chain
+        # depths for the whole config until disable_instrumentation
+        # is called. Without instrumentation, lookups have no overhead.
+        from cool_config.instrumentation import Instrumentation
+        root = self.get_root_config()
+        if root.instrumentation is None:
+            root.instrumentation = Instrumentation(root)
+            for config in root.iter_configs():
+                root.instrumentation.attach(config)
+        return root.instrumentation
+
+    def disable_instrumentation(self):
+        root = self.get_root_config()
+        instrumentation = root.instrumentation
+        if instrumentation is not None:
+            root.instrumentation = None
+            for config in root.iter_configs():
+                instrumentation.detach(config)
+        return instrumentation
+
+    def iter_configs(self):
+        # Yields this config and all loaded sub-configs, including the ones in lists
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, CoolConfig):
+                yield item
+                stack.extend(item.config.values())
+            elif isinstance(item, list):
+                stack.extend(item)
 
     # Dict Ops
 
-    def asdict(self, exclude=[]):
-        def __parse_entry(v):
-            if isinstance(v, CoolConfig):
-                return v.asdict(exclude=exclude)
-            if isinstance(v, list):
-                res = []
-                for elem in v:
-                    res.append(__parse_entry(elem))
-                return res
-            return v
+    def asdict(self, exclude=[], resolve_refs=True):
+        config_dict = None
+        containers = []
+        key = None
+        for event in self.iter_events(exclude=exclude, resolve_refs=resolve_refs):
+            kind = event[0]
+            if kind == KEY_EVENT:
+                key = event[1]
+                continue
+            if kind == END_EVENT:
+                containers.pop()
+                continue
+
+            if kind == MAPPING_START_EVENT:
+                value = {}
+            elif kind == SEQUENCE_START_EVENT:
+                value = []
+            else:
+                value = event[1]
+
+            if not containers:
+                config_dict = value
+            elif isinstance(containers[-1], dict):
+                containers[-1][key] = value
+            else:
+                containers[-1].append(value)
 
-        config_dict = {}
-        for k, v in self.items():
-            if not k in exclude:
-                config_dict[k] = __parse_entry(v)
+            if kind != VALUE_EVENT:
+                containers.append(value)
         return config_dict
 
+    def iter_events(self, exclude=[], resolve_refs=True, sort_keys=False):
+        # Walks the config iteratively and yields (kind, value) events:
+        # MAPPING_START_EVENT and SEQUENCE_START_EVENT open a config or list,
+        # END_EVENT closes it with its start kind as value,
+        # KEY_EVENT is followed by the events of the item and
+        # VALUE_EVENT holds any other item.
+        # Like __getitem__, references are only resolved for config keys.
+        # A reference to a config that is being walked, e.g. to a parent,
+        # would never end and raises a RuntimeError.
+        yield MAPPING_START_EVENT, None
+        stack = [(MAPPING_START_EVENT, self.__iter_items(exclude, resolve_refs, sort_keys), self)]
+        walking = {self}
+        while stack:
+            kind, items, config = stack[-1]
+            item = next(items, _end_of_items)
+            if item is _end_of_items:
+                stack.pop()
+                walking.discard(config)
+                yield END_EVENT, kind
+                continue
+
+            if kind == MAPPING_START_EVENT:
+                key, item = item
+                yield KEY_EVENT, key
+
+            if isinstance(item, CoolConfig):
+                if item in walking:
+                    location = config.path if kind == SEQUENCE_START_EVENT else os.path.join(config.path, str(key))
+                    raise RuntimeError(
+                        f'Config "{item.path}" contains itself through the reference at "{location}"!'
+                    )
+                walking.add(item)
+                yield MAPPING_START_EVENT, None
+                stack.append((MAPPING_START_EVENT, item.__iter_items(exclude, resolve_refs, sort_keys), item))
+            elif isinstance(item, SEQUENCE_TYPES):
+                yield SEQUENCE_START_EVENT, None
+                stack.append((SEQUENCE_START_EVENT, iter(item), config))
+            else:
+                yield VALUE_EVENT, item
+
+    def __iter_items(self, exclude, resolve_refs, sort_keys):
+        keys = list(self.config.keys())
+        if sort_keys:
+            try:
+                keys = sorted(keys)
+            except TypeError:
+                pass
+        for key in keys:
+            if key in exclude:
+                continue
+            if resolve_refs:
+                yield key, self.__getitem__(key)
+            else:
+                item = self.config[key]
+                if isinstance(item, LazyImport):
+                    item = self.__load_lazy_item(key, item)
+                yield key, item
+
     def update(self, dict, prefix=''):
+        self.root_config.generation += 1
+        self.__invalidate_digests()
+        index = self.root_config.path_index
         for k, v in dict.items():
-            self.config[f'{prefix}{k}'] = v
+            key = f'{prefix}{k}'
+            old_value = self.config.get(key)
+            self.config[key] = v
+            if index is not None and is_indexable_key(key):
+                path = os.path.join(self.path, key)
+                self.__unindex_item(index, path, old_value)
+                self.__index_item(index, path, key, v)
 
     def items(self):
         for k in self.config.keys():
             yield k, self.__getitem__(k)
 
     def keys(self):
-        return self.config.keys()
\ No newline at end of file
+        return self.config.keys()
+
+class FrozenCoolConfig(CoolConfig):
+    # Immutable snapshot, see CoolConfig.freeze.
+    # Its generation never changes, so resolved references stay cached.
+    __slots__ = ()
+
+    def __setitem__(self, key, value):
+        raise TypeError(f'Can not set "{key}", the config is frozen!')
+
+    def update(self, dict, prefix=''):
+        raise TypeError('Can not update a frozen config!')
+
+    def reload_from_dict(self, config_dict):
+        raise TypeError('Can not reload a frozen config!')
+
+    def watch(self, callback=None, interval=None):
+        raise TypeError('Can not reload a frozen config!')
+
+    def freeze(self, index=True):
+        return self
+
+    def build_index(self):
+        raise TypeError('Can not change the index of a frozen config!')
+
+    def drop_index(self):
+        raise TypeError('Can not change the index of a frozen config!')
+
+    def enable_instrumentation(self):
+        raise TypeError('Can not instrument a frozen config!')
+
+def raise_frozen(self, *args, **kwargs):
+    raise TypeError('Can not change a list of a frozen config!')
+
+class FrozenList(list):
+    # Lists of a frozen config, they are still lists so that they are
+    # handled like the lists of any other config.
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = raise_frozen
+    append = extend = insert = pop = remove = clear = sort = reverse = raise_frozen
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+class FrozenArray(array.array):
+    # Compact lists of a frozen config, see FrozenList. The buffer of
+    # the array can still be written through a memoryview.
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = raise_frozen
+    append = extend = insert = pop = remove = reverse = byteswap = raise_frozen
+    frombytes = fromfile = fromlist = fromunicode = raise_frozen
+
+    def __reduce__(self):
+        return FrozenArray, (self.typecode, self.tobytes())
+
+def freeze_sequence(item):
+    if isinstance(item, array.array):
+        return FrozenArray(item.typecode, item)
+    return FrozenList([freeze_sequence(item_item) if isinstance(item_item, SEQUENCE_TYPES) else item_item for item_item in item])
@@ -0,0 +1,205 @@
+# Structural diff
+#
+# Compares two config trees as they are written and reports the paths of
+# added, removed and changed parameters. Configs are compared as a whole
+# first: configs that are the same object, shared by a variant or that
+# have the same structural digest (see CoolConfig.hash with
+# resolve_refs=False) are skipped, so
+# the cost depends on the number of changes once the digests are cached.
+# A reference that is written the same in both trees is not reported
+# even if its target changed, the target itself is.
+#
+# Every reported value is a (raw, resolved) pair. raw is the item as it
+# is written, resolved the item as __getitem__ returns it. Configs are
+# given as dicts and arrays as lists.
+import json
+
+from cool_config.config import (
+    CoolConfig,
+    LazyImport,
+    SharedConfig,
+    get_import_path,
+    is_indexable_key,
+    SEQUENCE_TYPES,
+)
+from cool_config.refs import is_reference
+
+class ConfigDiff:
+    # added:   path -> (raw, resolved) of parameters only in the new config
+    # removed: path -> (raw, resolved) of parameters only in the old config
+    # changed: path -> ((raw, resolved) old, (raw, resolved) new)
+    __slots__ = ('added', 'removed', 'changed')
+
+    def __init__(self, old, new):
+        self.added = {}
+        self.removed = {}
+        self.changed = {}
+        prefix = '' if old.path == '/' else old.path
+        self.__compare_configs(old, new, prefix)
+
+    def is_empty(self):
+        return not self.added and not self.removed and not self.changed
+
+    def asdict(self):
+        def entry(values):
+            return {'raw': values[0], 'resolved': values[1]}
+        return {
+            'added': {path: entry(values) for path, values in self.added.items()},
+            'removed': {path: entry(values) for path, values in self.removed.items()},
+            'changed': {
+                path: {'old': entry(old), 'new': entry(new)}
+                for path, (old, new) in self.changed.items()
+            },
+        }
+
+    def iter_lines(self):
+        # One line per path, '-' removed, '+' added and '~' changed
+        for path, values in self.removed.items():
+            yield f'- {path}: {format_values(values)}'
+        for path, values in self.added.items():
+            yield f'+ {path}: {format_values(values)}'
+        for path, (old, new) in self.changed.items():
+            yield f'~ {path}: {format_values(old)} -> {format_values(new)}'
+
+    def __compare_configs(self, old, new, prefix):
+        stack = [(old, new, prefix)]
+        while stack:
+            old, new, prefix = stack.pop()
+            for key, old_item in list(old.config.items()):
+                path = f'{prefix}/{key}'
+                if key not in new.config:
+                    self.__add_all(self.removed, old, key, None, old_item, path)
+                    continue
+                new_item = new.config[key]
+                if is_same_config(old, old_item, new, new_item):
+                    continue
+                self.__compare(
+                    (old, key, None, load_item(old, key, old_item)),
+                    (new, key, None, load_item(new, key, new_item)),
+                    path,
+                    stack,
+                )
+            for key, new_item in list(new.config.items()):
+                if key not in old.config:
+                    self.__add_all(self.added, new, key, None, new_item, f'{prefix}/{key}')
+
+    def __compare(self, old_site, new_site, path, stack):
+        # Sites are (config, key, list_index, item)
+        old_item = old_site[3]
+        new_item = new_site[3]
+        if isinstance(old_item, CoolConfig) and isinstance(new_item, CoolConfig):
+            if old_item is not new_item and old_item.hash(resolve_refs=False) != new_item.hash(resolve_refs=False):
+                stack.append((old_item, new_item, path))
+            return
+
+        if is_config_list(old_item) and is_config_list(new_item):
+            for i in range(max(len(old_item), len(new_item))):
+                item_path = f'{path}[{i}]'
+                if i >= len(new_item):
+                    self.__add_all(self.removed, old_site[0], old_site[1], i, old_item[i], item_path)
+                elif i >= len(old_item):
+                    self.__add_all(self.added, new_site[0], new_site[1], i, new_item[i], item_path)
+                else:
+                    self.__compare(
+                        old_site[:2] + (i, old_item[i]),
+                        new_site[:2] + (i, new_item[i]),
+                        item_path,
+                        stack,
+                    )
+            return
+
+        if is_leaf(old_item) and is_leaf(new_item):
+            if not is_same_value(old_item, new_item):
+                self.changed[path] = (get_values(*old_site), get_values(*new_site))
+            return
+
+        # A config or list of configs was replaced by something else
+        self.__add_all(self.removed, *old_site, path)
+        self.__add_all(self.added, *new_site, path)
+
+    def __add_all(self, target, config, key, list_index, item, path):
+        # Adds every parameter below item to target
+        if list_index is None:
+            item = load_item(config, key, item)
+        stack = [(config, key, list_index, item, path)]
+        while stack:
+            config, key, list_index, item, path = stack.pop()
+            if isinstance(item, CoolConfig) and item.config:
+                for item_key in reversed(list(item.config.keys())):
+                    item_item = load_item(item, item_key, item.config[item_key])
+                    stack.append((item, item_key, None, item_item, f'{path}/{item_key}'))
+            elif is_config_list(item) and item:
+                for i in reversed(range(len(item))):
+                    stack.append((config, key, i, item[i], f'{path}[{i}]'))
+            else:
+                target[path] = get_values(config, key, list_index, item)
+
+def is_same_config(old, old_item, new, new_item):
+    # Checks without loading placeholders whether both items are the same config
+    old_target = old_item.config if isinstance(old_item, SharedConfig) else old_item
+    new_target = new_item.config if isinstance(new_item, SharedConfig) else new_item
+    if old_target is new_target:
+        return isinstance(old_target, CoolConfig)
+    if isinstance(old_target, CoolConfig) and isinstance(new_target, CoolConfig):
+        return old_target.hash(resolve_refs=False) == new_target.hash(resolve_refs=False)
+    if (
+        isinstance(old_target, LazyImport)
+        and isinstance(new_target, LazyImport)
+        and not isinstance(old_target, SharedConfig)
+        and not isinstance(new_target, SharedConfig)
+    ):
+        # Both import the same file and none is loaded yet
+        return (
+            get_import_path(old.root_dir, old_target.import_path)
+            == get_import_path(new.root_dir, new_target.import_path)
+        )
+    return False
+
+def load_item(config, key, item):
+    if isinstance(item, LazyImport):
+        return config[key]
+    return item
+
+def is_config_list(item):
+    return isinstance(item, list) and any(
+        isinstance(item_item, (CoolConfig, list)) for item_item in item
+    )
+
+def is_leaf(item):
+    return not isinstance(item, CoolConfig) and not is_config_list(item)
+
+def is_same_value(old, new):
+    if old is new:
+        return True
+    if isinstance(old, SEQUENCE_TYPES) and isinstance(new, SEQUENCE_TYPES):
+        return len(old) == len(new) and all(
+            is_same_value(old_item, new_item) for old_item, new_item in zip(old, new)
+        )
+    if isinstance(old, dict) and isinstance(new, dict):
+        return old.keys() == new.keys() and all(
+            is_same_value(old[key], new[key]) for key in old
+        )
+    return type(old) is type(new) and old == new
+
+def get_values(config, key, list_index, item):
+    raw = export_value(item, resolve_refs=False)
+    if list_index is None and is_reference(item) and is_indexable_key(key):
+        # Like __getitem__, only references of config keys are resolved
+        return raw, export_value(config[key], resolve_refs=True)
+    if isinstance(item, CoolConfig):
+        return raw, export_value(item, resolve_refs=True)
+    return raw, raw
+
+def export_value(item, resolve_refs):
+    if isinstance(item, CoolConfig):
+        return item.asdict(resolve_refs=resolve_refs)
+    if isinstance(item, SEQUENCE_TYPES):
+        return [export_value(item_item, resolve_refs) for item_item in item]
+    return item
+
+def format_values(values):
+    raw, resolved = values
+    text = json.dumps(raw, default=str)
+    if is_reference(raw):
+        text += f' ({json.dumps(resolved, default=str)})'
+    return text
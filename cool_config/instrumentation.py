@@ -0,0 +1,143 @@
+import time
+
+from cool_config.config import CoolConfig, compile_path, normalize_path, KEY_TOKEN, SEQUENCE_TYPES
+
+class InstrumentedCoolConfig(CoolConfig):
+    # Configs of an instrumented tree are switched to this class,
+    # so that lookups of other configs are not slowed down.
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        instrumentation = self.root_config.instrumentation
+        start = time.perf_counter()
+        try:
+            return CoolConfig.__getitem__(self, key)
+        finally:
+            if instrumentation is not None:
+                instrumentation.record_lookup(self, key, time.perf_counter() - start)
+
+class AccessHook:
+    # Installed as get_item_hook_fn of every instrumented config.
+    # Records every key that is read while walking a path or
+    # resolving a reference and calls the custom hook of the config.
+    __slots__ = ('instrumentation', 'path', 'hook_fn')
+
+    def __init__(self, instrumentation, path, hook_fn):
+        self.instrumentation = instrumentation
+        self.path = path if path != '/' else ''
+        self.hook_fn = hook_fn
+
+    def __call__(self, key, item):
+        self.instrumentation.read_paths.add(f'{self.path}/{key}')
+        if self.hook_fn is not None:
+            self.hook_fn(key, item)
+
+class Instrumentation:
+
+    def __init__(self, root):
+        self.root = root
+        # Absolute path -> [count, cumulative time]
+        self.lookups = {}
+        # Absolute paths of all keys that were read
+        self.read_paths = set()
+
+    def attach(self, config):
+        config.__class__ = InstrumentedCoolConfig
+        if not isinstance(config.get_item_hook_fn, AccessHook):
+            config.get_item_hook_fn = AccessHook(self, config.path, config.get_item_hook_fn)
+
+    def detach(self, config):
+        config.__class__ = CoolConfig
+        if isinstance(config.get_item_hook_fn, AccessHook):
+            config.get_item_hook_fn = config.get_item_hook_fn.hook_fn
+
+    def reset(self):
+        self.lookups = {}
+        self.read_paths = set()
+
+    def record_lookup(self, config, key, elapsed):
+        if isinstance(key, tuple):
+            key = key[0]
+        path = normalize_path(config.path, key)
+        if path is None:
+            path = f'{config.path}:{key}'
+        else:
+            self.read_paths.add(path)
+            # Reading a list element reads the list
+            if path.endswith(']'):
+                self.read_paths.add(path[:path.rindex('[')])
+
+        entry = self.lookups.get(path)
+        if entry is None:
+            self.lookups[path] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def report(self):
+        # Returns one entry per looked up path, sorted by cumulative time
+        report = []
+        for path, (count, total_time) in self.lookups.items():
+            report.append({
+                'path': path,
+                'count': count,
+                'time': total_time,
+                'ref_depth': self.ref_depth(path),
+            })
+        report.sort(key=lambda entry: entry['time'], reverse=True)
+        return report
+
+    def unused_keys(self):
+        # Returns the absolute paths of all params that were never read.
+        # Imports that were never loaded are reported as a whole.
+        unused = []
+        stack = [('', self.root)]
+        while stack:
+            path, config = stack.pop()
+            for key, item in config.config.items():
+                item_path = f'{path}/{key}'
+                if isinstance(item, CoolConfig):
+                    stack.append((item_path, item))
+                elif isinstance(item, list) and any(isinstance(i, CoolConfig) for i in item):
+                    for i, item_item in enumerate(item):
+                        if isinstance(item_item, CoolConfig):
+                            stack.append((f'{item_path}[{i}]', item_item))
+                elif item_path not in self.read_paths:
+                    unused.append(item_path)
+        unused.sort()
+        return unused
+
+    def ref_depth(self, path):
+        # Number of references that are followed to resolve the item
+        # at the absolute path, computed from the raw config
+        depth = 0
+        seen = set()
+        while path is not None and path not in seen:
+            seen.add(path)
+            found = self.__find_raw_item(path)
+            if found is None:
+                break
+            config, item = found
+            if not (isinstance(item, str) and item.startswith('<ref>')):
+                break
+            depth += 1
+            path = normalize_path(config.path, item[len('<ref>'):])
+        return depth
+
+    def __find_raw_item(self, path):
+        config = self.root
+        tokens = [token for token in compile_path(path) if token[0] == KEY_TOKEN]
+        for i, (_, key, list_index) in enumerate(tokens):
+            if not config.has_key(key):
+                return None
+            item = config.config[key]
+            if list_index is not None:
+                if not isinstance(item, SEQUENCE_TYPES) or len(item) <= list_index:
+                    return None
+                item = item[list_index]
+            if i == len(tokens) - 1:
+                return config, item
+            if not isinstance(item, CoolConfig):
+                return None
+            config = item
+        return None
@@ -0,0 +1,131 @@
+# Compiled namespaces
+#
+# CoolConfig.compile turns a config into a read-only tree of objects with
+# one slot per key, so values are read with plain attribute access
+# (cfg.model.encoder.dim) instead of parsing a path on every lookup.
+# All references are resolved while compiling, lists become tuples and
+# configs that are referenced from several places are compiled once.
+# Classes are generated per set of keys and shared between all configs
+# with the same keys.
+#
+# Keys are mapped to attribute names as follows:
+#   - every character that is not allowed in an identifier becomes '_'
+#   - names that are empty or start with a digit or '__' get a 'k' prefix
+#   - keywords and the names of the namespace API ('_asdict', '_fields',
+#     '_keys') get a '_' suffix
+# Two keys of the same config that map to the same name raise a ValueError.
+# Every key can still be read by its original name with ns[key].
+import re
+import keyword
+import reprlib
+
+from cool_config.config import CoolConfig, is_indexable_key, SEQUENCE_TYPES
+
+RESERVED_NAMES = frozenset(['_asdict', '_fields', '_keys'])
+
+_classes = {}
+
+def get_attribute_name(key):
+    name = re.sub(r'\W', '_', str(key), flags=re.ASCII)
+    if not name or name[0].isdigit() or name.startswith('__'):
+        name = 'k' + name
+    if keyword.iskeyword(name) or name in RESERVED_NAMES:
+        name += '_'
+    return name
+
+class CompiledConfig:
+    # Base class of all generated namespace classes
+    __slots__ = ()
+    _fields = ()
+    _keys = ()
+
+    def __getitem__(self, key):
+        try:
+            index = self._keys.index(key)
+        except ValueError:
+            raise KeyError(key) from None
+        return getattr(self, self._fields[index])
+
+    def __setattr__(self, name, value):
+        raise TypeError('Compiled configs are read-only!')
+
+    def __delattr__(self, name):
+        raise TypeError('Compiled configs are read-only!')
+
+    @reprlib.recursive_repr()
+    def __repr__(self):
+        items = ', '.join(f'{name}={getattr(self, name)!r}' for name in self._fields)
+        return f'{type(self).__name__}({items})'
+
+    def _asdict(self):
+        # The original keys and values, nested namespaces as dicts
+        return {
+            key: export_value(getattr(self, name))
+            for key, name in zip(self._keys, self._fields)
+        }
+
+def get_namespace_class(keys):
+    cls = _classes.get(keys)
+    if cls is None:
+        fields = tuple(get_attribute_name(key) for key in keys)
+        if len(set(fields)) != len(fields):
+            duplicates = sorted({name for name in fields if fields.count(name) > 1})
+            raise ValueError(
+                f'Keys {[key for key in keys if get_attribute_name(key) in duplicates]} '
+                f'map to the same attribute names {duplicates}!'
+            )
+        cls = type('CompiledConfig', (CompiledConfig,), {
+            '__slots__': fields,
+            '_fields': fields,
+            '_keys': keys,
+        })
+        _classes[keys] = cls
+    return cls
+
+def compile_config(config):
+    return Compiler().compile(config)
+
+class Compiler:
+    # Builds the namespaces of one config tree. Configs are memoized,
+    # so references to a config share its namespace and references
+    # to a parent config do not recurse forever.
+
+    def __init__(self):
+        self.compiled = {}
+
+    def compile(self, item):
+        if isinstance(item, CoolConfig):
+            return self.__compile_config(item)
+        if isinstance(item, dict):
+            # Raw dicts can be set by update
+            return self.__build(tuple(item.keys()), list(item.values()), id(item))
+        if isinstance(item, SEQUENCE_TYPES):
+            return tuple(self.compile(item_item) for item_item in item)
+        return item
+
+    def __compile_config(self, config):
+        namespace = self.compiled.get(id(config))
+        if namespace is not None:
+            return namespace
+        keys = tuple(config.config.keys())
+        values = [
+            config[key] if is_indexable_key(key) else config.config[key]
+            for key in keys
+        ]
+        return self.__build(keys, values, id(config))
+
+    def __build(self, keys, values, memo_key):
+        cls = get_namespace_class(keys)
+        namespace = cls.__new__(cls)
+        self.compiled[memo_key] = namespace
+        set_slot = object.__setattr__
+        for name, value in zip(cls._fields, values):
+            set_slot(namespace, name, self.compile(value))
+        return namespace
+
+def export_value(item):
+    if isinstance(item, CompiledConfig):
+        return item._asdict()
+    if isinstance(item, tuple):
+        return [export_value(item_item) for item_item in item]
+    return item
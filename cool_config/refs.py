@@ -0,0 +1,251 @@
+# Reference graph
+#
+# Collects every <ref> of a config tree, including all imports, and
+# resolves them without recursion. A reference depends on every
+# reference it passes on its way to the target and on the target itself
+# if that is a reference. References are resolved depth first on an
+# explicit stack, a reference is walked again once a dependency is
+# resolved. Every reference ends up either in the resolution order,
+# in the dangling references, in a cycle or depends on one of those.
+# References to a config that contains them, directly or through other
+# references, resolve fine but make walking the config (asdict, dump)
+# endless. They are reported as well.
+from cool_config.config import (
+    CoolConfig,
+    LazyImport,
+    compile_path,
+    is_indexable_key,
+    PARENT_TOKEN,
+    ROOT_TOKEN,
+    SEQUENCE_TYPES,
+)
+
+REF_PREFIX = '<ref>'
+
+VISITING = 0
+RESOLVED = 1
+FAILED = 2
+
+def is_reference(item):
+    return isinstance(item, str) and item.startswith(REF_PREFIX)
+
+def get_ref_path(ref):
+    path = ref[len(REF_PREFIX):]
+    if path.endswith('/'):
+        path = path[:-1]
+    return path
+
+def get_configs(item):
+    # The configs of an item, including the ones in (nested) lists
+    if isinstance(item, CoolConfig):
+        return [item]
+    configs = []
+    if isinstance(item, list):
+        stack = [item]
+        while stack:
+            for item_item in stack.pop():
+                if isinstance(item_item, CoolConfig):
+                    configs.append(item_item)
+                elif isinstance(item_item, list):
+                    stack.append(item_item)
+    return configs
+
+class RefGraph:
+    # dependencies: source path -> source paths of the references it depends on
+    # order:        source paths of all resolvable references, dependencies first
+    # dangling:     (source path, ref, reason) of references that point nowhere
+    # cycles:       lists of source paths of references that depend on each other
+    # sites:        source path -> (config, key, list_index, ref)
+    # containing:   lists of source paths of references through which a
+    #               config contains itself
+    __slots__ = ('dependencies', 'order', 'dangling', 'cycles', 'sites', 'containing')
+
+    def __init__(self, config):
+        self.dependencies = {}
+        self.order = []
+        self.dangling = []
+        self.cycles = []
+        self.sites = {}
+        self.containing = []
+        root = config.get_root_config()
+        self.__collect(root)
+        results = self.__resolve()
+        self.dangling.sort()
+        self.__find_containing(root, results)
+
+    def is_valid(self):
+        return not self.dangling and not self.cycles and not self.containing
+
+    def get_error_message(self):
+        lines = []
+        for path, ref, reason in self.dangling:
+            lines.append(f'Dangling reference "{ref}" at "{path}": {reason}')
+        for cycle in self.cycles:
+            lines.append('Reference cycle: ' + ' -> '.join(cycle + [cycle[0]]))
+        for refs in self.containing:
+            lines.append('Config contains itself through references: ' + ' -> '.join(refs))
+        return '\n'.join(lines)
+
+    def prime_caches(self):
+        # Resolves all references in order, so that no lookup has to
+        # follow more than one reference that is not cached yet.
+        for path in self.order:
+            config, key, list_index, _ = self.sites[path]
+            if not is_indexable_key(key):
+                continue
+            config[key if list_index is None else f'{key}[{list_index}]']
+
+    def __collect(self, root):
+        # Walks the whole tree, lazy imports are loaded on the way
+        stack = [(root, '')]
+        while stack:
+            config, path = stack.pop()
+            for key, item in list(config.config.items()):
+                if isinstance(item, LazyImport):
+                    item = config[key]
+                item_path = f'{path}/{key}'
+                if isinstance(item, CoolConfig):
+                    stack.append((item, item_path))
+                elif isinstance(item, list):
+                    for i, item_item in enumerate(item):
+                        if isinstance(item_item, CoolConfig):
+                            stack.append((item_item, f'{item_path}[{i}]'))
+                        elif is_reference(item_item):
+                            self.sites[f'{item_path}[{i}]'] = (config, key, i, item_item)
+                elif is_reference(item):
+                    self.sites[item_path] = (config, key, None, item)
+
+    def __resolve(self):
+        # Source paths of the references that are stored in a config slot,
+        # these are the ones that can be passed while walking a path.
+        slots = {
+            (config, key): path
+            for path, (config, key, list_index, _) in self.sites.items()
+            if list_index is None
+        }
+        state = {}
+        results = {}
+        for path in self.sites:
+            if path in state:
+                continue
+            stack = [path]
+            while stack:
+                current = stack[-1]
+                if state.get(current, VISITING) != VISITING:
+                    stack.pop()
+                    continue
+                state[current] = VISITING
+
+                config, _, _, ref = self.sites[current]
+                kind, value, passed = self.__walk(config, get_ref_path(ref), slots, state, results)
+                self.dependencies[current] = passed
+                if kind == 'dependency':
+                    if state.get(value) == VISITING:
+                        cycle = stack[stack.index(value):]
+                        self.cycles.append(cycle)
+                        for member in cycle:
+                            state[member] = FAILED
+                    else:
+                        stack.append(value)
+                    continue
+
+                if kind == 'resolved':
+                    state[current] = RESOLVED
+                    results[current] = value
+                    self.order.append(current)
+                elif kind == 'dangling':
+                    state[current] = FAILED
+                    self.dangling.append((current, ref, value))
+                else:
+                    # A dependency is dangling or part of a cycle
+                    state[current] = FAILED
+                stack.pop()
+        return results
+
+    def __find_containing(self, root, results):
+        # Depth first search over configs, a config leads to its children
+        # and to the configs referenced by its keys. Like iter_events,
+        # references in lists are not followed. Every cycle found contains
+        # at least one reference, as the tree itself has no cycles.
+        references = {}
+        for path, (config, _, list_index, _) in self.sites.items():
+            if list_index is None and path in results:
+                targets = get_configs(results[path][0])
+                if targets:
+                    references.setdefault(config, []).extend((target, path) for target in targets)
+
+        state = {root: VISITING}
+        stack = [(root, None, iter(self.__get_edges(root, references)))]
+        while stack:
+            config, _, edges = stack[-1]
+            edge = next(edges, None)
+            if edge is None:
+                state[config] = RESOLVED
+                stack.pop()
+                continue
+            target, via = edge
+            target_state = state.get(target)
+            if target_state == VISITING:
+                start = next(i for i, entry in enumerate(stack) if entry[0] is target)
+                refs = [entry[1] for entry in stack[start + 1:] if entry[1] is not None]
+                self.containing.append(refs + [via] if via is not None else refs)
+            elif target_state is None:
+                state[target] = VISITING
+                stack.append((target, via, iter(self.__get_edges(target, references))))
+
+    def __get_edges(self, config, references):
+        # (config, source path of the reference or None for children)
+        for item in config.config.values():
+            for child in get_configs(item):
+                yield child, None
+        yield from references.get(config, ())
+
+    def __walk(self, config, path, slots, state, results):
+        # Follows path from config like CoolConfig.__get_item_from_path.
+        # Returns ('resolved', (item, location)), ('dangling', reason),
+        # ('dependency', source path) if a reference on the way is not
+        # resolved yet or ('failed', source path) if it can not be resolved,
+        # together with the source paths of all references on the way.
+        passed = []
+        tokens = compile_path(path)
+        last = len(tokens) - 1
+        for i, (kind, key, list_index) in enumerate(tokens):
+            if kind == PARENT_TOKEN:
+                if config.parent_config is None:
+                    return 'dangling', 'there is no parent config', passed
+                config = config.parent_config
+                continue
+
+            if kind == ROOT_TOKEN:
+                config = config.root_config
+                continue
+
+            if key not in config.config:
+                return 'dangling', f'missing key "{key}"', passed
+            item = config.config[key]
+            location = config
+            if isinstance(item, LazyImport):
+                item = config[key]
+
+            if is_reference(item):
+                dependency = slots[(config, key)]
+                passed.append(dependency)
+                dependency_state = state.get(dependency)
+                if dependency_state == FAILED:
+                    return 'failed', dependency, passed
+                if dependency_state != RESOLVED:
+                    return 'dependency', dependency, passed
+                item, location = results[dependency]
+
+            if list_index is not None:
+                if not isinstance(item, SEQUENCE_TYPES) or not -len(item) <= list_index < len(item):
+                    return 'dangling', f'no list item {key}[{list_index}]', passed
+                item = item[list_index]
+
+            if i == last:
+                return 'resolved', (item, location), passed
+
+            if not isinstance(item, CoolConfig):
+                return 'dangling', f'"{key}" is not a config', passed
+            config = item
+        return 'dangling', 'empty path', passed
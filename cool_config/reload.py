@@ -0,0 +1,189 @@
+# Hot reloading
+#
+# A ConfigWatcher tracks the yaml file of the root config and of every
+# loaded import and polls their modification times. When a file changed,
+# every config that was read from it is updated in place with
+# CoolConfig.reload_from_dict, so objects that are held elsewhere stay
+# valid and only the content of the changed file is parsed again.
+# Imports that are not loaded yet are remembered and tracked by the
+# first check after they were loaded. As the file may have changed since
+# it was loaded, that check reloads it once, which costs little if the
+# content is the same.
+# A file that can not be read or reloaded, e.g. because it is only
+# partly written, keeps its previous content in the config. The error is
+# passed to the error callbacks and the file is tried again once it
+# changes the next time.
+import os
+import warnings
+import threading
+
+from cool_config.config import CoolConfig, LazyImport, read_yaml_cached, merge_args
+
+def get_file_state(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def is_attached(config):
+    # Checks that config is still part of the tree of its root
+    while config.parent_config is not None:
+        parent = config.parent_config
+        if parent.config.get(config.key) is not config:
+            key, _, list_index = config.key.rpartition('[')
+            item = parent.config.get(key)
+            if not (
+                isinstance(item, list)
+                and list_index[:-1].isdigit()
+                and int(list_index[:-1]) < len(item)
+                and item[int(list_index[:-1])] is config
+            ):
+                return False
+        config = parent
+    return True
+
+# State of files that were loaded before they were tracked
+UNKNOWN_STATE = ()
+
+class ConfigWatcher:
+
+    def __init__(self, config, interval=1.0):
+        self.root = config.get_root_config()
+        self.interval = interval
+        self.callbacks = []
+        self.error_callbacks = []
+        # Maps source files to their (mtime, size) and the configs read from them
+        self.states = {}
+        # Maps files that failed to reload to their (mtime, size) and the error
+        self.errors = {}
+        self.configs = {}
+        self.tracked = set()
+        # (config, key) of lazy imports that were not loaded yet
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+        self.__track(self.root)
+
+    def add_callback(self, callback):
+        # callback is called with the list of changed paths after every reload
+        self.callbacks.append(callback)
+
+    def add_error_callback(self, callback):
+        # callback is called with the path and the error of every file that
+        # fails to reload. Without error callbacks, a warning is issued.
+        self.error_callbacks.append(callback)
+
+    def check(self):
+        # Polls all source files once and reloads the changed ones.
+        # Returns the absolute paths of all changed items.
+        with self.lock:
+            self.__track_loaded()
+            changed = []
+            errors = []
+            for path, state in list(self.states.items()):
+                new_state = get_file_state(path)
+                if new_state == state or (path in self.errors and self.errors[path][0] == new_state):
+                    continue
+                try:
+                    changed += self.__reload(path, new_state)
+                except Exception as e:
+                    self.errors[path] = (new_state, e)
+                    errors.append((path, e))
+        for path, error in errors:
+            if not self.error_callbacks:
+                warnings.warn(f'Could not reload "{path}": {error!r}', RuntimeWarning)
+            for callback in self.error_callbacks:
+                callback(path, error)
+        if changed:
+            for callback in self.callbacks:
+                callback(changed)
+        return changed
+
+    def start(self):
+        # Polls in a background thread every interval seconds
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.__run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+    def __run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                # Errors of callbacks must not stop polling
+                warnings.warn(f'Error while checking for changes: {e!r}', RuntimeWarning)
+
+    def __reload(self, path, state):
+        configs = []
+        for config in self.configs[path]:
+            if is_attached(config):
+                configs.append(config)
+            else:
+                self.tracked.discard(config)
+        self.configs[path] = configs
+        if not configs:
+            del self.states[path]
+            del self.configs[path]
+            self.errors.pop(path, None)
+            return []
+        if state is None:
+            # Deleted files keep their last content until they are written again
+            return []
+
+        config_dict = read_yaml_cached(path)
+        if not isinstance(config_dict, dict):
+            raise ValueError(f'"{path}" does not contain a config')
+        changed = []
+        for config in configs:
+            if config.source_args is None:
+                changed += config.reload_from_dict(config_dict)
+            else:
+                # Args given on the command line still overwrite the file
+                changed += config.reload_from_dict(merge_args(config_dict, config.source_args))
+            self.__track(config)
+        # Only recorded once the new content is in the config
+        self.states[path] = state
+        self.errors.pop(path, None)
+        return changed
+
+    def __track_loaded(self):
+        for config, key in list(self.pending):
+            item = config.config.get(key)
+            if isinstance(item, LazyImport):
+                continue
+            self.pending.discard((config, key))
+            if isinstance(item, CoolConfig) and is_attached(item):
+                self.__track(item, state=UNKNOWN_STATE)
+
+    def __track(self, config, state=None):
+        # Tracks the sources of config and of all imports below it.
+        # Imports that are tracked already are not walked again.
+        # New files get the given state or their current state.
+        stack = [config]
+        while stack:
+            config = stack.pop()
+            if config.source_path is not None and config not in self.tracked:
+                self.tracked.add(config)
+                self.configs.setdefault(config.source_path, []).append(config)
+                if config.source_path not in self.states:
+                    self.states[config.source_path] = (
+                        get_file_state(config.source_path) if state is None else state
+                    )
+            for key, item in config.config.items():
+                if isinstance(item, LazyImport):
+                    self.pending.add((config, key))
+                    continue
+                items = item if isinstance(item, list) else [item]
+                for item_item in items:
+                    if isinstance(item_item, CoolConfig) and item_item not in self.tracked:
+                        stack.append(item_item)
@@ -1,7 +1,21 @@
+import io
+import re
+import os
+import copy
+import json
+import array
+import pickle
+import time
 import yaml
+import shutil
+import tempfile
+import threading
 import unittest
+import contextlib
+import unittest.mock
 
-from cool_config import CoolConfig
+from cool_config import CoolConfig, clear_cache, cache_info, set_cache_enabled, get_yaml_backend, set_compact_lists, compact_info
+from cool_config.config import LazyImport, SharedConfig, compile_path, read_yaml, PARENT_TOKEN, ROOT_TOKEN, KEY_TOKEN
 
 class CoolConfigTest:
 
@@ -193,6 +207,1380 @@ class CoolConfigTest:
             self.config['sub1']['some_complex_list[0]/hello'], 'overwritten_hello'
         )
 
+    def test_parent_in_the_middle_of_a_path(self):
+        self.assertEqual(
+            self.config['sub1/sub2/../some_param'], 'sub1_param'
+        )
+        self.assertEqual(
+            self.config['sub1/sub2/../../main_system/some_values[-1]'], 4
+        )
+
+    def test_ref_cache_is_invalidated(self):
+        self.assertEqual(
+            self.config['sub1/sub2/some_ref_param'], 'sub1_param'
+        )
+        self.config['sub1']['some_param'] = 'changed_from_sub1'
+        self.assertEqual(
+            self.config['sub1/sub2/some_ref_param'], 'changed_from_sub1'
+        )
+        self.assertEqual(
+            self.config['reference_to_a_reference_does_work'], 1
+        )
+        self.config['main_system'].update({'some_values': [5, 6, 7]})
+        self.assertEqual(
+            self.config['reference_to_a_reference_does_work'], 6
+        )
+
+    def test_ref_cache_sees_lists_changed_in_place(self):
+        self.assertEqual(self.config['some_ref_param_to_a_list'], 1)
+        self.assertEqual(self.config['reference_to_a_reference_does_work'], 1)
+        self.config['main_system/some_values'][1] = 9
+        self.assertEqual(self.config['some_ref_param_to_a_list'], 9)
+        self.assertEqual(self.config['reference_to_a_reference_does_work'], 9)
+
+        # Through a list in the path of another reference
+        config = CoolConfig.parse_config_from_dict(
+            {'l': [{'x': 1}, {'x': 2}], 'a': '<ref>l[0]', 'b': '<ref>a/x'}, ''
+        )
+        self.assertEqual(config['b'], 1)
+        config['l'].reverse()
+        self.assertEqual(config['b'], 2)
+
+        initial_hash = config.hash()
+        config['l'].reverse()
+        self.assertNotEqual(config.hash(), initial_hash)
+
+    def test_set_dict_has_containing_parent(self):
+        self.config['main_system/some_values[1]'] = {
+            'ref_to_sibling': '<ref>../sub1_param'
+        }
+        self.assertEqual(
+            self.config['main_system/some_values[1]'].path, '/main_system/some_values[1]'
+        )
+        self.assertEqual(
+            self.config['main_system/some_values[1]/ref_to_sibling'], 3
+        )
+
+    def test_hash(self):
+        initial_hash = self.config.hash()
+        self.assertEqual(initial_hash, self.config.hash())
+        self.assertNotEqual(initial_hash, self.config.hash(exclude=['hello']))
+
+        self.config['some_complex_list[0]/hello'] = 'hola'
+        self.assertNotEqual(initial_hash, self.config.hash())
+        self.assertEqual(
+            self.config.hash(exclude=['hello']), self.config.hash(exclude=['hello'])
+        )
+
+        self.config['some_complex_list[0]/hello'] = 'hello'
+        self.assertEqual(initial_hash, self.config.hash())
+
+        sub2_hash = self.config['sub1/sub2'].hash()
+        self.config['sub1/sub2/some_param'] = 'changed'
+        self.assertNotEqual(sub2_hash, self.config['sub1/sub2'].hash())
+        self.assertNotEqual(initial_hash, self.config.hash())
+
+    def test_legacy_hash(self):
+        import hashlib
+        from pprint import pformat
+        self.assertEqual(
+            self.config.hash(legacy=True),
+            hashlib.md5(pformat(self.config.asdict()).encode('utf-8')).hexdigest()
+        )
+
+    def test_dump(self):
+        stream = io.StringIO()
+        self.config.dump_to_stream(stream)
+        self.assertEqual(stream.getvalue(), yaml.dump(self.config.asdict()))
+        self.assertEqual(yaml.safe_load(stream.getvalue()), self.config.asdict())
+
+        stream = io.StringIO()
+        self.config.dump_to_stream(stream, format='json', exclude=['hello'])
+        self.assertEqual(
+            stream.getvalue(), json.dumps(self.config.asdict(exclude=['hello']), indent=2)
+        )
+
+    def test_dump_unresolved(self):
+        stream = io.StringIO()
+        self.config.dump_to_stream(stream, resolve_refs=False)
+        raw = yaml.safe_load(stream.getvalue())
+        self.assertEqual(raw['reference_to_sub1'], '<ref>sub1/some_param')
+        self.assertEqual(raw['sub1']['some_param'], 'sub1_param')
+
+        config = CoolConfig.parse_config_from_dict(raw, 'example/')
+        self.assertEqual(config.asdict(), self.config.asdict())
+
+    def test_get_many(self):
+        keys = [
+            'sub1/some_param',
+            'sub1/some_param4/some_param5[-1]',
+            'sub1/sub2/some_ref_param',
+            'sub1/some_complex_list[2]/reference_to_hello',
+            'reference_to_a_reference_does_work',
+            'main_system/sub1_param',
+            ('sub1/missing', 'default'),
+            ('sub1/sub2/some_param', 'default'),
+        ]
+        expected = [self.config[key] for key in keys]
+        self.assertEqual(self.config.get_many(keys), expected)
+        self.assertEqual(self.config['sub1'].get_many(['../some_param', 'sub2/global_ref_param']), ['main_param', 'main_param'])
+        self.assertEqual(
+            self.config.get_many(keys[:2], as_dict=True),
+            {'sub1/some_param': 'sub1_param', 'sub1/some_param4/some_param5[-1]': 3}
+        )
+
+    def test_get_many_errors(self):
+        with self.assertRaisesRegex(ValueError, 'sub1/missing'):
+            self.config.get_many(['sub1/some_param', 'sub1/missing'])
+        with self.assertRaisesRegex(RuntimeError, 'no parent'):
+            self.config.get_many([('../some_param', 1)])
+        self.config['broken_ref'] = '<ref>missing'
+        with self.assertRaises(RuntimeError):
+            self.config.get_many(['some_param', 'broken_ref'])
+
+
+class HashTest(unittest.TestCase):
+
+    def test_same_config_same_hash(self):
+        config1 = CoolConfig.parse_config_from_path('example/config.yaml')
+        config2 = CoolConfig.parse_config_from_path('example/config.yaml', lazy=True)
+        self.assertEqual(config1.hash(), config2.hash())
+        self.assertEqual(config1['sub1/sub2'].hash(), config2['sub1/sub2'].hash())
+        # Written the same, but the references resolve to other values
+        self.assertEqual(config1['sub1/sub2'].hash(resolve_refs=False), config2['sub2'].hash(resolve_refs=False))
+        self.assertNotEqual(config1['sub1/sub2'].hash(), config2['sub2'].hash())
+
+    def test_lists_changed_in_place(self):
+        config = CoolConfig.parse_config_from_path('example/config.yaml')
+        initial_hash = config.hash()
+        main_hash = config['main_system'].hash()
+        config['main_system/some_values'].append(99)
+        self.assertNotEqual(config.hash(), initial_hash)
+        self.assertNotEqual(config['main_system'].hash(), main_hash)
+        config['main_system/some_values'].pop()
+        self.assertEqual(config.hash(), initial_hash)
+
+        set_compact_lists(True, min_size=3)
+        try:
+            config = CoolConfig.parse_config_from_dict({'a': {'l': [1, 2, 3]}}, '')
+        finally:
+            set_compact_lists(False)
+        initial_hash = config.hash()
+        config['a/l'][0] = 5
+        self.assertNotEqual(config.hash(), initial_hash)
+
+    def test_reference_targets(self):
+        config = CoolConfig.parse_config_from_path('example/config.yaml')
+        sub2_hash = config['sub2'].hash()
+        sub2_raw_hash = config['sub2'].hash(resolve_refs=False)
+        config['some_param'] = 'changed'
+        self.assertNotEqual(config['sub2'].hash(), sub2_hash)
+        self.assertEqual(config['sub2'].hash(resolve_refs=False), sub2_raw_hash)
+        config['some_param'] = 'main_param'
+        self.assertEqual(config['sub2'].hash(), sub2_hash)
+
+        # Dangling references are hashed as written
+        config = CoolConfig.parse_config_from_dict({'a': {'b': '<ref>/missing'}}, '')
+        a_hash = config['a'].hash()
+        config['missing'] = 1
+        self.assertNotEqual(config['a'].hash(), a_hash)
+
+        config = CoolConfig.parse_config_from_dict({'a': {'b': '<ref>/a'}}, '')
+        with self.assertRaisesRegex(RuntimeError, 'contains itself'):
+            config.hash()
+
+    def test_types_are_hashed(self):
+        config1 = CoolConfig.parse_config_from_dict({'a': 1}, '')
+        config2 = CoolConfig.parse_config_from_dict({'a': '1'}, '')
+        config3 = CoolConfig.parse_config_from_dict({'a': True}, '')
+        self.assertEqual(len({config1.hash(), config2.hash(), config3.hash()}), 3)
+
+class DeepConfigTest(unittest.TestCase):
+
+    def test_asdict_does_not_recurse(self):
+        config = CoolConfig.parse_config_from_dict({'leaf': 1}, '')
+        node = config
+        for _ in range(2000):
+            node['x'] = {}
+            node = node['x']
+
+        config_dict = config.asdict()
+        depth = 0
+        while 'x' in config_dict:
+            config_dict = config_dict['x']
+            depth += 1
+        self.assertEqual(depth, 2000)
+
+        stream = io.StringIO()
+        config.dump_to_stream(stream, format='json')
+        self.assertEqual(stream.getvalue().count('"x"'), 2000)
+
+class BenchmarkGeneratorTest(unittest.TestCase):
+
+    def test_lookups_resolve(self):
+        from benchmarks.generator import generate_config
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            generated = generate_config(
+                tmp_dir, depth=2, fan_out=2, list_size=3, ref_density=1.0,
+                ref_chain_length=3, num_imports=2
+            )
+            config = CoolConfig.parse_config_from_path(generated['path'])
+            lookups = generated['lookups']
+            for path in lookups['absolute'] + lookups['list_index'] + lookups['refs'] + lookups['ref_chains']:
+                config[path]
+            for base, path in lookups['relative'] + lookups['parent']:
+                config[base][path]
+            self.assertEqual(len(lookups['ref_chains']), 2)
+            self.assertEqual(config['imports/import_1/param_from_parent'], config['node_0/int_param'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = CoolConfig.parse_config_from_path('example/config.yaml')
+
+    def test_lookups_are_recorded(self):
+        instrumentation = self.config.enable_instrumentation()
+        for _ in range(3):
+            self.config['reference_to_a_reference_does_work']
+        self.config['sub1']['some_param4/some_param5[0]']
+        self.config['sub1']['../some_param', 'default']
+
+        report = {entry['path']: entry for entry in instrumentation.report()}
+        self.assertEqual(report['/reference_to_a_reference_does_work']['count'], 3)
+        self.assertEqual(report['/reference_to_a_reference_does_work']['ref_depth'], 2)
+        self.assertGreater(report['/reference_to_a_reference_does_work']['time'], 0)
+        self.assertEqual(report['/sub1/some_param4/some_param5[0]']['ref_depth'], 0)
+        self.assertEqual(report['/some_param']['count'], 1)
+
+    def test_unused_keys(self):
+        instrumentation = self.config.enable_instrumentation()
+        self.config['some_ref_param_to_a_list']
+        self.config['sub1/some_param4/some_param5[0]']
+
+        unused = instrumentation.unused_keys()
+        self.assertNotIn('/some_ref_param_to_a_list', unused)
+        # Read through the reference
+        self.assertNotIn('/main_system/some_values', unused)
+        self.assertNotIn('/sub1/some_param4/some_param5', unused)
+        self.assertIn('/main_system/sub1_param', unused)
+        self.assertIn('/some_complex_list[0]/hello', unused)
+
+        self.config.asdict()
+        self.assertEqual(instrumentation.unused_keys(), [])
+
+    def test_new_configs_are_instrumented(self):
+        instrumentation = self.config.enable_instrumentation()
+        self.config['new'] = {'param': 1}
+        self.config['new']['param']
+        report = {entry['path'] for entry in instrumentation.report()}
+        self.assertIn('/new/param', report)
+
+    def test_custom_hook_is_kept(self):
+        read = []
+        sub1 = self.config['sub1']
+        sub1.register_custom_get_item_hook(lambda key, item: read.append(key))
+        self.config.enable_instrumentation()
+        self.config['sub1/some_param']
+        self.config.disable_instrumentation()
+        self.config['sub1/some_param2']
+        self.assertEqual(read, ['some_param', 'some_param2'])
+        self.assertIs(type(sub1), CoolConfig)
+
+class FrozenConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = CoolConfig.parse_config_from_path('example/config.yaml', lazy=True)
+        self.frozen = self.config.freeze()
+
+    def test_same_values(self):
+        self.assertEqual(self.frozen.asdict(), self.config.asdict())
+        self.assertEqual(self.frozen.hash(), self.config.hash())
+        self.assertEqual(self.frozen['sub1/sub2/global_ref_param'], 'main_param')
+        self.assertEqual(self.config['sub1'].freeze()['../some_param'], 'main_param')
+
+    def test_writes_are_rejected(self):
+        with self.assertRaises(TypeError):
+            self.frozen['some_param'] = 1
+        with self.assertRaises(TypeError):
+            self.frozen['sub1']['some_param'] = 1
+        with self.assertRaises(TypeError):
+            self.frozen['main_system'].update({'some_param': 1})
+
+    def test_lists_are_read_only(self):
+        values = self.frozen['main_system/some_values']
+        expected = list(values)
+        for change in [
+            lambda: values.append(1),
+            lambda: values.extend([1]),
+            lambda: values.__setitem__(0, 1),
+            lambda: values.__delitem__(0),
+            lambda: values.sort(reverse=True),
+            lambda: values.clear(),
+        ]:
+            with self.assertRaises(TypeError):
+                change()
+        with self.assertRaises(TypeError):
+            self.frozen['some_complex_list'][0] = 1
+        self.assertEqual(self.frozen['main_system/some_values'], expected)
+        self.assertEqual(self.frozen['some_ref_param_to_a_list'], self.config['some_ref_param_to_a_list'])
+
+        # Copies are plain lists again
+        copied = self.frozen.asdict()['main_system']['some_values']
+        copied.append(1)
+        self.assertEqual(self.frozen['main_system/some_values'], expected)
+        self.assertEqual(pickle.loads(pickle.dumps(values)), expected)
+
+        frozen = CoolConfig.parse_config_from_dict({'a': [[1, 2], [3]], 'b': list(range(2000))}, '').freeze()
+        with self.assertRaises(TypeError):
+            frozen['a'][0].append(3)
+        set_compact_lists(True, min_size=1000)
+        try:
+            frozen = CoolConfig.parse_config_from_dict({'b': list(range(2000))}, '').freeze()
+        finally:
+            set_compact_lists(False)
+        self.assertIsInstance(frozen['b'], array.array)
+        with self.assertRaises(TypeError):
+            frozen['b'][0] = 1
+        self.assertEqual(frozen['b'][0], 0)
+
+    def test_snapshot_is_independent(self):
+        self.config['some_param'] = 'changed'
+        self.assertEqual(self.frozen['some_param'], 'main_param')
+        self.assertEqual(self.frozen['sub2/some_ref_param'], 'main_param')
+
+    def test_concurrent_reads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        paths = [
+            'sub1/sub2/some_ref_param',
+            'reference_to_a_reference_does_work',
+            'some_complex_list[3]/reference_to_world',
+            'main_system/sub1_param',
+        ]
+        expected = [self.config[path] for path in paths]
+
+        def read(_):
+            return [[self.frozen[path] for path in paths] for _ in range(200)]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for results in pool.map(read, range(16)):
+                for result in results:
+                    self.assertEqual(result, expected)
+
+class CompiledCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in ['config.yaml', 'sub1.yaml', 'sub2.yaml']:
+            shutil.copy(os.path.join('example', name), self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'config.yaml')
+        self.cache_path = os.path.join(self.tmp_dir, 'config.ccache')
+        clear_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        clear_cache()
+
+    def test_load_from_cache(self):
+        config = CoolConfig.parse_config_from_path(self.path, compiled_cache=self.cache_path)
+        self.assertTrue(os.path.exists(self.cache_path))
+        self.assertEqual(cache_info()['misses'], 3)
+
+        cached = CoolConfig.parse_config_from_path(self.path, compiled_cache=self.cache_path)
+        self.assertEqual(cache_info()['misses'], 3)
+        self.assertIsNot(cached, config)
+        self.assertEqual(cached.asdict(), config.asdict())
+        self.assertEqual(cached.hash(), config.hash())
+        self.assertEqual(cached['sub1/sub2/global_ref_param'], 'main_param')
+        self.assertIs(cached['sub1'].get_root_config(), cached)
+
+    def test_default_cache_path(self):
+        CoolConfig.parse_config_from_path(self.path, compiled_cache=True)
+        self.assertTrue(os.path.exists(self.path + '.ccache'))
+
+    def test_changed_import_invalidates_cache(self):
+        CoolConfig.parse_config_from_path(self.path, compiled_cache=self.cache_path)
+        with open(os.path.join(self.tmp_dir, 'sub2.yaml'), 'a') as f:
+            f.write('\nnew_param: 1\n')
+
+        config = CoolConfig.parse_config_from_path(self.path, compiled_cache=self.cache_path)
+        self.assertEqual(config['sub1/sub2/new_param'], 1)
+
+    def test_invalid_cache_file(self):
+        with open(self.cache_path, 'wb') as f:
+            f.write(b'not a cache')
+        config = CoolConfig.parse_config_from_path(self.path, compiled_cache=self.cache_path)
+        self.assertEqual(config['some_param'], 'main_param')
+
+    def test_broken_cache_file_is_compiled_again(self):
+        from cool_config import compiled
+        CoolConfig.parse_config_from_path(self.path, compiled_cache=self.cache_path)
+        with open(self.cache_path, 'rb') as f:
+            data = f.read()
+        offset = len(compiled.MAGIC) + 8
+        manifest_length = int.from_bytes(data[len(compiled.MAGIC):offset], 'big')
+        manifest = json.loads(data[offset:offset + manifest_length])
+        old_manifest = json.dumps({'sources': manifest['sources']}).encode('utf-8')
+
+        for broken in [
+            data[:len(data) // 2],
+            data[:offset + manifest_length + 10],
+            data[:offset] + b'{' * manifest_length + data[offset + manifest_length:],
+            # Written by an older version
+            compiled.MAGIC + len(old_manifest).to_bytes(8, 'big') + old_manifest + data[offset + manifest_length:],
+        ]:
+            with open(self.cache_path, 'wb') as f:
+                f.write(broken)
+            self.assertIsNone(compiled.load_compiled(self.cache_path))
+            config = CoolConfig.parse_config_from_path(self.path, compiled_cache=self.cache_path)
+            self.assertEqual(config['sub1/sub2/global_ref_param'], 'main_param')
+            self.assertIsNotNone(compiled.load_compiled(self.cache_path))
+
+    def test_write_errors_are_not_fatal(self):
+        cache_path = os.path.join(self.tmp_dir, 'missing_dir', 'config.ccache')
+        with self.assertWarnsRegex(RuntimeWarning, 'compiled cache'):
+            config = CoolConfig.parse_config_from_path(self.path, compiled_cache=cache_path)
+        self.assertEqual(config['sub1/sub2/global_ref_param'], 'main_param')
+        self.assertFalse(os.path.exists(cache_path))
+        self.assertEqual([name for name in os.listdir(self.tmp_dir) if name.endswith('.tmp')], [])
+
+    def test_values_without_json_type(self):
+        import datetime
+        from cool_config import compiled
+        with open(self.path, 'a') as f:
+            f.write('\ndates: {day: 2024-01-02, time: 2024-01-02 03:04:05}\n')
+            f.write('int_keys: {1: one, 2: [{nested: <import>sub2.yaml}]}\n')
+            f.write('binary: !!binary aGVsbG8=\n')
+            f.write(f'{compiled.TAG}: 1\n')
+        config = CoolConfig.parse_config_from_path(self.path, compiled_cache=self.cache_path)
+        cached = compiled.load_compiled(self.cache_path)
+        self.assertEqual(cached.asdict(resolve_refs=False), config.asdict(resolve_refs=False))
+        self.assertEqual(cached['dates/day'], datetime.date(2024, 1, 2))
+        self.assertEqual(cached['int_keys'].config[1], 'one')
+        self.assertEqual(cached['binary'], b'hello')
+        self.assertEqual(cached.source_files(), config.source_files())
+        self.assertEqual(cached['int_keys'].config[2][0]['nested'].source_path, os.path.join(self.tmp_dir, 'sub2.yaml'))
+
+        set_compact_lists(True, min_size=3)
+        try:
+            config = CoolConfig.parse_config_from_path(self.path)
+            compiled.write_compiled(config, self.cache_path)
+            self.assertIsInstance(compiled.load_compiled(self.cache_path)['sub1/some_param3'], array.array)
+        finally:
+            set_compact_lists(False)
+
+    def test_cache_file_is_not_unpickled(self):
+        from cool_config import compiled
+        CoolConfig.parse_config_from_path(self.path, compiled_cache=self.cache_path)
+        with open(self.cache_path, 'rb') as f:
+            data = f.read()
+        offset = len(compiled.MAGIC) + 8
+        manifest_length = int.from_bytes(data[len(compiled.MAGIC):offset], 'big')
+
+        class Payload:
+            def __reduce__(self):
+                return (os.mkdir, (os.path.join(self.tmp_dir, 'created'),))
+        Payload.tmp_dir = self.tmp_dir
+        with open(self.cache_path, 'wb') as f:
+            f.write(data[:offset + manifest_length] + pickle.dumps(Payload()))
+        self.assertIsNone(compiled.load_compiled(self.cache_path))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'created')))
+
+class ParallelLoadingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        clear_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        set_cache_enabled(True)
+        clear_cache()
+
+    def test_identical_to_sequential(self):
+        from benchmarks.generator import generate_config
+        generated = generate_config(self.tmp_dir, depth=2, fan_out=2, num_imports=8)
+        config = CoolConfig.parse_config_from_path(generated['path'])
+        set_cache_enabled(False)
+        parallel = CoolConfig.parse_config_from_path(generated['path'], workers=4)
+        self.assertEqual(list(parallel.iter_events()), list(config.iter_events()))
+        self.assertEqual(parallel.hash(), config.hash())
+        self.assertEqual(sorted(parallel.source_files()), sorted(config.source_files()))
+
+    def test_missing_import(self):
+        path = os.path.join(self.tmp_dir, 'config.yaml')
+        with open(path, 'w') as f:
+            f.write('a: <import>missing.yaml\n')
+        with self.assertRaises(FileNotFoundError):
+            CoolConfig.parse_config_from_path(path, workers=2)
+
+class AsyncLoadingTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        clear_cache()
+
+    def tearDown(self):
+        set_cache_enabled(True)
+        clear_cache()
+
+    async def test_parse_config_from_path(self):
+        config = await CoolConfig.aparse_config_from_path('example/config.yaml', index=True)
+        expected = CoolConfig.parse_config_from_path('example/config.yaml')
+        self.assertIsInstance(config, CoolConfig)
+        self.assertEqual(list(config.iter_events()), list(expected.iter_events()))
+        self.assertEqual(config['sub1/sub2/global_ref_param'], 'main_param')
+
+    async def test_parse_config_from_args(self):
+        args = {'config': 'example/config.yaml', 'some_cli_arg': 'Hello World!'}
+        config = await CoolConfig.aparse_config_from_args(args, limit=1)
+        self.assertEqual(config['some_cli_arg'], 'Hello World!')
+        self.assertEqual(config['sub1/sub2/some_ref_param'], 'sub1_param')
+
+    async def test_read_yaml(self):
+        from cool_config.aio import aread_yaml
+        self.assertEqual(await aread_yaml('example/sub2.yaml'), read_yaml('example/sub2.yaml'))
+
+    async def test_cancel(self):
+        import asyncio
+        from cool_config import config as config_module
+        read = config_module.read_yaml
+        # Set once the first import is read
+        started = threading.Event()
+        paths = []
+
+        def read_slow(path):
+            paths.append(path)
+            if len(paths) > 1:
+                started.set()
+            time.sleep(0.05)
+            return read(path)
+
+        set_cache_enabled(False)
+        config_module.read_yaml = read_slow
+        try:
+            task = asyncio.create_task(CoolConfig.aparse_config_from_path('example/config.yaml'))
+            while not started.is_set():
+                await asyncio.sleep(0.001)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(asyncio.all_tasks(), {asyncio.current_task()})
+            self.assertIsNone(config_module._prefetched_yaml.get())
+        finally:
+            config_module.read_yaml = read
+
+class RefGraphTest(unittest.TestCase):
+
+    def test_example_is_valid(self):
+        config = CoolConfig.parse_config_from_path('example/config.yaml', lazy=True, validate=True)
+        graph = config.ref_graph()
+        self.assertTrue(graph.is_valid())
+        order = graph.order
+        self.assertLess(order.index('/some_ref_param_to_a_list'), order.index('/reference_to_a_reference_does_work'))
+        self.assertEqual(graph.dependencies['/reference_to_a_reference_does_work'], ['/some_ref_param_to_a_list'])
+        self.assertIn('/sub1/sub2/some_ref_param', order)
+
+    def test_reports_all_errors(self):
+        config = CoolConfig.parse_config_from_dict({
+            'a': '<ref>b',
+            'b': '<ref>a',
+            'c': '<ref>d/x',
+            'e': {'f': '<ref>../a', 'g': '<ref>../../x'},
+            'h': ['<ref>/missing', 1],
+            'i': '<ref>h[5]',
+            'j': '<ref>j',
+            'k': '<ref>c',
+        }, '')
+        graph = config.ref_graph()
+        self.assertEqual(sorted(path for path, _, _ in graph.dangling), ['/c', '/e/g', '/h[0]', '/i'])
+        self.assertEqual(sorted(sorted(cycle) for cycle in graph.cycles), [['/a', '/b'], ['/j']])
+        self.assertEqual(graph.order, [])
+        with self.assertRaisesRegex(RuntimeError, '(?s)/c.*/e/g.*/h\\[0\\].*/i.*/a'):
+            config.validate_refs()
+        with self.assertRaises(RuntimeError):
+            CoolConfig.parse_config_from_dict({'a': '<ref>b'}, '', validate=True)
+
+    def test_long_chain(self):
+        raw = {'param_0': 0}
+        for i in range(1, 5000):
+            raw[f'param_{i}'] = f'<ref>param_{i - 1}'
+        config = CoolConfig.parse_config_from_dict(raw, '', validate=True)
+        self.assertEqual(len(config.ref_graph().order), 4999)
+        self.assertEqual(config['param_4999'], 0)
+        self.assertEqual(config.freeze()['param_4999'], 0)
+
+    def test_config_containing_itself(self):
+        for raw, refs in [
+            ({'a': {'b': '<ref>/a'}}, ['/a/b']),
+            ({'a': {'b': '<ref>/c'}, 'c': {'d': '<ref>/a'}}, ['/a/b', '/c/d']),
+            ({'a': {'l': [{'x': '<ref>/a'}]}}, ['/a/l[0]/x']),
+        ]:
+            config = CoolConfig.parse_config_from_dict(raw, '')
+            graph = config.ref_graph()
+            self.assertFalse(graph.is_valid())
+            self.assertEqual(graph.containing, [refs])
+            with self.assertRaisesRegex(RuntimeError, 'contains itself through references: ' + re.escape(refs[0])):
+                config.validate_refs()
+            with self.assertRaisesRegex(RuntimeError, 'contains itself'):
+                config.asdict()
+            with self.assertRaisesRegex(RuntimeError, 'contains itself'):
+                config.dump_to_stream(io.StringIO())
+
+        # References to the same config from siblings are fine
+        config = CoolConfig.parse_config_from_dict({'a': {'b': 1}, 'c': '<ref>a', 'd': '<ref>a'}, '', validate=True)
+        self.assertEqual(config.asdict(), {'a': {'b': 1}, 'c': {'b': 1}, 'd': {'b': 1}})
+
+class ReloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in ['config.yaml', 'sub1.yaml', 'sub2.yaml']:
+            shutil.copy(os.path.join('example', name), self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'config.yaml')
+        self.config = CoolConfig.parse_config_from_path(self.path, index=True)
+        self.changes = []
+        self.watcher = self.config.watch(self.changes.append)
+
+    def tearDown(self):
+        self.watcher.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        # Make sure the modification time changes on coarse filesystems
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def test_unchanged(self):
+        self.assertEqual(self.watcher.check(), [])
+        self.assertEqual(self.changes, [])
+
+    def test_reload_import(self):
+        sub1 = self.config['sub1']
+        sub1_sub2 = self.config['sub1/sub2']
+        sub2 = self.config['sub2']
+        hash_before = self.config.hash()
+        self.write('sub2.yaml', "some_param: 'changed'\nnew_param: 1\nsome_ref_param: '<ref>../some_param'\n")
+
+        changed = self.watcher.check()
+        self.assertEqual(
+            sorted(changed),
+            ['/sub1/sub2/global_ref_param', '/sub1/sub2/new_param', '/sub1/sub2/some_param',
+             '/sub2/global_ref_param', '/sub2/new_param', '/sub2/some_param']
+        )
+        self.assertEqual(self.changes, [changed])
+        self.assertIs(self.config['sub1'], sub1)
+        self.assertIs(self.config['sub1/sub2'], sub1_sub2)
+        self.assertIs(self.config['sub2'], sub2)
+        self.assertEqual(self.config['sub1/sub2/some_param'], 'changed')
+        self.assertEqual(sub2['new_param'], 1)
+        self.assertFalse(sub2.has_key('global_ref_param'))
+        self.assertNotEqual(self.config.hash(), hash_before)
+        self.assertEqual(self.config.asdict(), CoolConfig.parse_config_from_path(self.path).asdict())
+
+    def test_reload_root(self):
+        sub1 = self.config['sub1']
+        self.assertEqual(self.config['sub1/sub2/global_ref_param'], 'main_param')
+        with open(self.path) as f:
+            content = f.read()
+        self.write('config.yaml', content.replace("some_param: 'main_param'", "some_param: 'new_main_param'"))
+
+        self.assertEqual(self.watcher.check(), ['/some_param'])
+        self.assertIs(self.config['sub1'], sub1)
+        self.assertEqual(self.config['sub1/sub2/global_ref_param'], 'new_main_param')
+
+    def test_new_import_is_tracked(self):
+        self.write('sub3.yaml', 'param: 1\n')
+        with open(self.path) as f:
+            content = f.read()
+        self.write('config.yaml', content + '\nsub3: <import>sub3.yaml\n')
+        self.assertEqual(self.watcher.check(), ['/sub3'])
+        self.assertEqual(self.config['sub3/param'], 1)
+
+        self.write('sub3.yaml', 'param: 2\n')
+        self.assertEqual(self.watcher.check(), ['/sub3/param'])
+        self.assertEqual(self.config['sub3/param'], 2)
+
+    def test_reload_keeps_args(self):
+        args = {'config': self.path, 'lr': 0.1, 'some_param': 'from_args'}
+        with contextlib.redirect_stdout(io.StringIO()):
+            config = CoolConfig.parse_config_from_args(args)
+            watcher = config.watch()
+            with open(self.path) as f:
+                content = f.read()
+            self.write('config.yaml', content + '\nnew_param: 1\n')
+            self.assertEqual(watcher.check(), ['/new_param'])
+        self.assertEqual(config['config'], self.path)
+        self.assertEqual(config['lr'], 0.1)
+        self.assertEqual(config['some_param'], 'from_args')
+        self.assertEqual(config['new_param'], 1)
+
+    def test_invalid_file_is_retried(self):
+        errors = []
+        self.watcher.add_error_callback(lambda path, error: errors.append(path))
+        sub1_path = os.path.join(self.tmp_dir, 'sub1.yaml')
+        for content in ['some_param: [1, 2\n', '']:
+            self.write('sub1.yaml', content)
+            self.assertEqual(self.watcher.check(), [])
+            self.assertEqual(errors[-1], sub1_path)
+            self.assertEqual(self.config['sub1/some_param'], 'sub1_param')
+            # Unchanged invalid files are not read again
+            self.watcher.check()
+            self.assertEqual(len(errors), 1 if content else 2)
+
+        self.write('sub1.yaml', 'some_param: 7\n')
+        self.assertIn('/sub1/some_param', self.watcher.check())
+        self.assertEqual(self.config['sub1/some_param'], 7)
+        self.assertEqual(self.watcher.errors, {})
+
+    def test_background_thread_survives_errors(self):
+        self.watcher.interval = 0.01
+        errors = []
+        self.watcher.add_error_callback(lambda path, error: errors.append(error))
+        self.write('sub1.yaml', 'some_param: [1, 2\n')
+        self.watcher.start()
+        deadline = time.time() + 5
+        while not errors and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(errors)
+        reloaded = threading.Event()
+        self.watcher.add_callback(lambda changed: reloaded.set())
+        self.write('sub1.yaml', 'some_param: 7\n')
+        self.assertTrue(reloaded.wait(5))
+        self.assertTrue(self.watcher.thread.is_alive())
+        self.watcher.stop()
+        self.assertEqual(self.config['sub1/some_param'], 7)
+
+    def test_lazy_imports_are_tracked(self):
+        config = CoolConfig.parse_config_from_path(self.path, lazy=True)
+        watcher = config.watch()
+        self.assertEqual(config['sub2/some_param'], 'sub2_param')
+        self.write('sub2.yaml', "some_param: 'changed'\n")
+        self.assertEqual(watcher.check(), ['/sub2/some_param', '/sub2/some_ref_param', '/sub2/global_ref_param'])
+        self.assertEqual(config['sub2/some_param'], 'changed')
+
+        # Loaded after the file changed, the first check only confirms it
+        self.write('sub1.yaml', "some_param: 'changed'\n")
+        self.assertEqual(config['sub1/some_param'], 'changed')
+        self.assertEqual(watcher.check(), [])
+        self.write('sub1.yaml', "some_param: 'changed again'\n")
+        self.assertEqual(watcher.check(), ['/sub1/some_param'])
+
+    def test_background_thread(self):
+        import threading
+        reloaded = threading.Event()
+        self.watcher.add_callback(lambda changed: reloaded.set())
+        self.watcher.interval = 0.01
+        self.watcher.start()
+        self.write('sub1.yaml', 'some_param: 1\n')
+        self.assertTrue(reloaded.wait(5))
+        self.watcher.stop()
+        self.assertEqual(self.config['sub1/some_param'], 1)
+
+class PrintTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = CoolConfig.parse_config_from_path('example/config.yaml')
+
+    def get_output(self, **kwargs):
+        stream = io.StringIO()
+        self.config.print(stream=stream, **kwargs)
+        return stream.getvalue().splitlines()
+
+    def test_print(self):
+        lines = self.get_output()
+        self.assertEqual(lines[0], 'sub1' + '-' * 30 + ' ')
+        self.assertIn('----some_param3' + '-' * 19 + ' [1,2,3,4]', lines)
+        self.assertIn('some_complex_list[0]', lines)
+        self.assertEqual(len(lines), len(self.config.get_print_string()))
+        self.assertEqual(len({len(line.split(' ')[0]) for line in lines if '[' not in line.split(' ')[0]}), 1)
+
+    def test_stdout(self):
+        import contextlib
+        stream = io.StringIO()
+        with contextlib.redirect_stdout(stream):
+            self.config.print()
+        self.assertEqual(stream.getvalue().splitlines(), self.get_output())
+
+    def test_lists(self):
+        config = CoolConfig.parse_config_from_dict({'a': [{'x': 1}, 5, [1, [2, 3]]], 'b': [[1, 2], [3]]}, '')
+        self.assertEqual(
+            config.get_print_string(),
+            [['a[0]', ''], ['----x', '1'], ['a[1]', '5'], ['a[2]', '[1,[2,3]]'], ['b', '[[1,2],[3]]']]
+        )
+
+    def test_max_depth(self):
+        lines = self.get_output(max_depth=0)
+        self.assertEqual(lines[0].split(' '), ['sub1' + '-' * 30, '...'])
+        self.assertFalse(any(line.startswith('-') for line in lines))
+        lines = self.get_output(max_depth=1)
+        self.assertIn('----sub2' + '-' * 26 + ' ...', lines)
+
+    def test_paths(self):
+        lines = self.get_output(paths=['sub1/sub2', 'main_system/some_values'])
+        self.assertEqual(lines, [
+            'sub1/sub2-------------- ',
+            '----some_param--------- sub2_param',
+            '----some_ref_param----- <ref>../some_param',
+            '----global_ref_param--- <ref>/some_param',
+            'main_system/some_values [0,1,2,3,4]',
+        ])
+
+    def test_resolve_refs(self):
+        lines = self.get_output(paths=['sub1/sub2'], resolve_refs=True)
+        self.assertEqual(lines[2:], ['----some_ref_param-- sub1_param', '----global_ref_param main_param'])
+
+class CompactListTest(unittest.TestCase):
+
+    def setUp(self):
+        set_compact_lists(True, min_size=3)
+        self.config = CoolConfig.parse_config_from_path('example/config.yaml')
+        set_compact_lists(False)
+        self.plain = CoolConfig.parse_config_from_path('example/config.yaml')
+
+    def tearDown(self):
+        set_compact_lists(False)
+        clear_cache()
+
+    def test_stored_as_array(self):
+        import array
+        self.assertIsInstance(self.config['main_system/some_values'], array.array)
+        self.assertIsInstance(self.plain['main_system/some_values'], list)
+        self.assertEqual(list(self.config['main_system/some_values']), [0, 1, 2, 3, 4])
+        self.assertEqual(self.config['main_system/some_values[1]'], 1)
+        self.assertEqual(self.config['sub1/some_param4/some_param5[-1]'], 3)
+        self.assertEqual(self.config['some_ref_param_to_a_list'], 1)
+        self.assertEqual(self.config['main_system/sub1_param'], 3)
+        self.assertEqual(self.config.get_many(['main_system/some_values[4]']), [4])
+
+    def test_arrays_are_not_shared(self):
+        set_compact_lists(True, min_size=3)
+        self.config['main_system/some_values'].append(99)
+        self.config['sub1/some_param3'][0] = 100
+        config = CoolConfig.parse_config_from_path('example/config.yaml')
+        self.assertEqual(list(config['main_system/some_values']), [0, 1, 2, 3, 4])
+        self.assertEqual(list(config['sub1/some_param3']), [1, 2, 3, 4])
+
+    def test_only_homogeneous_lists(self):
+        set_compact_lists(True, min_size=3)
+        config = CoolConfig.parse_config_from_dict({
+            'ints': [1, 2, 3], 'floats': [0.5, 1.5, 2.5], 'mixed': [1, 2.0, 3],
+            'bools': [True, False, True], 'short': [1, 2], 'big': [2**70, 1, 2],
+        }, '')
+        self.assertEqual(config['ints'].typecode, 'q')
+        self.assertEqual(config['floats'].typecode, 'd')
+        for key in ['mixed', 'bools', 'short', 'big']:
+            self.assertIsInstance(config[key], list)
+
+    def test_round_trip(self):
+        self.assertEqual(self.config.asdict(), self.plain.asdict())
+        self.assertEqual(self.config.hash(), self.plain.hash())
+        self.assertEqual(self.config.get_print_string(), self.plain.get_print_string())
+        for format in ['yaml', 'json']:
+            stream, plain_stream = io.StringIO(), io.StringIO()
+            self.config.dump_to_stream(stream, format=format)
+            self.plain.dump_to_stream(plain_stream, format=format)
+            self.assertEqual(stream.getvalue(), plain_stream.getvalue())
+
+    def test_set_item(self):
+        import array
+        self.config['main_system/some_values[1]'] = 10
+        self.assertIsInstance(self.config['main_system/some_values'], array.array)
+        self.assertEqual(self.config['some_ref_param_to_a_list'], 10)
+        self.config['main_system/some_values[2]'] = 'text'
+        self.assertEqual(self.config['main_system/some_values'], [0, 10, 'text', 3, 4])
+
+    def test_memory_saved(self):
+        clear_cache()
+        set_compact_lists(True, min_size=1000)
+        before = compact_info()
+        CoolConfig.parse_config_from_dict({'weights': [i * 0.5 for i in range(10000)]}, '')
+        info = compact_info()
+        self.assertEqual(info['lists'] - before['lists'], 1)
+        self.assertEqual(info['items'] - before['items'], 10000)
+        self.assertGreater(info['bytes_saved'] - before['bytes_saved'], 10000 * 24)
+
+class VariantTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = CoolConfig.parse_config_from_dict({
+            'lr': 0.1,
+            'model': {'dim': 256, 'encoder': {'dim': '<ref>../dim', 'layers': 4}},
+            'optim': {'lr': '<ref>/lr', 'betas': [0.9, 0.99]},
+            'blocks': [{'dim': '<ref>../model/dim'}, {'dim': 128}],
+        }, '')
+
+    def test_overrides(self):
+        variant = self.base.variant({'model/dim': 512, 'lr': 0.01})
+        self.assertEqual(variant['model/encoder/dim'], 512)
+        self.assertEqual(variant['optim/lr'], 0.01)
+        self.assertEqual(variant['blocks[0]/dim'], 512)
+        self.assertEqual(self.base['model/encoder/dim'], 256)
+        self.assertEqual(self.base['optim/lr'], 0.1)
+
+    def test_copy_on_write(self):
+        variant = self.base.variant({'model/encoder/layers': 8})
+        self.assertIsInstance(variant.config['optim'], SharedConfig)
+        self.assertIsInstance(variant.config['model'].config['encoder'], CoolConfig)
+        self.assertIs(variant.config['optim'].config, self.base['optim'])
+        self.assertIs(variant['optim/betas'], self.base['optim/betas'])
+        self.assertIsNot(variant['optim'], self.base['optim'])
+        self.assertIs(variant['optim'].get_root_config(), variant)
+
+    def test_same_as_base(self):
+        variant = self.base.variant({})
+        self.assertEqual(variant.hash(), self.base.hash())
+        self.assertEqual(variant.asdict(), self.base.asdict())
+        self.assertNotEqual(self.base.variant({'model/dim': 1}).hash(), self.base.hash())
+
+    def test_variant_of_example(self):
+        base = CoolConfig.parse_config_from_path('example/config.yaml', lazy=True).freeze()
+        variant = base.variant({'sub1/some_param': 'changed'})
+        self.assertEqual(variant['sub1/sub2/some_ref_param'], 'changed')
+        self.assertEqual(variant['reference_to_sub1'], 'changed')
+        self.assertEqual(base['reference_to_sub1'], 'sub1_param')
+        self.assertEqual(variant['sub2/global_ref_param'], 'main_param')
+
+    def test_sweep(self):
+        variants = list(self.base.sweep({'model/dim': [128, 512], 'lr': [1, 2, 3]}))
+        self.assertEqual(len(variants), 6)
+        self.assertEqual(
+            [(variant['model/encoder/dim'], variant['optim/lr']) for variant in variants],
+            [(128, 1), (128, 2), (128, 3), (512, 1), (512, 2), (512, 3)]
+        )
+        variants = list(self.base.sweep([{'lr': 5}, {'model/dim': 7}]))
+        self.assertEqual([variants[0]['optim/lr'], variants[1]['model/encoder/dim']], [5, 7])
+
+class DiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.old = CoolConfig.parse_config_from_dict({
+            'lr': 0.1,
+            'model': {'dim': 256, 'encoder': {'dim': '<ref>../dim', 'layers': 4}},
+            'optim': {'lr': '<ref>/lr', 'betas': [0.9, 0.99]},
+            'blocks': [{'dim': 64}, {'dim': 128}],
+        }, '')
+
+    def test_no_changes(self):
+        diff = self.old.diff(copy.deepcopy(self.old))
+        self.assertTrue(diff.is_empty())
+        self.assertEqual(list(diff.iter_lines()), [])
+
+    def test_changes(self):
+        new = copy.deepcopy(self.old)
+        new['model/dim'] = 512
+        new['optim/lr'] = 0.5
+        new['optim/betas'] = [0.9, 0.999]
+        new['blocks'] = [{'dim': 64}, {'dim': 256}, {'dim': 512, 'act': 'relu'}]
+        new['seed'] = 1
+        del new['model'].config['encoder']
+        diff = self.old.diff(new)
+        self.assertEqual(diff.changed, {
+            '/model/dim': ((256, 256), (512, 512)),
+            '/optim/lr': (('<ref>/lr', 0.1), (0.5, 0.5)),
+            '/optim/betas': (([0.9, 0.99], [0.9, 0.99]), ([0.9, 0.999], [0.9, 0.999])),
+            '/blocks[1]/dim': ((128, 128), (256, 256)),
+        })
+        self.assertEqual(diff.added, {
+            '/blocks[2]/dim': (512, 512),
+            '/blocks[2]/act': ('relu', 'relu'),
+            '/seed': (1, 1),
+        })
+        self.assertEqual(diff.removed, {
+            '/model/encoder/dim': ('<ref>../dim', 256),
+            '/model/encoder/layers': (4, 4),
+        })
+        self.assertIn('~ /optim/lr: "<ref>/lr" (0.1) -> 0.5', list(diff.iter_lines()))
+        self.assertEqual(
+            diff.asdict()['changed']['/model/dim'],
+            {'old': {'raw': 256, 'resolved': 256}, 'new': {'raw': 512, 'resolved': 512}}
+        )
+
+    def test_replaced_config(self):
+        new = copy.deepcopy(self.old)
+        new['model'] = 1
+        diff = self.old.diff(new)
+        self.assertEqual(list(diff.removed), ['/model/dim', '/model/encoder/dim', '/model/encoder/layers'])
+        self.assertEqual(diff.added, {'/model': (1, 1)})
+        self.assertEqual(new.diff(self.old).added['/model/encoder/dim'], ('<ref>../dim', 256))
+
+    def test_variant(self):
+        base = self.old.freeze()
+        variant = base.variant({'model/encoder/layers': 8})
+        diff = base.diff(variant)
+        self.assertEqual(diff.changed, {'/model/encoder/layers': ((4, 4), (8, 8))})
+        # Configs shared with the base are not copied
+        self.assertIsInstance(variant.config['optim'], SharedConfig)
+
+    def test_skips_identical_configs(self):
+        new = copy.deepcopy(self.old)
+        new['model/dim'] = 512
+        visited = []
+        new['optim'].register_custom_get_item_hook(lambda key, item: visited.append(key))
+        self.old.diff(new)
+        self.assertEqual(visited, [])
+
+    def test_lazy_imports(self):
+        old = CoolConfig.parse_config_from_path('example/config.yaml', lazy=True)
+        new = CoolConfig.parse_config_from_path('example/config.yaml', lazy=True)
+        new['some_param'] = 'changed'
+        diff = old.diff(new)
+        self.assertEqual(diff.changed, {'/some_param': (('main_param', 'main_param'), ('changed', 'changed'))})
+        self.assertIsInstance(old.config['sub1'], LazyImport)
+        self.assertIsInstance(new.config['sub2'], LazyImport)
+
+    def test_sub_config(self):
+        new = copy.deepcopy(self.old)
+        new['model/encoder/layers'] = 2
+        diff = self.old['model'].diff(new['model'])
+        self.assertEqual(list(diff.changed), ['/model/encoder/layers'])
+
+    def test_cli(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for name in ['config.yaml', 'sub1.yaml', 'sub2.yaml']:
+                shutil.copy(os.path.join('example', name), tmp_dir)
+            new_path = os.path.join(tmp_dir, 'new.yaml')
+            with open(os.path.join(tmp_dir, 'config.yaml')) as f:
+                content = f.read()
+            with open(new_path, 'w') as f:
+                f.write(content.replace("'main_param'", "'changed'"))
+
+            from cool_config.__main__ import main
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                code = main(['diff', os.path.join(tmp_dir, 'config.yaml'), new_path, '--lazy'])
+            self.assertEqual(code, 1)
+            self.assertEqual(
+                stdout.getvalue().splitlines(),
+                ['~ /some_param: "main_param" -> "changed"']
+            )
+
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                code = main(['diff', new_path, new_path, '--json'])
+            self.assertEqual(code, 0)
+            self.assertEqual(json.loads(stdout.getvalue()), {'added': {}, 'removed': {}, 'changed': {}})
+        finally:
+            shutil.rmtree(tmp_dir)
+
+class CompileTest(unittest.TestCase):
+
+    def test_attribute_access(self):
+        config = CoolConfig.parse_config_from_path('example/config.yaml', lazy=True)
+        compiled = config.compile()
+        self.assertEqual(compiled.sub1.sub2.some_ref_param, 'sub1_param')
+        self.assertEqual(compiled.reference_to_a_reference_does_work, 1)
+        self.assertEqual(compiled.main_system.sub1_param, 3)
+        self.assertEqual(compiled.main_system.some_values, (0, 1, 2, 3, 4))
+        self.assertEqual(compiled.some_complex_list[3].reference_to_world, 'world')
+        self.assertEqual(compiled._asdict(), config.asdict())
+        # Configs with the same keys share their class
+        self.assertIs(type(compiled.sub1.sub2), type(compiled.sub2))
+
+    def test_read_only(self):
+        config = CoolConfig.parse_config_from_dict({'a': 1, 'b': {'c': [1, 2]}}, '')
+        compiled = config.compile()
+        with self.assertRaises(TypeError):
+            compiled.a = 2
+        with self.assertRaises(TypeError):
+            del compiled.b
+        with self.assertRaises(AttributeError):
+            compiled.d
+        config['a'] = 2
+        self.assertEqual(compiled.a, 1)
+
+    def test_key_mapping(self):
+        config = CoolConfig.parse_config_from_dict({
+            'a-b': 1, 'class': 2, '0x': 3, '__x': 4, '_fields': 5, 1: 6, 'ok_key': 7,
+        }, '')
+        compiled = config.compile()
+        self.assertEqual(compiled._fields, ('a_b', 'class_', 'k0x', 'k__x', '_fields_', 'k1', 'ok_key'))
+        self.assertEqual(
+            [compiled.a_b, compiled.class_, compiled.k0x, compiled.k__x, compiled._fields_, compiled.k1, compiled.ok_key],
+            [1, 2, 3, 4, 5, 6, 7]
+        )
+        self.assertEqual(compiled['a-b'], 1)
+        self.assertEqual(compiled[1], 6)
+        with self.assertRaises(KeyError):
+            compiled['missing']
+        with self.assertRaises(ValueError):
+            CoolConfig.parse_config_from_dict({'a-b': 1, 'a_b': 2}, '').compile()
+
+    def test_shared_references(self):
+        config = CoolConfig.parse_config_from_dict({
+            'model': {'dim': 4},
+            'alias': '<ref>model',
+            'loop': {'self': '<ref>/loop', 'value': 1},
+        }, '')
+        compiled = config.compile()
+        self.assertIs(compiled.alias, compiled.model)
+        self.assertIs(compiled.loop.self, compiled.loop)
+        self.assertEqual(compiled.loop.self.self.value, 1)
+        self.assertIn('self=...', repr(compiled.loop))
+
+class CliTest(unittest.TestCase):
+
+    def run_cli(self, argv, stdin=''):
+        from cool_config.__main__ import main
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), unittest.mock.patch('sys.stdin', io.StringIO(stdin)):
+            code = main(argv)
+        return code, stdout.getvalue()
+
+    def test_query(self):
+        queries = [
+            'sub1/sub2/some_ref_param',
+            'main_system',
+            'some_complex_list[2]/reference_to_hello',
+            '',
+            'missing',
+            '{"path": "missing", "default": null}',
+            '{"path": "../some_param", "from": "sub1/sub2"}',
+            '{"no_path": 1}',
+        ]
+        code, stdout = self.run_cli(['query', 'example/config.yaml', '--lazy'], '\n'.join(queries))
+        self.assertEqual(code, 0)
+        self.assertEqual([json.loads(line) for line in stdout.splitlines()], [
+            {'path': 'sub1/sub2/some_ref_param', 'value': 'sub1_param'},
+            {'path': 'main_system', 'value': {'some_values': [0, 1, 2, 3, 4], 'sub1_param': 3}},
+            {'path': 'some_complex_list[2]/reference_to_hello', 'value': 'hello'},
+            {'path': 'missing', 'error': 'Config is missing key "missing"!'},
+            {'path': 'missing', 'value': None},
+            {'path': '../some_param', 'value': 'sub1_param'},
+            {'query': '{"no_path": 1}', 'error': 'Invalid query, expected {"path": ...}'},
+        ])
+
+    def test_dump_hash_print(self):
+        config = CoolConfig.parse_config_from_path('example/config.yaml')
+
+        code, stdout = self.run_cli(['dump', 'example/config.yaml', '--format', 'json'])
+        self.assertEqual(json.loads(stdout), config.asdict())
+        code, stdout = self.run_cli(['dump', 'example/config.yaml', '--raw', '--exclude', 'sub1'])
+        self.assertEqual(yaml.safe_load(stdout), config.asdict(exclude=['sub1'], resolve_refs=False))
+
+        code, stdout = self.run_cli(['hash', 'example/config.yaml'])
+        self.assertEqual(stdout, config.hash() + '\n')
+
+        code, stdout = self.run_cli(['print', 'example/config.yaml', 'sub2', '--resolve-refs'])
+        stream = io.StringIO()
+        config.print(stream, paths=['sub2'], resolve_refs=True)
+        self.assertEqual(stdout, stream.getvalue())
+
+    def test_startup_does_not_import_yaml(self):
+        import sys
+        import subprocess
+        code = (
+            'import sys, runpy\n'
+            'sys.argv = ["cool_config", "--help"]\n'
+            'try:\n'
+            '    runpy.run_module("cool_config", run_name="__main__")\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            'print(sorted(name for name in ("yaml", "cool_config.config") if name in sys.modules))\n'
+        )
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.splitlines()[-1], '[]')
+
+    def test_dump_config_containing_itself(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'config.yaml')
+            with open(path, 'w') as f:
+                yaml.dump({'a': {'b': '<ref>/a'}}, f)
+            with self.assertRaisesRegex(RuntimeError, 'contains itself'):
+                self.run_cli(['dump', path])
+            code, stdout = self.run_cli(['dump', path, '--raw'])
+            self.assertEqual(yaml.safe_load(stdout), {'a': {'b': '<ref>/a'}})
+        finally:
+            shutil.rmtree(tmp_dir)
+
+class MultiDocumentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in ['sub1.yaml', 'sub2.yaml']:
+            shutil.copy(os.path.join('example', name), self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'experiments.yaml')
+        with open(self.path, 'w') as f:
+            f.write(
+                "name: first\n"
+                "model: {size: small}\n"
+                "sub: '<import>sub1.yaml'\n"
+                "---\n"
+                "name: broken\n"
+                "model: {size: large}\n"
+                "value: !!python/object:os.system echo\n"
+                "---\n"
+                "---\n"
+                "name: third\n"
+                "model: {size: large}\n"
+                "lr: '<ref>model/size'\n"
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_iter_configs(self):
+        with self.assertRaises(yaml.constructor.ConstructorError):
+            list(CoolConfig.iter_configs_from_path(self.path))
+
+        configs = CoolConfig.iter_configs_from_path(self.path, stop=1, lazy=True)
+        config = next(configs)
+        self.assertEqual(config['sub/sub2/some_ref_param'], 'sub1_param')
+        self.assertIsInstance(config, CoolConfig)
+        with self.assertRaises(StopIteration):
+            next(configs)
+
+    def test_skip(self):
+        # The second document can not be constructed, skipping it only composes it
+        configs = list(CoolConfig.iter_configs_from_path(self.path, start=2))
+        self.assertEqual([config['name'] for config in configs], ['third'])
+        self.assertEqual(configs[0]['lr'], 'large')
+
+    def test_where(self):
+        configs = CoolConfig.iter_configs_from_path(self.path, where={'model/size': 'small'})
+        self.assertEqual([config['name'] for config in configs], ['first'])
+        configs = CoolConfig.iter_configs_from_path(self.path, start=1, where={'/name': 'third', 'model/size': 'large'})
+        self.assertEqual([config['name'] for config in configs], ['third'])
+        configs = CoolConfig.iter_configs_from_path(self.path, where={'model/missing': 1, 'name': 'first'})
+        self.assertEqual(list(configs), [])
+
+    def test_not_a_mapping(self):
+        with open(self.path, 'w') as f:
+            f.write("a: 1\n---\n[1, 2]\n")
+        with self.assertRaises(ValueError):
+            list(CoolConfig.iter_configs_from_path(self.path))
+
+class CompilePathTest(unittest.TestCase):
+
+    def test_tokens(self):
+        self.assertEqual(
+            compile_path('../a/b[2]/c'),
+            (
+                (PARENT_TOKEN, None, None),
+                (KEY_TOKEN, 'a', None),
+                (KEY_TOKEN, 'b', 2),
+                (KEY_TOKEN, 'c', None),
+            )
+        )
+        self.assertEqual(
+            compile_path('/a[-1]'),
+            ((ROOT_TOKEN, None, None), (KEY_TOKEN, 'a', -1))
+        )
+        # The last segment is always a key
+        self.assertEqual(
+            compile_path('a/..'),
+            ((KEY_TOKEN, 'a', None), (KEY_TOKEN, '..', None))
+        )
+
+    def test_cached(self):
+        self.assertIs(compile_path('x/y[1]'), compile_path('x/y[1]'))
+
+class YamlCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        clear_cache()
+
+    def tearDown(self):
+        set_cache_enabled(True)
+        clear_cache()
+
+    def test_imports_are_read_once(self):
+        CoolConfig.parse_config_from_path('example/config.yaml')
+        # config.yaml, sub1.yaml and sub2.yaml, the second import
+        # of sub2.yaml is only read once it is accessed
+        self.assertEqual(cache_info()['misses'], 3)
+        self.assertEqual(cache_info()['hits'], 0)
+
+        config = CoolConfig.parse_config_from_path('example/config.yaml')
+        self.assertEqual(cache_info()['misses'], 3)
+        self.assertEqual(cache_info()['hits'], 3)
+        self.assertEqual(config['sub1/sub2/some_ref_param'], 'sub1_param')
+        self.assertEqual(config['sub2/some_ref_param'], 'main_param')
+        self.assertEqual(cache_info()['hits'], 4)
+
+    def test_changed_file_is_reread(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'config.yaml')
+            with open(path, 'w') as f:
+                f.write('param: 1\n')
+            self.assertEqual(CoolConfig.parse_config_from_path(path)['param'], 1)
+            with open(path, 'w') as f:
+                f.write('param: 22\n')
+            self.assertEqual(CoolConfig.parse_config_from_path(path)['param'], 22)
+            self.assertEqual(cache_info()['misses'], 2)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_opt_out(self):
+        set_cache_enabled(False)
+        CoolConfig.parse_config_from_path('example/config.yaml')
+        self.assertEqual(cache_info()['misses'], 0)
+        self.assertEqual(cache_info()['size'], 0)
+
+    def test_args_do_not_modify_the_cache(self):
+        args = {'config': 'example/config.yaml', 'some_cli_arg': 'Hello World!'}
+        CoolConfig.parse_config_from_args(args)
+        config = CoolConfig.parse_config_from_path('example/config.yaml')
+        self.assertFalse(config.has_key('some_cli_arg'))
+
+class YamlBackendTest(unittest.TestCase):
+
+    def test_backend(self):
+        expected = 'libyaml' if yaml.__with_libyaml__ else 'python'
+        self.assertEqual(get_yaml_backend(), expected)
+
+    @unittest.skipUnless(yaml.__with_libyaml__, 'PyYAML was built without libyaml')
+    def test_backends_are_identical(self):
+        for name in ['config.yaml', 'sub1.yaml', 'sub2.yaml']:
+            with open(os.path.join('example', name), 'r') as f:
+                text = f.read()
+            loaded = yaml.load(text, Loader=yaml.SafeLoader)
+            self.assertEqual(loaded, yaml.load(text, Loader=yaml.CSafeLoader))
+            self.assertEqual(
+                yaml.dump(loaded, Dumper=yaml.Dumper),
+                yaml.dump(loaded, Dumper=yaml.CDumper)
+            )
+
+class CompactNodeTest(unittest.TestCase):
+
+    def test_slots(self):
+        config = CoolConfig.parse_config_from_path('example/config.yaml')
+        self.assertFalse(hasattr(config, '__dict__'))
+        self.assertEqual(config['sub1/sub2'].path, '/sub1/sub2')
+
+    def test_lists_are_not_shared(self):
+        config1 = CoolConfig.parse_config_from_path('example/config.yaml')
+        config2 = CoolConfig.parse_config_from_path('example/config.yaml')
+        self.assertIsNot(config1['sub1/some_param3'], config2['sub1/some_param3'])
+
+        config1['sub1/some_param3[0]'] = 100
+        config1['main_system/some_values'].append(99)
+        self.assertEqual(config1['sub1/some_param3'], [100,2,3,4])
+        self.assertEqual(config2['sub1/some_param3'], [1,2,3,4])
+        config = CoolConfig.parse_config_from_path('example/config.yaml')
+        self.assertEqual(config['sub1/some_param3'], [1,2,3,4])
+        self.assertEqual(config['main_system/some_values'], [0,1,2,3,4])
+
+    def test_repeated_imports_are_shared(self):
+        config = CoolConfig.parse_config_from_path('example/config.yaml')
+        # sub1.yaml imports sub2.yaml first
+        self.assertIsInstance(config.config['sub1'].config['sub2'], CoolConfig)
+        self.assertIsInstance(config.config['sub2'], LazyImport)
+        self.assertIn(os.path.realpath('example/sub2.yaml'), map(os.path.realpath, config.source_files()))
+
+        # Writes to one import do not reach the others
+        config['sub1/sub2/some_param'] = 'changed'
+        self.assertEqual(config['sub2/some_param'], 'sub2_param')
+        self.assertEqual(config['sub2'].source_path, config['sub1/sub2'].source_path)
+        self.assertEqual(config['sub2'].path, '/sub2')
+
 class ConfigFromArgs(unittest.TestCase, CoolConfigTest):
     def setUp(self):
         args = {
@@ -206,6 +1594,119 @@ class ConfigFromPath(unittest.TestCase, CoolConfigTest):
     def setUp(self):
         self.config = CoolConfig.parse_config_from_path('example/config.yaml')
 
+class ConfigFromPathLazy(unittest.TestCase, CoolConfigTest):
+    def setUp(self):
+        self.config = CoolConfig.parse_config_from_path('example/config.yaml', lazy=True)
+
+class ConfigFromPathParallel(unittest.TestCase, CoolConfigTest):
+    def setUp(self):
+        self.config = CoolConfig.parse_config_from_path('example/config.yaml', workers=4)
+
+class ConfigFromPathIndexed(unittest.TestCase, CoolConfigTest):
+    def setUp(self):
+        self.config = CoolConfig.parse_config_from_path('example/config.yaml', index=True)
+
+class ConfigFromPathLazyIndexed(unittest.TestCase, CoolConfigTest):
+    def setUp(self):
+        self.config = CoolConfig.parse_config_from_path('example/config.yaml', lazy=True, index=True)
+
+class PathIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = CoolConfig.parse_config_from_path('example/config.yaml', index=True)
+        self.index = self.config.path_index.entries
+
+    def test_canonical_paths(self):
+        self.assertEqual(self.index['/main_system/some_values[1]'][1:], ('some_values', 1))
+        location, key, list_index = self.index['/some_complex_list[2]/reference_to_hello']
+        self.assertEqual(location.config[key], '<ref>../some_complex_list[0]/hello')
+        self.assertIsNone(list_index)
+        self.assertEqual(self.config['some_complex_list[2]'].path, '/some_complex_list[2]')
+        self.assertNotIn('/sub1/some_complex_list[0]/hello', self.index)
+
+    def test_index_is_updated(self):
+        self.config['main_system/some_values[1]'] = {'new': [5, 6]}
+        self.assertEqual(self.index['/main_system/some_values[1]/new[1]'][1:], ('new', 1))
+        self.assertEqual(self.config['main_system/some_values[1]/new[1]'], 6)
+
+        self.config['main_system/some_values[1]'] = 7
+        self.assertNotIn('/main_system/some_values[1]/new', self.index)
+        self.assertEqual(self.config['some_ref_param_to_a_list'], 7)
+
+        self.config['main_system'] = {'other': 1}
+        self.assertNotIn('/main_system/some_values', self.index)
+        self.assertEqual(self.config['main_system/other'], 1)
+
+        self.config['main_system'].update({'updated': 2})
+        self.assertEqual(self.index['/main_system/updated'][1:], ('updated', None))
+        self.assertEqual(self.config['main_system/updated'], 2)
+
+    def test_relative_paths(self):
+        sub2 = self.config['sub1/sub2']
+        self.assertEqual(sub2['../../main_system/some_values[-1]'], 4)
+        self.assertEqual(sub2['../some_param'], 'sub1_param')
+        with self.assertRaises(RuntimeError):
+            self.config['../some_param']
+
+    def test_lists_changed_in_place(self):
+        self.config['main_system/some_values'][1] = 9
+        self.assertEqual(self.config['main_system/some_values[1]'], 9)
+        self.config['main_system/some_values'].append(5)
+        self.assertEqual(self.config['main_system/some_values[5]'], 5)
+        del self.config['main_system/some_values'][4:]
+        self.assertEqual(self.config['main_system/some_values', None], [0, 9, 2, 3])
+        self.assertIsNone(self.config['main_system/some_values[4]', None])
+
+    def test_hooks_are_called(self):
+        logs = []
+        for config in [self.config, CoolConfig.parse_config_from_path('example/config.yaml')]:
+            log = []
+            config.register_custom_get_item_hook(lambda key, item: log.append(key))
+            config['some_param']
+            config['main_system/sub1_param']
+            logs.append(log)
+        self.assertEqual(logs[0], logs[1])
+        self.assertEqual(logs[0][:2], ['some_param', 'main_system'])
+
+        # Hooks registered before the index is built
+        config = CoolConfig.parse_config_from_path('example/config.yaml')
+        config['sub1'].register_custom_get_item_hook(lambda key, item: log.append(key))
+        config.build_index()
+        config['sub1/some_param']
+        self.assertEqual(log[-1], 'some_param')
+
+    def test_replaced_config(self):
+        sub1 = self.config['sub1']
+        self.config['sub1'] = {'some_param': 'x'}
+        self.assertEqual(sub1['some_param'], 'sub1_param')
+        self.assertEqual(self.config['sub1/some_param'], 'x')
+
+class LazyImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = CoolConfig.parse_config_from_path('example/config.yaml', lazy=True)
+
+    def test_imports_are_loaded_on_access(self):
+        self.assertIsInstance(self.config.config['sub1'], LazyImport)
+        self.assertIsInstance(self.config.config['sub2'], LazyImport)
+
+        self.assertEqual(self.config['sub2/some_param'], 'sub2_param')
+        self.assertIsInstance(self.config.config['sub1'], LazyImport)
+        self.assertIsInstance(self.config.config['sub2'], CoolConfig)
+
+        # Nested imports are lazy as well
+        sub1 = self.config['sub1']
+        self.assertIsInstance(sub1.config['sub2'], LazyImport)
+
+    def test_ref_into_unloaded_import(self):
+        self.assertEqual(self.config['reference_to_sub1'], 'sub1_param')
+        self.assertEqual(self.config['main_system/sub1_param'], 3)
+
+    def test_same_as_eager(self):
+        eager = CoolConfig.parse_config_from_path('example/config.yaml')
+        self.assertEqual(self.config.asdict(), eager.asdict())
+        self.assertEqual(self.config.get_print_string(), eager.get_print_string())
+
 class ConfigFromDict(unittest.TestCase, CoolConfigTest):
     def setUp(self):
         with open('example/config.yaml', 'r') as f:    